@@ -0,0 +1,170 @@
+import atexit
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+from cohort_matrix import CohortMatrix
+from config import Config
+from logger import logger
+
+# Worker-side copy of the loaded dataframes, installed once per worker process
+_frames = {}
+
+def _load_snapshot(path):
+    global _frames
+    with open(path, 'rb') as f:
+        _frames = pickle.load(f)
+
+def _run_task(name, args):
+    return ANALYTICS_TASKS[name](_frames, *args)
+
+def top_members_by_spending(frames, limit=10):
+    """email, total_spent and order_count of the biggest spenders"""
+    orders_df = frames.get('orders')
+    if orders_df is None:
+        return None
+    
+    email_col = next((c for c in reversed(orders_df.columns) if 'email' in c.lower()), None)
+    amount_col = next((c for c in reversed(orders_df.columns) if 'amount' in c.lower() and 'paid' in c.lower()), None)
+    if email_col is None or amount_col is None:
+        return None
+    
+    amounts = pd.to_numeric(orders_df[amount_col], errors='coerce')
+    top_members = amounts.groupby(orders_df[email_col]).agg(['sum', 'count']).reset_index()
+    top_members.columns = ['email', 'total_spent', 'order_count']
+    return top_members.sort_values('total_spent', ascending=False).head(limit).reset_index(drop=True)
+
+def monthly_growth(frames, months=6):
+    """{'members': new members per month, 'revenue': order revenue per month}, last `months` of each"""
+    growth = {'members': None, 'revenue': None}
+    
+    data_df = frames.get('data')
+    created_col = next((c for c in data_df.columns if 'created' in c.lower() and 'at' in c.lower()), None) if data_df is not None else None
+    if created_col:
+        created = pd.to_datetime(data_df[created_col], errors='coerce')
+        growth['members'] = created.groupby(created.dt.to_period('M')).size().tail(months)
+    
+    orders_df = frames.get('orders')
+    if orders_df is not None:
+        date_col = next((c for c in orders_df.columns if 'date' in c.lower() and 'created' in c.lower()), None)
+        amount_col = next((c for c in orders_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
+        if date_col and amount_col:
+            dates = pd.to_datetime(orders_df[date_col], errors='coerce')
+            amounts = pd.to_numeric(orders_df[amount_col], errors='coerce')
+            growth['revenue'] = amounts.groupby(dates.dt.to_period('M')).sum().tail(months)
+    
+    return growth
+
+ANALYTICS_TASKS = {
+    'top_members_by_spending': top_members_by_spending,
+    'monthly_growth': monthly_growth,
+    'cohort_matrix': CohortMatrix.build,
+}
+
+class AnalyticsTimeout(Exception):
+    """A heavy report did not finish within its time budget; str() is a user-facing message"""
+
+class AnalyticsPool:
+    """Process pool for heavy pandas reports, off the threads that serve chat turns.
+
+    The loaded dataframes are pickled once to a snapshot file that each worker
+    reads when it starts, so a task ships only its name and arguments and
+    returns a small result.
+    The pool is replaced when the data version changes. Tasks run on the
+    calling thread instead when Config.ANALYTICS_POOL is off or the workers
+    could not be started. A task that times out keeps its worker busy until it finishes.
+    """
+    
+    def __init__(self, workers=None, timeout=None):
+        self.workers = workers or Config.ANALYTICS_WORKERS
+        self.timeout = timeout or Config.ANALYTICS_TIMEOUT
+        self.executor = None
+        self.version = None
+        self.snapshot = None
+        self.broken = False
+        self.lock = threading.Lock()
+        self.stats = {'submitted': 0, 'inline': 0, 'timeouts': 0, 'restarts': 0}
+    
+    def get_executor(self, data_loader):
+        with self.lock:
+            if self.executor is None or self.version != data_loader.data_version:
+                if self.executor is not None:
+                    self.close()
+                    self.stats['restarts'] += 1
+                self.snapshot = self.write_snapshot(data_loader)
+                # spawn, not fork: the parent has event-loop and prefetch threads running
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_load_snapshot,
+                    initargs=(self.snapshot,)
+                )
+                self.version = data_loader.data_version
+            self.stats['submitted'] += 1
+            return self.executor
+    
+    @staticmethod
+    def write_snapshot(data_loader):
+        fd, path = tempfile.mkstemp(prefix='analytics-', suffix='.pkl')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(dict(data_loader.get_all_dataframes()), f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+    
+    def run_inline(self, data_loader, task, *args):
+        with self.lock:
+            self.stats['inline'] += 1
+        return ANALYTICS_TASKS[task](data_loader.get_all_dataframes(), *args)
+    
+    def run(self, data_loader, task, *args, timeout=None):
+        """ANALYTICS_TASKS[task](frames, *args) on a worker; raises AnalyticsTimeout past the budget"""
+        if not Config.ANALYTICS_POOL or self.broken:
+            return self.run_inline(data_loader, task, *args)
+        
+        try:
+            future = self.get_executor(data_loader).submit(_run_task, task, args)
+            return future.result(timeout or self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self.lock:
+                self.stats['timeouts'] += 1
+            logger.warning(f"Analytics task {task} timed out after {timeout or self.timeout}s")
+            raise AnalyticsTimeout(f"The {task.replace('_', ' ')} report is taking longer than expected. Please try again in a moment.")
+        except BrokenProcessPool as e:
+            # Usually workers that cannot start (e.g. a main module without a __main__ guard);
+            # respawning would fail the same way, so stay inline from now on
+            logger.warning(f"Analytics pool failed ({e}); running analytics inline from now on")
+            self.shutdown()
+            self.broken = True
+            return self.run_inline(data_loader, task, *args)
+    
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.snapshot is not None:
+            # Workers read the snapshot once at start-up, so it can go with the pool
+            try:
+                os.remove(self.snapshot)
+            except OSError:
+                pass
+            self.snapshot = None
+    
+    def shutdown(self):
+        with self.lock:
+            self.close()
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+def get_analytics_pool():
+    """Return the process-wide analytics pool"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = AnalyticsPool()
+            atexit.register(_shared_pool.shutdown)
+        return _shared_pool
\ No newline at end of file
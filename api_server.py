@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from async_runner import get_loop, run_sync
+from config import Config
+from data_loader import DataLoader
+from member_bot import MemberBot
+from sales_bot import SalesBot
+from insights_bot import InsightsBot
+from llm_metrics import get_llm_metrics
+from logger import logger
+
+# Run with:  python api_server.py --port 8080
+# then:      curl -s localhost:8080/sales -d '{"query": "orders in queue"}'
+# and send the "session" from the reply back with follow-ups
+
+BOT_CLASSES = {'member': MemberBot, 'sales': SalesBot, 'insights': InsightsBot}
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class Session:
+    """One API conversation: a bot per endpoint, each behind a lock so a session's turns run in order"""
+    
+    def __init__(self, session_id):
+        self.id = session_id
+        self.bots = {}
+        self.locks = {name: asyncio.Lock() for name in BOT_CLASSES}
+        self.last_used = time.monotonic()
+    
+    def busy(self):
+        return any(lock.locked() for lock in self.locks.values())
+
+class SessionStore:
+    """Sessions by ID, least recently used first, expired after Config.API_SESSION_TTL idle seconds"""
+    
+    def __init__(self, data_loader, max_sessions=None, ttl=None):
+        self.data_loader = data_loader
+        self.max_sessions = max_sessions or Config.API_MAX_SESSIONS
+        self.ttl = ttl or Config.API_SESSION_TTL
+        self.sessions = OrderedDict()
+        self.evicted = 0
+    
+    def __len__(self):
+        return len(self.sessions)
+    
+    def get(self, session_id=None):
+        """The session with this ID, or a new one.
+        
+        IDs are only ever issued here, as random UUIDs, so an unknown or
+        expired ID starts a new session under a fresh ID rather than one the
+        client picked; a guessable ID never names someone else's conversation.
+        """
+        now = time.monotonic()
+        session = self.sessions.get(session_id) if session_id else None
+        if session is None:
+            session_id = uuid.uuid4().hex
+            session = self.sessions[session_id] = Session(session_id)
+            self.evict(now, keep=session)
+        else:
+            self.sessions.move_to_end(session_id)
+        session.last_used = now
+        return session
+    
+    def evict(self, now, keep=None):
+        """Drop expired sessions and the least recently used beyond max_sessions.
+        
+        A session with a turn in flight is skipped, so its follow-ups still find it.
+        """
+        for session in list(self.sessions.values()):
+            if len(self.sessions) <= self.max_sessions and now - session.last_used < self.ttl:
+                break
+            if session is keep or session.busy():
+                continue
+            del self.sessions[session.id]
+            self.evicted += 1
+    
+    def bot(self, session, name):
+        bot = session.bots.get(name)
+        if bot is None:
+            bot = session.bots[name] = BOT_CLASSES[name](self.data_loader)
+        return bot
+
+class ApiServer:
+    """Headless HTTP/JSON front end for the three bots on one asyncio loop.
+
+    POST /member, /sales or /insights with {"query": ..., "session": ...}
+    (or an X-Session-Id header) to talk to that bot; the reply carries the
+    session ID to send back for follow-ups. GET /stats returns data, session
+    and LLM statistics. Every request shares the one loaded DataLoader, bots'
+    pandas work runs on a dedicated worker pool, and connections are
+    HTTP/1.1 keep-alive.
+    """
+    
+    def __init__(self, data_loader, host='127.0.0.1', port=8080, workers=None):
+        self.data_loader = data_loader
+        self.host = host
+        self.port = port
+        self.workers = workers or Config.API_WORKERS
+        self.sessions = SessionStore(data_loader)
+        self.server = None
+        self.stats = {'requests': 0, 'errors': 0, 'active': 0}
+    
+    async def start(self):
+        # asyncio.to_thread in the bots uses the loop's default executor
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="api-worker")
+        )
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=Config.API_MAX_BODY, backlog=Config.API_BACKLOG
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"API server listening on http://{self.host}:{self.port} with {self.workers} worker(s)")
+        return self
+    
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+    
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), Config.API_KEEPALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                if request is None:
+                    return
+                
+                method, path, headers, body = request
+                status, payload = await self.dispatch(method, path, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except ApiError as e:
+            await self.write_response(writer, e.status, {'error': str(e)}, False)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+    
+    async def read_line(self, reader, status, message):
+        try:
+            return await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            # Longer than the stream limit (Config.API_MAX_BODY)
+            raise ApiError(status, message)
+    
+    async def read_request(self, reader):
+        """(method, path, headers, body), or None when the client closed the connection"""
+        line = await self.read_line(reader, HTTPStatus.BAD_REQUEST, "Request line too long")
+        if not line:
+            return None
+        
+        try:
+            method, target, _ = line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+        
+        headers = {}
+        while True:
+            line = await self.read_line(reader, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request header too large")
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > Config.API_MAX_BODY:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Request body is limited to {Config.API_MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target.split('?', 1)[0].rstrip('/') or '/', headers, body
+    
+    async def write_response(self, writer, status, payload, keep_alive):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        status = HTTPStatus(status)
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + data)
+        await writer.drain()
+    
+    async def dispatch(self, method, path, headers, body):
+        self.stats['requests'] += 1
+        self.stats['active'] += 1
+        try:
+            name = path.lstrip('/')
+            if name == 'stats':
+                if method != 'GET':
+                    raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET /stats")
+                return HTTPStatus.OK, await self.get_stats()
+            
+            if name not in BOT_CLASSES:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"No route for {path}; use /member, /sales, /insights or /stats")
+            if method != 'POST':
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f"Use POST {path}")
+            
+            try:
+                request = json.loads(body or b'{}')
+            except ValueError:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Body must be JSON")
+            if not isinstance(request, dict) or not str(request.get('query') or '').strip():
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object with a 'query'")
+            
+            session_id = request.get('session') or headers.get('x-session-id')
+            return HTTPStatus.OK, await self.ask(name, str(request['query']).strip(), str(session_id) if session_id else None)
+        except ApiError as e:
+            self.stats['errors'] += 1
+            return e.status, {'error': str(e)}
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error_with_trace(e, f"API request {method} {path}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"I encountered an error processing your request: {e}"}
+        finally:
+            self.stats['active'] -= 1
+    
+    async def ask(self, name, query, session_id):
+        session = self.sessions.get(session_id)
+        started = time.perf_counter()
+        
+        # Turns of one conversation run in order; different sessions run concurrently
+        async with session.locks[name]:
+            bot = self.sessions.bot(session, name)
+            data_version = self.data_loader.data_version
+            reply = await bot.process_query_async(query)
+        
+        return {
+            'session': session.id,
+            'bot': name,
+            'reply': reply,
+            'data_version': data_version,
+            'latency': round(time.perf_counter() - started, 4),
+        }
+    
+    async def get_stats(self):
+        data = await asyncio.to_thread(self.data_loader.get_summary_stats)
+        return {
+            'data': data,
+            'data_version': self.data_loader.data_version,
+            'offline_mode': Config.OFFLINE_MODE,
+            'sessions': len(self.sessions),
+            'sessions_evicted': self.sessions.evicted,
+            'requests': self.stats['requests'],
+            'errors': self.stats['errors'],
+            'active_requests': self.stats['active'],
+            'llm': get_llm_metrics().get_summary()[0],
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for the gym chatbots")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=Config.API_PORT)
+    parser.add_argument('--workers', type=int, default=Config.API_WORKERS, help="threads for the bots' pandas work")
+    args = parser.parse_args()
+    
+    Config.validate()
+    if Config.OFFLINE_MODE:
+        print(f"Offline mode: {Config.OFFLINE_REASON}")
+    
+    data_loader = DataLoader()
+    if not data_loader.load_all_data():
+        print(f"No data files found in {Config.get_data_folder()}")
+        return
+    
+    server = ApiServer(data_loader, args.host, args.port, args.workers)
+    run_sync(server.start())
+    print(f"Gym chatbot API listening on http://{args.host}:{server.port}")
+    print("Endpoints: POST /member, /sales, /insights  {\"query\": ..., \"session\": ...}; GET /stats")
+    try:
+        run_sync(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        get_loop().call_soon_threadsafe(server.server.close)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """Return the shared background event loop, starting it on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="GymChatbotLoop", daemon=True)
+            thread.start()
+    return _loop
+
+
+def in_loop_thread():
+    """True when called from a coroutine running on the shared loop"""
+    try:
+        return asyncio.get_running_loop() is _loop
+    except RuntimeError:
+        return False
+
+
+def submit(coro):
+    """Schedule a coroutine on the shared loop and return a concurrent Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run_sync(coro, timeout=None):
+    """Run a coroutine on the shared loop and block until it finishes"""
+    if in_loop_thread():
+        coro.close()
+        raise RuntimeError("run_sync() cannot be called from the shared event loop; await the coroutine instead")
+    
+    future = submit(coro)
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+
+async def run_on_loop(coro):
+    """Await a coroutine on the shared loop from any other event loop"""
+    if in_loop_thread():
+        return await coro
+    return await asyncio.wrap_future(submit(coro))
\ No newline at end of file
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+from config import Config
+from async_runner import run_sync
+from member_bot import MemberBot
+from sales_bot import SalesBot
+from insights_bot import InsightsBot
+from llm_metrics import LLMMetrics
+from logger import logger
+
+BOT_CLASSES = {'member': MemberBot, 'sales': SalesBot, 'insights': InsightsBot}
+
+def read_records(path):
+    """(line number, record, error) for every non-blank line of a JSONL file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, None, f"Invalid JSON: {e}"
+                continue
+            
+            if not isinstance(record, dict):
+                yield number, None, "Each line must be a JSON object"
+            elif record.get('bot') not in BOT_CLASSES:
+                yield number, record, f"'bot' must be one of {', '.join(BOT_CLASSES)}"
+            elif not str(record.get('query') or '').strip():
+                yield number, record, "'query' is required"
+            else:
+                yield number, record, None
+
+class BatchRunner:
+    """Answers a file of JSONL questions concurrently over one loaded DataLoader.
+
+    Records look like {"bot": "sales", "query": "...", "id": ..., "member": ...};
+    "member" picks the member a member-bot question is about. Bots keep
+    per-conversation state, so each worker owns its own bot instances and
+    resets them before every record. The LLM client pool, response cache and
+    request scheduler are already process-wide, so workers share them.
+
+    Results are written as JSON lines in completion order, each with its own
+    latency, and run() returns a throughput summary.
+    """
+    
+    def __init__(self, data_loader, workers=None, output=None):
+        self.data_loader = data_loader
+        self.workers = max(1, workers or Config.BATCH_WORKERS)
+        self.output = output
+        self.latencies = []
+        self.errors = 0
+    
+    def run(self, path):
+        return run_sync(self.run_async(read_records(path)))
+    
+    async def run_async(self, records):
+        queue = asyncio.Queue()
+        for item in records:
+            queue.put_nowait(item)
+        
+        self.latencies = []
+        self.errors = 0
+        started = time.perf_counter()
+        await asyncio.gather(*(self.worker(queue) for _ in range(min(self.workers, max(1, queue.qsize())))))
+        return self.summary(time.perf_counter() - started)
+    
+    async def worker(self, queue):
+        bots = {}
+        while True:
+            try:
+                number, record, error = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            self.emit(await self.answer(bots, number, record, error))
+    
+    def get_bot(self, bots, name):
+        bot = bots.get(name)
+        if bot is None:
+            bot = bots[name] = BOT_CLASSES[name](self.data_loader)
+        
+        # Every record starts a fresh conversation
+        bot.conversation_history.clear()
+        if hasattr(bot, 'cursor'):
+            bot.cursor = None
+        if hasattr(bot, 'current_member'):
+            bot.current_member = None
+        return bot
+    
+    async def select_member(self, bot, identifier):
+        results = await asyncio.to_thread(self.data_loader.search_member, identifier)
+        if results is None or len(results) == 0 or results.attrs.get('fuzzy'):
+            raise LookupError(f"No member matches '{identifier}'")
+        bot.current_member = results.iloc[0]
+    
+    async def answer(self, bots, number, record, error):
+        record = record or {}
+        result = {'line': number, 'id': record.get('id'), 'bot': record.get('bot'), 'query': record.get('query')}
+        started = time.perf_counter()
+        
+        try:
+            if error:
+                raise ValueError(error)
+            
+            bot = self.get_bot(bots, record['bot'])
+            if record.get('member'):
+                if not hasattr(bot, 'current_member'):
+                    raise ValueError("'member' only applies to the member bot")
+                await self.select_member(bot, str(record['member']))
+            
+            result['reply'] = await bot.process_query_async(str(record['query']).strip())
+            result['ok'] = True
+        except Exception as e:
+            logger.warning(f"Batch record on line {number} failed: {e}")
+            result['ok'] = False
+            result['error'] = str(e)
+        
+        result['latency'] = round(time.perf_counter() - started, 4)
+        return result
+    
+    def emit(self, result):
+        if result['ok']:
+            self.latencies.append(result['latency'])
+        else:
+            self.errors += 1
+        
+        if self.output is not None:
+            self.output.write(json.dumps(result, ensure_ascii=False, default=str) + '\n')
+            self.output.flush()
+    
+    def summary(self, wall_time):
+        records = len(self.latencies) + self.errors
+        latency = LLMMetrics.percentiles(self.latencies)
+        return {
+            'records': records,
+            'ok': len(self.latencies),
+            'errors': self.errors,
+            'workers': self.workers,
+            'wall_time': wall_time,
+            'throughput': records / wall_time if wall_time > 0 else 0.0,
+            'latency_p50': latency['p50'],
+            'latency_p95': latency['p95'],
+            'latency_p99': latency['p99'],
+        }
\ No newline at end of file
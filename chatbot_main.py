@@ -1,3 +1,5 @@
+import argparse
+import multiprocessing
 import sys
 import os
 from config import Config
@@ -5,7 +7,9 @@ from data_loader import DataLoader
 from member_bot import MemberBot
 from sales_bot import SalesBot
 from insights_bot import InsightsBot
-from gym_chatbot_system.logging_utils import logger
+from batch_runner import BatchRunner
+from llm_metrics import get_llm_metrics, get_model_latency
+from logger import logger
 
 class GymChatbotSystem:
     def __init__(self):
@@ -34,6 +38,11 @@ class GymChatbotSystem:
             Config.validate()
             logger.info("Configuration validated successfully")
             
+            if Config.OFFLINE_MODE:
+                print(f"⚠ Offline mode: {Config.OFFLINE_REASON}")
+                print("  Answers come from local data only; no AI calls will be made.\n")
+                logger.warning(f"Offline mode enabled: {Config.OFFLINE_REASON}")
+            
             # Show data folder location
             print(f"Data Folder: {Config.get_data_folder()}")
             print()
@@ -87,6 +96,7 @@ class GymChatbotSystem:
         print("   Analytics, trends, and reports")
         print("\n4  Show System Stats")
         print("\n5  View Debug Log (Admin)")
+        print(f"\n6  Toggle Offline Mode (currently {'ON' if Config.OFFLINE_MODE else 'OFF'})")
         print("\n0  Exit System")
         print("\n" + "=" * 60)
     
@@ -115,8 +125,38 @@ class GymChatbotSystem:
         print(f"Data Folder:        {Config.get_data_folder()}")
         print(f"Datasets Loaded:    {len(self.data_loader.get_all_dataframes())}")
         
+        metrics = get_llm_metrics()
+        print("\n" + "=" * 60)
+        print(f"LLM PERFORMANCE (last {metrics.records.maxlen} calls)")
+        print("=" * 60)
+        print(metrics.format_summary())
+        
+        model_rows = get_model_latency().get_summary()
+        if model_rows:
+            print("\nPer-model upstream latency (drives hedging):")
+            for row in model_rows:
+                print(f"  {row['model']} [{row['phase']}]: p50 {row['p50']:.2f}s, p95 {row['p95']:.2f}s ({row['samples']} calls)")
+        
         print("\n" + "=" * 60)
-        input("\nPress Enter to continue...")
+        choice = input("\nType 'e' to export LLM metrics, or press Enter to continue: ").strip().lower()
+        
+        if choice == 'e':
+            try:
+                path = metrics.export()
+                print(f"LLM metrics exported to {path}")
+            except Exception as e:
+                logger.error_with_trace(e, "LLM metrics export")
+                print(f"Could not export LLM metrics: {e}")
+            input("Press Enter to continue...")
+    
+    def toggle_offline_mode(self):
+        if Config.OFFLINE_MODE and not Config.OPENROUTER_API_KEY and Config.OPENROUTER_API_URL.startswith('https://openrouter.ai'):
+            print("\n✗ Cannot go online: OpenRouter API Key not configured.")
+        else:
+            Config.set_offline_mode(not Config.OFFLINE_MODE)
+            print(f"\n✓ Offline mode {'enabled' if Config.OFFLINE_MODE else 'disabled'}.")
+            logger.info(f"Offline mode {'enabled' if Config.OFFLINE_MODE else 'disabled'} by user")
+        input("Press Enter to continue...")
     
     def view_debug_log(self):
         self.clear_screen()
@@ -172,7 +212,7 @@ class GymChatbotSystem:
             try:
                 self.show_menu()
                 
-                choice = input("\nEnter your choice (0-5): ").strip()
+                choice = input("\nEnter your choice (0-6): ").strip()
                 
                 if choice == '1':
                     logger.info("User selected: Member Support Bot")
@@ -194,6 +234,9 @@ class GymChatbotSystem:
                     logger.info("Admin viewing debug log")
                     self.view_debug_log()
                 
+                elif choice == '6':
+                    self.toggle_offline_mode()
+                
                 elif choice == '0':
                     self.clear_screen()
                     print("\n" + "=" * 60)
@@ -204,7 +247,7 @@ class GymChatbotSystem:
                     sys.exit(0)
                 
                 else:
-                    print("\n✗ Invalid choice. Please select 0-5.")
+                    print("\n✗ Invalid choice. Please select 0-6.")
                     input("Press Enter to continue...")
             
             except KeyboardInterrupt:
@@ -219,7 +262,49 @@ class GymChatbotSystem:
                 print(f"  {logger.get_log_path()}")
                 input("\nPress Enter to continue...")
 
+def run_batch(args):
+    """Answer every record of a JSONL file without the menu; results go to stdout or --output"""
+    Config.validate()
+    if Config.OFFLINE_MODE:
+        print(f"Offline mode: {Config.OFFLINE_REASON}", file=sys.stderr)
+    
+    data_loader = DataLoader()
+    if not data_loader.load_all_data():
+        print(f"No data files found in {Config.get_data_folder()}", file=sys.stderr)
+        return 1
+    
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        summary = BatchRunner(data_loader, args.workers, output).run(args.batch)
+    finally:
+        if args.output:
+            output.close()
+    
+    def ms(value):
+        return f"{value * 1000:,.0f} ms" if value is not None else "-"
+    
+    print(
+        f"{summary['records']} record(s), {summary['errors']} error(s) with {summary['workers']} worker(s) "
+        f"in {summary['wall_time']:.2f}s ({summary['throughput']:.1f}/s); "
+        f"latency p50 {ms(summary['latency_p50'])}, p95 {ms(summary['latency_p95'])}",
+        file=sys.stderr
+    )
+    logger.info(f"Batch run finished: {summary}")
+    return 0
+
 def main():
+    # Analytics pool workers are spawned; a frozen executable must hand them off here
+    multiprocessing.freeze_support()
+    
+    parser = argparse.ArgumentParser(description="Gym chatbot management system")
+    parser.add_argument('--batch', metavar='JSONL', help="answer the questions in a JSONL file instead of opening the menu")
+    parser.add_argument('--workers', type=int, default=Config.BATCH_WORKERS, help="records answered concurrently in batch mode")
+    parser.add_argument('--output', metavar='PATH', help="write batch results here instead of stdout")
+    args = parser.parse_args()
+    
+    if args.batch:
+        sys.exit(run_batch(args))
+    
     try:
         system = GymChatbotSystem()
         system.run()
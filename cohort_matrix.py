@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+from logger import logger
+
+def month_ordinals(values):
+    """(months since 1970-01, valid mask) for a column of dates"""
+    dates = pd.to_datetime(values, errors='coerce').to_numpy(dtype='datetime64[us]')
+    return dates.astype('datetime64[M]').astype(np.int64), ~np.isnat(dates)
+
+def canonical_ids(columns):
+    """(one array per column, ID count): a shared integer per canonical email, -1 where missing or blank.
+
+    Each column is factorized first so only its distinct addresses are
+    normalized, then the normalized addresses are factorized together.
+    """
+    factorized = [pd.factorize(col) for col in columns]
+    canonical = np.concatenate([pd.Index(uniques, dtype=object).str.strip().str.lower().to_numpy() for _, uniques in factorized])
+    ids, distinct = pd.factorize(canonical)
+    ids[canonical == ''] = -1
+    
+    result, start = [], 0
+    for codes, uniques in factorized:
+        # The trailing -1 keeps missing values (code -1) at -1
+        result.append(np.append(ids[start:start + len(uniques)], -1)[codes])
+        start += len(uniques)
+    return result, len(distinct)
+
+def email_owners(member_ids, count, members):
+    """Member row for each email ID, the first member listing it, or -1; index -1 also reads -1"""
+    owner = np.full(count + 1, members)
+    rows = np.arange(members)
+    for ids in member_ids:
+        known = ids >= 0
+        np.minimum.at(owner, ids[known], rows[known])
+    owner[owner == members] = -1
+    return owner
+
+class CohortMatrix:
+    """Monthly signup cohorts and how many of each came back N months later.
+
+    Members are grouped by the month of their created date. counts[kind] is a
+    (cohorts x months) array whose cell [c, n] is the number of cohort c's
+    members with at least one order or payment ('activity'), or a paid order
+    or successful payment ('purchase'), n months after the signup month.
+    Cells past the last month in the data have not been observed yet and
+    read as NaN in rates().
+    """
+    
+    KINDS = ('activity', 'purchase')
+    
+    def __init__(self, first_cohort, sizes, counts, last_month):
+        self.first_cohort = int(first_cohort)
+        self.sizes = sizes
+        self.counts = counts
+        self.last_month = int(last_month)
+        self.months = next(iter(counts.values())).shape[1]
+        
+        cohorts = self.first_cohort + np.arange(len(sizes))
+        self.observed = cohorts[:, None] + np.arange(self.months)[None, :] <= self.last_month
+    
+    @classmethod
+    def build(cls, frames, months=36):
+        """Bin every order and payment by member and months since signup; None without dated members"""
+        data_df = frames.get('data')
+        created_col = next((c for c in data_df.columns if 'created' in c.lower() and 'at' in c.lower()), None) if data_df is not None else None
+        if created_col is None:
+            return None
+        
+        signup, dated = month_ordinals(data_df[created_col])
+        if not dated.any():
+            return None
+        
+        first_cohort = signup[dated].min()
+        cohort = np.where(dated, signup - first_cohort, -1)
+        sizes = np.bincount(cohort[dated])
+        
+        orders_df = frames.get('orders')
+        order_email_col = next((c for c in orders_df.columns if 'email' in c.lower()), None) if orders_df is not None else None
+        payments_df = frames.get('payments')
+        payment_email_col = next((c for c in payments_df.columns if 'email' in c.lower()), None) if payments_df is not None else None
+        
+        member_cols = [c for c in data_df.columns if 'email' in c.lower()]
+        columns = [data_df[c] for c in member_cols]
+        columns += [orders_df[order_email_col] if order_email_col else pd.Series([], dtype=object)]
+        columns += [payments_df[payment_email_col] if payment_email_col else pd.Series([], dtype=object)]
+        (*member_ids, order_ids, payment_ids), count = canonical_ids(columns)
+        owner = email_owners(member_ids, count, len(data_df))
+        
+        events = []
+        order_member = None
+        if order_email_col:
+            order_member = owner[order_ids]
+            date_col = next((c for c in orders_df.columns if 'date' in c.lower() and 'created' in c.lower()), None)
+            status_col = next((c for c in orders_df.columns if 'status' in c.lower() and 'payment' in c.lower()), None)
+            if date_col:
+                paid = orders_df[status_col].astype(str).to_numpy() == 'Paid' if status_col else np.zeros(len(orders_df), dtype=bool)
+                events.append((order_member, *month_ordinals(orders_df[date_col]), paid))
+        
+        date_col = next((c for c in payments_df.columns if 'date' in c.lower()), None) if payments_df is not None else None
+        if date_col:
+            status_col = next((c for c in payments_df.columns if 'status' in c.lower()), None)
+            member = owner[payment_ids] if payment_email_col else np.full(len(payments_df), -1)
+            
+            # Most payments carry no email of their own, only the order they paid for
+            order_id_col = next((c for c in payments_df.columns if 'order' in c.lower() and 'id' in c.lower()), None)
+            orders_id_col = next((c for c in orders_df.columns if 'order' in c.lower() and 'id' in c.lower()), None) if order_member is not None else None
+            unmatched = np.flatnonzero(member < 0)
+            if order_id_col and orders_id_col and len(unmatched):
+                codes, uniques = pd.factorize(payments_df[order_id_col].to_numpy()[unmatched])
+                matched = pd.Index(uniques).get_indexer(orders_df[orders_id_col])
+                linked = np.full(len(uniques) + 1, -1)
+                linked[matched[matched >= 0]] = order_member[matched >= 0]
+                member[unmatched] = linked[codes]
+            
+            successful = payments_df[status_col].astype(str).to_numpy() == 'Successful' if status_col else np.ones(len(payments_df), dtype=bool)
+            events.append((member, *month_ordinals(payments_df[date_col]), successful))
+        
+        if not events:
+            return None
+        
+        member = np.concatenate([e[0] for e in events])
+        month = np.concatenate([e[1] for e in events])
+        valid = np.concatenate([e[2] for e in events])
+        purchase = np.concatenate([e[3] for e in events])
+        last_month = month[valid].max() if valid.any() else signup[dated].max()
+        
+        valid &= member >= 0
+        valid[valid] &= dated[member[valid]]
+        member, month, purchase = member[valid], month[valid], purchase[valid]
+        age = month - signup[member]
+        within = (age >= 0) & (age < months)
+        member, age, purchase = member[within], age[within], purchase[within]
+        
+        # A (members x months) bitmap counts each member once per month, however many orders and payments fall in it
+        size = len(sizes) * months
+        counts = {}
+        for kind, mask in (('activity', slice(None)), ('purchase', purchase)):
+            seen = np.zeros(len(data_df) * months, dtype=bool)
+            seen[member[mask].astype(np.int64) * months + age[mask]] = True
+            cells = np.flatnonzero(seen)
+            counts[kind] = np.bincount(cohort[cells // months] * months + cells % months, minlength=size).reshape(len(sizes), months)
+        
+        matrix = cls(first_cohort, sizes, counts, last_month)
+        logger.info(f"Built cohort matrix: {int(sizes.sum()):,} member(s) in {len(sizes)} cohort(s) x {months} month(s) from {len(member):,} event(s)")
+        return matrix
+    
+    def cohort(self, position):
+        return pd.Period(ordinal=self.first_cohort + position, freq='M')
+    
+    def rates(self, kind='activity'):
+        """Retained share per cohort and month since signup; NaN where unobserved or the cohort is empty"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rates = self.counts[kind] / self.sizes[:, None]
+        return np.where(self.observed & (self.sizes[:, None] > 0), rates, np.nan)
+    
+    def curve(self, kind='activity'):
+        """Retention by month since signup across every cohort that has reached that month, weighted by size"""
+        members = (self.sizes[:, None] * self.observed).sum(axis=0)
+        retained = np.where(self.observed, self.counts[kind], 0).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(members > 0, retained / members, np.nan)
+    
+    def to_frame(self, kind='activity', cohorts=None):
+        """Rates as a DataFrame indexed by signup month, newest `cohorts` non-empty cohorts only"""
+        positions = np.flatnonzero(self.sizes)
+        if cohorts:
+            positions = positions[-cohorts:]
+        frame = pd.DataFrame(
+            self.rates(kind)[positions],
+            index=pd.PeriodIndex([self.cohort(p) for p in positions], name='cohort'),
+            columns=[f"M{n}" for n in range(self.months)]
+        )
+        frame.insert(0, 'members', self.sizes[positions])
+        return frame
\ No newline at end of file
@@ -12,10 +12,96 @@ class Config:
     except:
         print("no api key in secrets")
     
+    if not OPENROUTER_API_KEY:
+        OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY')
+    
     # Model Configuration
     MODEL_NAME = 'meta-llama/llama-3.3-70b-instruct:free'
     TEMPERATURE = 0.7
     MAX_TOKENS = 2000
+    REQUEST_TIMEOUT = 30
+    
+    # Ordered fallbacks tried after the phase's own model; the first also receives hedged requests
+    FALLBACK_MODELS = [m.strip() for m in os.environ.get('GYM_BOT_FALLBACK_MODELS', 'mistralai/mistral-7b-instruct:free').split(',') if m.strip()]
+    
+    # Smaller, faster model for intent/routing calls (MODEL_NAME is its first fallback)
+    INTENT_MODEL = os.environ.get('GYM_BOT_INTENT_MODEL', 'meta-llama/llama-3.2-3b-instruct:free')
+    
+    # Hedge to the next model once a call outlives that model's observed p95
+    HEDGE_ENABLED = os.environ.get('GYM_BOT_HEDGE', '1') != '0'
+    HEDGE_MIN_SAMPLES = 20
+    HEDGE_DEFAULT_DELAY = 5.0
+    HEDGE_MIN_DELAY = 0.5
+    
+    # Point at a local stand-in (mock_openrouter.py) for offline benchmarks
+    OPENROUTER_API_URL = os.environ.get('GYM_BOT_OPENROUTER_URL', 'https://openrouter.ai/api/v1/chat/completions')
+    
+    # Upper bound on simultaneous OpenRouter calls across all chat sessions
+    MAX_CONCURRENT_REQUESTS = int(os.environ.get('GYM_BOT_MAX_CONCURRENT_REQUESTS', 8))
+    
+    # Client-side scheduling against the OpenRouter quota
+    OPENROUTER_REQUESTS_PER_MINUTE = int(os.environ.get('GYM_BOT_REQUESTS_PER_MINUTE', 20))
+    RATE_LIMIT_BURST = 5
+    RATE_LIMIT_MAX_WAIT = 15
+    RETRY_MAX_ATTEMPTS = 3
+    RETRY_BASE_DELAY = 0.5
+    RETRY_MAX_DELAY = 8
+    CIRCUIT_FAILURE_THRESHOLD = 5
+    CIRCUIT_RESET_TIMEOUT = 30
+    
+    # Intent classification wants a deterministic one-word label
+    INTENT_TEMPERATURE = 0.0
+    
+    # Local intent classifier answers on its own at or above this confidence
+    INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get('GYM_BOT_INTENT_THRESHOLD', 0.6))
+    
+    # Below the threshold, ask for intent, entities and answer in one JSON call
+    STRUCTURED_ROUTING = os.environ.get('GYM_BOT_STRUCTURED_ROUTING', '1') != '0'
+    
+    # Start likely data lookups on worker threads while the routing call is in flight
+    SPECULATIVE_PREFETCH = os.environ.get('GYM_BOT_PREFETCH', '1') != '0'
+    PREFETCH_WORKERS = 4
+    
+    # Build the data-only insights reports on a background thread as soon as the bot starts
+    INSIGHTS_PRECOMPUTE = os.environ.get('GYM_BOT_INSIGHTS_PRECOMPUTE', '1') != '0'
+    
+    # Typo-tolerant member search when no name or email contains the query
+    FUZZY_SEARCH_BUDGET = float(os.environ.get('GYM_BOT_FUZZY_BUDGET', 0.05))
+    FUZZY_SEARCH_LIMIT = 10
+    
+    # Per-bot conversation memory: recent exchanges verbatim, older ones as one-line summaries
+    CONVERSATION_MAX_TOKENS = int(os.environ.get('GYM_BOT_CONVERSATION_TOKENS', 1500))
+    CONVERSATION_MAX_BYTES = 16384
+    CONVERSATION_REPLY_CHARS = 1200
+    CONVERSATION_SUMMARY_LINES = 20
+    
+    # Streamlit keeps and re-renders at most this many messages per bot
+    CHAT_HISTORY_MESSAGES = int(os.environ.get('GYM_BOT_CHAT_HISTORY', 100))
+    
+    # Concurrent records in `chatbot_main.py --batch`
+    BATCH_WORKERS = int(os.environ.get('GYM_BOT_BATCH_WORKERS', 4))
+    
+    # Heavy pandas reports run on a process pool holding a snapshot of the data
+    ANALYTICS_POOL = os.environ.get('GYM_BOT_ANALYTICS_POOL', '1') != '0'
+    ANALYTICS_WORKERS = int(os.environ.get('GYM_BOT_ANALYTICS_WORKERS', 2))
+    ANALYTICS_TIMEOUT = float(os.environ.get('GYM_BOT_ANALYTICS_TIMEOUT', 30))
+    
+    # Signup-cohort retention: months tracked after signup, cohorts shown in the report
+    COHORT_MONTHS = int(os.environ.get('GYM_BOT_COHORT_MONTHS', 36))
+    COHORT_REPORT_COHORTS = 12
+    
+    # Headless HTTP/JSON API (api_server.py)
+    API_PORT = int(os.environ.get('GYM_BOT_API_PORT', 8080))
+    API_WORKERS = int(os.environ.get('GYM_BOT_API_WORKERS', 8))
+    API_MAX_SESSIONS = int(os.environ.get('GYM_BOT_API_MAX_SESSIONS', 1000))
+    API_SESSION_TTL = 1800
+    API_KEEPALIVE_TIMEOUT = 30
+    API_MAX_BODY = 65536
+    API_BACKLOG = 1024
+    
+    # Answer from local handlers and templates only, with no LLM calls at all
+    OFFLINE_MODE = os.environ.get('GYM_BOT_OFFLINE', '0') == '1'
+    OFFLINE_REASON = "enabled in configuration" if OFFLINE_MODE else None
     
     # Get the directory where the executable is located
     if getattr(sys, 'frozen', False):
@@ -31,10 +117,29 @@ class Config:
     LOG_FILE = str(APPLICATION_PATH / 'app_debug.log')
     LAST_SCAN_FILE = str(APPLICATION_PATH / '.last_scan')
     
+    # LLM response cache (memory LRU + SQLite on disk)
+    LLM_CACHE_ENABLED = os.environ.get('GYM_BOT_LLM_CACHE', '1') != '0'
+    LLM_CACHE_FILE = str(APPLICATION_PATH / 'llm_cache.sqlite3')
+    LLM_CACHE_TTL = int(os.environ.get('GYM_BOT_LLM_CACHE_TTL', 24 * 60 * 60))
+    LLM_CACHE_MAX_ENTRIES = 512
+    LLM_CACHE_MAX_DISK_ENTRIES = 10000
+    
+    # Per-call LLM timings kept for the p50/p95/p99 stats screen
+    LLM_METRICS_WINDOW = 1000
+    LLM_METRICS_FILE = str(APPLICATION_PATH / 'llm_metrics.jsonl')
+    
+    @classmethod
+    def set_offline_mode(cls, enabled, reason=None):
+        """Switch offline mode at runtime; every bot checks it per turn"""
+        cls.OFFLINE_MODE = bool(enabled)
+        cls.OFFLINE_REASON = (reason or "enabled at runtime") if enabled else None
+        return cls.OFFLINE_MODE
+    
     @classmethod
     def validate(cls):
-        if not cls.OPENROUTER_API_KEY:
-            raise ValueError("OpenRouter API Key not configured")
+        # Without a key the real endpoint cannot answer; run on local data instead
+        if not cls.OPENROUTER_API_KEY and not cls.OFFLINE_MODE and cls.OPENROUTER_API_URL.startswith('https://openrouter.ai'):
+            cls.set_offline_mode(True, "OpenRouter API Key not configured")
         
         # Create data folder if it doesn't exist
         if not os.path.exists(cls.DATA_FOLDER):
@@ -0,0 +1,99 @@
+import threading
+from collections import deque
+from config import Config
+
+def clip(text, limit):
+    text = ' '.join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+class ConversationState:
+    """Bounded memory of one bot conversation.
+
+    Recent exchanges are kept verbatim (replies clipped to reply_chars). Once
+    they exceed the token or byte budget the oldest are collapsed into
+    one-line summaries, and the summary itself keeps only its newest lines,
+    so a long-lived session holds a fixed amount of text. context() renders
+    both as a preamble for LLM prompts so follow-ups can refer back.
+    """
+    
+    def __init__(self, max_tokens=None, max_bytes=None, summary_lines=None, reply_chars=None):
+        self.max_tokens = max_tokens or Config.CONVERSATION_MAX_TOKENS
+        self.max_bytes = max_bytes or Config.CONVERSATION_MAX_BYTES
+        self.reply_chars = reply_chars or Config.CONVERSATION_REPLY_CHARS
+        self.exchanges = deque()
+        self.summary = deque(maxlen=summary_lines or Config.CONVERSATION_SUMMARY_LINES)
+        self.size = 0
+        self.chars = 0
+        self.total = 0
+        self.lock = threading.Lock()
+    
+    def __len__(self):
+        return self.total
+    
+    @property
+    def tokens(self):
+        # Roughly four characters per token for English text
+        return self.chars // 4
+    
+    @staticmethod
+    def measure(exchange):
+        return sum(len(text.encode('utf-8')) for text in exchange), sum(len(text) for text in exchange)
+    
+    @staticmethod
+    def summarize(query, reply):
+        """One line for an exchange: the question and the reply's first meaningful line"""
+        headline = next((line.strip() for line in reply.splitlines() if line.strip().strip('=-')), '')
+        return f'"{clip(query, 80)}" -> {clip(headline, 80)}'
+    
+    def record(self, query, reply):
+        exchange = (str(query).strip(), str(reply or '').strip()[:self.reply_chars])
+        size, chars = self.measure(exchange)
+        
+        with self.lock:
+            self.exchanges.append(exchange)
+            self.size += size
+            self.chars += chars
+            self.total += 1
+            
+            # The newest exchange always stays verbatim
+            while len(self.exchanges) > 1 and (self.size > self.max_bytes or self.tokens > self.max_tokens):
+                oldest = self.exchanges.popleft()
+                size, chars = self.measure(oldest)
+                self.size -= size
+                self.chars -= chars
+                self.summary.append(self.summarize(*oldest))
+    
+    def record_stream(self, query, chunks):
+        """Pass a streamed reply through, recording it once it is complete"""
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        self.record(query, ''.join(parts))
+    
+    def context(self):
+        """Earlier turns as prompt text, or "" before the first exchange"""
+        with self.lock:
+            exchanges = list(self.exchanges)
+            summary = list(self.summary)
+            omitted = self.total - len(exchanges) - len(summary)
+        
+        lines = []
+        if summary:
+            lines.append("Earlier in this conversation:")
+            if omitted:
+                lines.append(f"- ({omitted} older exchange{'s' if omitted != 1 else ''} not shown)")
+            lines += [f"- {line}" for line in summary]
+        if exchanges:
+            lines.append("Most recent exchanges:")
+            for query, reply in exchanges:
+                lines += [f"User: {query}", f"Assistant: {reply}"]
+        return '\n'.join(lines)
+    
+    def clear(self):
+        with self.lock:
+            self.exchanges.clear()
+            self.summary.clear()
+            self.size = 0
+            self.chars = 0
+            self.total = 0
\ No newline at end of file
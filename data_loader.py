@@ -1,7 +1,13 @@
 import pandas as pd
 import os
 import json
+import hashlib
+import threading
 from config import Config
+from metrics_cube import DailyMetricsCube
+from fuzzy_index import FuzzyMemberIndex
+from analytics_pool import get_analytics_pool
+from singleflight import SingleFlight
 from datetime import datetime
 from logger import logger
 
@@ -14,6 +20,19 @@ class DataLoader:
         self.date_columns = {}
         self.file_mappings = {}
         self.file_groups = {}
+        self.data_version = None
+        self.member_profiles = None
+        self.member_rows = {}
+        self.item_rollup = None
+        self.item_totals = None
+        self.aggregates = {}
+        self.aggregate_flights = SingleFlight()
+        self.metrics_cube = None
+        self.member_index = None
+        self.member_index_lock = threading.Lock()
+        # Data version the insights reports are being precomputed for, so only the first bot starts it
+        self.precompute_version = None
+        self.precompute_lock = threading.Lock()
         
         self.check_for_new_files()
     
@@ -251,10 +270,239 @@ class DataLoader:
             else:
                 self.dataframes[file_type] = df_list[0]
         
+        self.data_version = self.compute_data_version()
+        self.aggregates = {}
+        self.build_member_profiles()
+        self.build_item_rollup()
+        self.metrics_cube = DailyMetricsCube.build(self)
+        with self.member_index_lock:
+            self.member_index = None
+        # The fuzzy index takes seconds on large member lists, so build it off the load path
+        threading.Thread(target=self.get_member_index, name="MemberIndex", daemon=True).start()
+        
         logger.info(f"Data loading complete! Loaded {len(self.dataframes)} dataset type(s)")
         self.log_file_mappings()
         return len(self.dataframes) > 0
     
+    def compute_data_version(self):
+        """Fingerprint the loaded source files so caches can tell datasets apart"""
+        fingerprint = []
+        for file_type in sorted(self.file_groups):
+            for filename in sorted(self.file_groups[file_type]):
+                filepath = os.path.join(self.data_folder, filename)
+                try:
+                    stat = os.stat(filepath)
+                    fingerprint.append(f"{file_type}:{filename}:{stat.st_size}:{stat.st_mtime_ns}")
+                except OSError:
+                    fingerprint.append(f"{file_type}:{filename}")
+        
+        return hashlib.sha1('|'.join(fingerprint).encode('utf-8')).hexdigest()[:12]
+    
+    @staticmethod
+    def canonical_email(email):
+        return str(email).strip().lower()
+    
+    def build_member_profiles(self):
+        """Per-member order and payment totals, one groupby pass per table, keyed by canonical email"""
+        self.member_profiles = None
+        self.member_rows = {}
+        stats = []
+        
+        orders_df = self.get_dataframe('orders')
+        email_col = next((c for c in orders_df.columns if 'email' in c.lower()), None) if orders_df is not None else None
+        if email_col:
+            amount_col = next((c for c in orders_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
+            status_col = next((c for c in orders_df.columns if 'status' in c.lower() and 'payment' in c.lower()), None)
+            date_col = next((c for c in orders_df.columns if 'date' in c.lower() and 'created' in c.lower()), None)
+            
+            emails = orders_df[email_col].astype('string').str.strip().str.lower()
+            frame = pd.DataFrame({
+                'email': emails,
+                'amount': pd.to_numeric(orders_df[amount_col], errors='coerce') if amount_col else 0.0,
+                'paid': orders_df[status_col].astype(str) == 'Paid' if status_col else False,
+                'date': pd.to_datetime(orders_df[date_col], errors='coerce') if date_col else pd.NaT,
+            })
+            grouped = frame.groupby('email', sort=False)
+            self.member_rows['orders'] = grouped.indices
+            stats.append(grouped.agg(
+                order_count=('amount', 'size'),
+                paid_count=('paid', 'sum'),
+                total_spent=('amount', 'sum'),
+                first_order=('date', 'min'),
+                last_order=('date', 'max'),
+            ))
+        
+        payments_df = self.get_dataframe('payments')
+        email_col = next((c for c in payments_df.columns if 'email' in c.lower()), None) if payments_df is not None else None
+        if email_col:
+            amount_col = next((c for c in payments_df.columns if 'amount' in c.lower() and 'processing' not in c.lower()), None)
+            method_col = next((c for c in payments_df.columns if 'method' in c.lower()), None)
+            date_col = next((c for c in payments_df.columns if 'date' in c.lower()), None)
+            
+            frame = pd.DataFrame({
+                'email': payments_df[email_col].astype('string').str.strip().str.lower(),
+                'amount': pd.to_numeric(payments_df[amount_col], errors='coerce') if amount_col else 0.0,
+                'method': payments_df[method_col] if method_col else None,
+                'date': pd.to_datetime(payments_df[date_col], errors='coerce') if date_col else pd.NaT,
+            })
+            grouped = frame.groupby('email', sort=False)
+            self.member_rows['payments'] = grouped.indices
+            
+            # Last payment method by date, so sort before taking each group's last value
+            by_date = frame.sort_values('date', kind='stable').groupby('email', sort=False)
+            stats.append(grouped.agg(
+                payment_count=('amount', 'size'),
+                total_paid=('amount', 'sum'),
+            ).join(by_date['method'].last().rename('last_payment_method')))
+        
+        if not stats:
+            return None
+        
+        profiles = pd.concat(stats, axis=1)
+        for col in ('order_count', 'paid_count', 'payment_count'):
+            if col in profiles.columns:
+                profiles[col] = profiles[col].fillna(0).astype(int)
+        for col in ('total_spent', 'total_paid'):
+            if col in profiles.columns:
+                profiles[col] = profiles[col].fillna(0.0)
+        
+        self.member_profiles = profiles
+        logger.info(f"Built member profiles for {len(profiles)} email(s)")
+        return profiles
+    
+    def get_member_profile(self, email):
+        """Precomputed totals for one member as a dict, or None if they have no orders or payments"""
+        if self.member_profiles is None or email is None:
+            return None
+        
+        key = self.canonical_email(email)
+        if key not in self.member_profiles.index:
+            return None
+        return self.member_profiles.loc[key].to_dict()
+    
+    def build_item_rollup(self):
+        """Daily count, quantity and revenue per item; leaderboards sum this instead of the line items"""
+        self.item_rollup = None
+        self.item_totals = None
+        
+        items_df = self.get_dataframe('items_purchased')
+        if items_df is None:
+            return None
+        
+        item_col = next((c for c in items_df.columns if 'item' in c.lower() and 'order' not in c.lower()), None)
+        if item_col is None:
+            return None
+        
+        amount_col = next((c for c in items_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
+        qty_col = next((c for c in items_df.columns if c.lower() == 'qty' or c.lower() == 'quantity'), None)
+        date_col = next((c for c in items_df.columns if 'date' in c.lower()), None)
+        
+        frame = pd.DataFrame({
+            'item': items_df[item_col],
+            'date': pd.to_datetime(items_df[date_col], errors='coerce').dt.normalize() if date_col else pd.NaT,
+            'quantity': pd.to_numeric(items_df[qty_col], errors='coerce').fillna(1) if qty_col else 1,
+            'revenue': pd.to_numeric(items_df[amount_col], errors='coerce') if amount_col else 0.0,
+        })
+        frame = frame[frame['item'].notna()]
+        
+        # Undated lines still count towards all-time totals
+        self.item_rollup = frame.groupby(['date', 'item'], dropna=False, sort=False).agg(
+            count=('item', 'size'),
+            quantity=('quantity', 'sum'),
+            revenue=('revenue', 'sum'),
+        ).reset_index()
+        self.item_totals = self.item_rollup.groupby('item')[['count', 'quantity', 'revenue']].sum()
+        
+        logger.info(f"Built item rollup: {len(self.item_totals)} item(s) over {len(self.item_rollup)} day/item row(s)")
+        return self.item_rollup
+    
+    def get_item_leaderboard(self, limit=10, by='count', days=None, month=None, year=None):
+        """Top items by 'count', 'quantity' or 'revenue', optionally within the last N days or a calendar month"""
+        if self.item_totals is None:
+            return None
+        
+        if days is None and month is None:
+            totals = self.item_totals
+        else:
+            rollup = self.item_rollup
+            if days is not None:
+                mask = rollup['date'] >= rollup['date'].max() - pd.Timedelta(days=days)
+            else:
+                mask = rollup['date'].dt.month == month
+                if year:
+                    mask &= rollup['date'].dt.year == year
+            totals = rollup[mask].groupby('item')[['count', 'quantity', 'revenue']].sum()
+        
+        if by not in totals.columns:
+            by = 'count'
+        return totals.nlargest(limit, by)
+    
+    def cached_aggregate(self, key, fn):
+        """fn() computed once per data version and key; concurrent misses wait for the first"""
+        key = (self.data_version,) + tuple(key)
+        aggregates = self.aggregates
+        if key in aggregates:
+            return aggregates[key]
+        
+        def compute():
+            # A caller that lost the race to an earlier flight finds its result here
+            if key not in aggregates:
+                aggregates[key] = fn()
+            return aggregates[key]
+        
+        return self.aggregate_flights.do(key, compute)
+    
+    def get_payment_mix(self, status=None, days=None, month=None):
+        """Transactions, share, gross, fees, net and average per payment method, in one groupby pass"""
+        return self.cached_aggregate(('payment_mix', status, days, month), lambda: self.compute_payment_mix(status, days, month))
+    
+    def compute_payment_mix(self, status=None, days=None, month=None):
+        payments_df = self.get_dataframe('payments')
+        if payments_df is None:
+            return None
+        
+        method_col = next((c for c in payments_df.columns if 'method' in c.lower()), None)
+        if method_col is None:
+            return None
+        
+        amount_col = next((c for c in payments_df.columns if 'amount' in c.lower() and 'processing' not in c.lower()), None)
+        fee_col = next((c for c in payments_df.columns if 'fee' in c.lower()), None)
+        net_col = next((c for c in payments_df.columns if c.lower() == 'net'), None)
+        status_col = next((c for c in payments_df.columns if 'status' in c.lower()), None)
+        date_col = next((c for c in payments_df.columns if 'date' in c.lower()), None)
+        
+        def numeric(col):
+            return pd.to_numeric(payments_df[col], errors='coerce') if col else 0.0
+        
+        frame = pd.DataFrame({
+            'method': payments_df[method_col],
+            'gross': numeric(amount_col),
+            'fees': numeric(fee_col),
+            'net': numeric(net_col),
+        })
+        
+        if status is not None and status_col:
+            frame = frame[payments_df[status_col].astype(str).str.lower() == str(status).lower()]
+        
+        if date_col and (days is not None or month is not None):
+            dates = pd.to_datetime(payments_df[date_col], errors='coerce').reindex(frame.index)
+            if days is not None:
+                frame = frame[dates >= dates.max() - pd.Timedelta(days=days)]
+            else:
+                frame = frame[dates.dt.month == month]
+        
+        mix = frame.groupby('method').agg(
+            transactions=('method', 'size'),
+            gross=('gross', 'sum'),
+            fees=('fees', 'sum'),
+            net=('net', 'sum'),
+        ).sort_values('transactions', ascending=False, kind='stable')
+        
+        # Shares are of every payment in the slice, including ones with no method recorded
+        mix['share'] = mix['transactions'] / len(frame) * 100 if len(frame) else 0.0
+        mix['average'] = mix['gross'] / mix['transactions']
+        return mix
+    
     def log_file_mappings(self):
         """Log which files were mapped to which types"""
         logger.info("File type mappings:")
@@ -294,17 +542,46 @@ class DataLoader:
         if not search_cols:
             return None
         
-        mask = pd.Series([False] * len(data_df))
+        mask = pd.Series(False, index=data_df.index)
         for col in search_cols:
             mask = mask | data_df[col].astype(str).str.lower().str.contains(query_str, na=False, regex=False)
         
-        return data_df[mask]
+        if mask.any():
+            return data_df[mask]
+        
+        return self.fuzzy_search_member(query)
+    
+    def get_member_index(self):
+        """Fuzzy index over member names and emails, built by the first search that needs it"""
+        with self.member_index_lock:
+            if self.member_index is None:
+                data_df = self.get_dataframe('data')
+                self.member_index = FuzzyMemberIndex.build(data_df) if data_df is not None else None
+            return self.member_index
+    
+    def fuzzy_search_member(self, query, limit=None):
+        """Closest members by edit distance, flagged with attrs['fuzzy'] so callers can say so"""
+        data_df = self.get_dataframe('data')
+        index = self.get_member_index()
+        if data_df is None or index is None:
+            return data_df.iloc[0:0] if data_df is not None else None
+        
+        positions = index.search(query, limit or Config.FUZZY_SEARCH_LIMIT, Config.FUZZY_SEARCH_BUDGET)
+        results = data_df.iloc[positions]
+        results.attrs['fuzzy'] = True
+        return results
     
     def get_member_orders(self, email):
         orders_df = self.get_dataframe('orders')
         if orders_df is None:
             return None
         
+        # Row positions per member were grouped once at load time
+        rows = self.member_rows.get('orders')
+        if rows is not None:
+            positions = rows.get(self.canonical_email(email))
+            return orders_df.iloc[positions if positions is not None else []].copy()
+        
         email_col = None
         for col in orders_df.columns:
             if 'email' in col.lower():
@@ -323,6 +600,12 @@ class DataLoader:
         if payments_df is None:
             return None
         
+        # Row positions per member were grouped once at load time
+        rows = self.member_rows.get('payments')
+        if rows is not None:
+            positions = rows.get(self.canonical_email(email))
+            return payments_df.iloc[positions if positions is not None else []].copy()
+        
         email_col = None
         for col in payments_df.columns:
             if 'email' in col.lower():
@@ -356,28 +639,26 @@ class DataLoader:
         if date_col is None:
             return orders_df.copy()
         
+        # Dates are parsed into the returned slice only, never the shared frame other threads read
         try:
-            orders_df[date_col] = pd.to_datetime(orders_df[date_col], errors='coerce')
+            dates = pd.to_datetime(orders_df[date_col], errors='coerce')
         except:
             return orders_df.copy()
         
         if days is not None:
-            latest_date = orders_df[date_col].max()
+            latest_date = dates.max()
             start_date = latest_date - pd.Timedelta(days=days)
-            mask = orders_df[date_col] >= start_date
-            return orders_df[mask].copy()
-        
-        if start_date and end_date:
-            mask = (orders_df[date_col] >= start_date) & (orders_df[date_col] <= end_date)
-            return orders_df[mask].copy()
+            mask = dates >= start_date
+        elif start_date and end_date:
+            mask = (dates >= start_date) & (dates <= end_date)
         elif start_date:
-            mask = orders_df[date_col] >= start_date
-            return orders_df[mask].copy()
+            mask = dates >= start_date
         elif end_date:
-            mask = orders_df[date_col] <= end_date
-            return orders_df[mask].copy()
+            mask = dates <= end_date
+        else:
+            return orders_df.assign(**{date_col: dates})
         
-        return orders_df.copy()
+        return orders_df[mask].assign(**{date_col: dates[mask]})
     
     def get_orders_by_month(self, month, year=None):
         orders_df = self.get_dataframe('orders')
@@ -399,52 +680,29 @@ class DataLoader:
         if date_col is None:
             return None
         
+        # Dates are parsed into the returned slice only, never the shared frame other threads read
         try:
-            orders_df[date_col] = pd.to_datetime(orders_df[date_col], errors='coerce')
+            dates = pd.to_datetime(orders_df[date_col], errors='coerce')
         except:
             return None
         
-        mask = orders_df[date_col].dt.month == month
-        filtered = orders_df[mask]
+        mask = dates.dt.month == month
         
         if year:
-            mask = filtered[date_col].dt.year == year
-            filtered = filtered[mask]
+            mask &= dates.dt.year == year
         
-        return filtered.copy()
+        return orders_df[mask].assign(**{date_col: dates[mask]})
     
     def get_top_members_by_spending(self, limit=10):
-        orders_df = self.get_dataframe('orders')
-        if orders_df is None:
+        """Biggest spenders, computed on the analytics pool; may raise AnalyticsTimeout"""
+        if self.get_dataframe('orders') is None:
             return None
-        
-        email_col = None
-        amount_col = None
-        
-        for col in orders_df.columns:
-            if 'email' in col.lower():
-                email_col = col
-            if 'amount' in col.lower() and 'paid' in col.lower():
-                amount_col = col
-        
-        if email_col is None or amount_col is None:
-            return None
-        
-        try:
-            orders_df = orders_df.copy()
-            orders_df[amount_col] = pd.to_numeric(orders_df[amount_col], errors='coerce')
-        except:
-            return None
-        
-        top_members = orders_df.groupby(email_col).agg({
-            email_col: 'first',
-            amount_col: ['sum', 'count']
-        }).reset_index(drop=True)
-        
-        top_members.columns = ['email', 'total_spent', 'order_count']
-        top_members = top_members.sort_values('total_spent', ascending=False).head(limit)
-        
-        return top_members
+        return get_analytics_pool().run(self, 'top_members_by_spending', limit)
+    
+    def get_cohort_matrix(self, months=None):
+        """Signup-cohort retention matrix, built once per data version on the analytics pool; may raise AnalyticsTimeout"""
+        months = months or Config.COHORT_MONTHS
+        return self.cached_aggregate(('cohort_matrix', months), lambda: get_analytics_pool().run(self, 'cohort_matrix', months))
     
     def get_summary_stats(self):
         stats = {}
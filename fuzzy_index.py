@@ -0,0 +1,137 @@
+import re
+import time
+import numpy as np
+import pandas as pd
+from logger import logger
+
+# Letters and digits split apart, so "jsmith84" indexes as "jsmith" and "84"
+TOKEN_PATTERN = r'[a-z]+|[0-9]+'
+
+# Deletes are generated from this many leading characters only, which bounds
+# the index size for long email handles; candidates are verified in full
+PREFIX_LENGTH = 10
+
+def max_distance(token):
+    """Edits tolerated for a token: none for short or numeric tokens, two for long words.
+    
+    Words under five letters get none: one edit turns "many" into "Mary"
+    and "can" into "Dan".
+    """
+    if len(token) < 5 or token.isdigit():
+        return 0
+    return 1 if len(token) < 6 else 2
+
+def deletes(word, depth):
+    """word plus every string reachable from it by up to depth deletions"""
+    result = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or limit + 1 as soon as it must exceed limit"""
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    
+    before = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+def tokenize(text):
+    return list(dict.fromkeys(re.findall(TOKEN_PATTERN, str(text).lower())))
+
+class FuzzyMemberIndex:
+    """Typo-tolerant lookup of members by the words in their names and emails.
+
+    A SymSpell-style deletion dictionary maps every string within a token's
+    edit budget (by deletions only) to the tokens it came from, so a query
+    token finds its candidates with a handful of dict lookups instead of a
+    scan over every member. Candidates are then checked with a bounded edit
+    distance. Only members matching every query word are returned, closest
+    first.
+    """
+    
+    def __init__(self, token_rows):
+        self.token_rows = token_rows
+        self.deletes = {}
+        for token in token_rows:
+            for variant in deletes(token[:PREFIX_LENGTH], max_distance(token)):
+                self.deletes.setdefault(variant, []).append(token)
+    
+    @classmethod
+    def build(cls, data_df):
+        """Index the name and email columns of the members table; None when there are none"""
+        name_cols = [c for c in data_df.columns if 'name' in c.lower()]
+        email_cols = [c for c in data_df.columns if 'email' in c.lower()]
+        if not name_cols and not email_cols:
+            return None
+        
+        started = time.perf_counter()
+        pieces = []
+        for col in name_cols:
+            pieces.append(data_df[col].fillna('').astype(str).str.lower().str.findall(TOKEN_PATTERN))
+        for col in email_cols:
+            # Words of the handle only: the domain would match every gmail user
+            handle = data_df[col].fillna('').astype(str).str.lower().str.split('@').str[0]
+            pieces.append(handle.str.findall(TOKEN_PATTERN))
+        
+        words = pd.concat([p.set_axis(np.arange(len(data_df))) for p in pieces]).explode().dropna()
+        words = words[words != ''].reset_index().drop_duplicates()
+        words.columns = ['row', 'token']
+        
+        rows = words['row'].to_numpy(dtype=np.intp)
+        token_rows = {token: rows[positions] for token, positions in words.groupby('token').indices.items()}
+        
+        index = cls(token_rows)
+        logger.info(f"Built fuzzy member index: {len(token_rows):,} tokens, {len(index.deletes):,} deletes in {time.perf_counter() - started:.2f}s")
+        return index
+    
+    def candidates(self, term, deadline):
+        """(token, distance) pairs within the term's edit budget"""
+        limit = max_distance(term)
+        seen = set()
+        for variant in deletes(term[:PREFIX_LENGTH], limit):
+            for token in self.deletes.get(variant, ()):
+                if token in seen:
+                    continue
+                seen.add(token)
+                distance = edit_distance(term, token, limit)
+                if distance <= limit:
+                    yield token, distance
+            if time.perf_counter() > deadline:
+                logger.warning(f"Fuzzy member search for '{term}' stopped at its time budget")
+                return
+    
+    def search(self, query, limit=10, budget=0.05):
+        """Row positions of the members matching every word of the query, best first"""
+        deadline = time.perf_counter() + budget
+        rows, terms, distances = [], [], []
+        query_terms = tokenize(query)
+        for term_id, term in enumerate(query_terms):
+            for token, distance in self.candidates(term, deadline):
+                matched = self.token_rows[token]
+                rows.append(matched)
+                terms.append(np.full(len(matched), term_id))
+                distances.append(np.full(len(matched), distance))
+        
+        if not rows:
+            return np.array([], dtype=np.intp)
+        
+        hits = pd.DataFrame({'row': np.concatenate(rows), 'term': np.concatenate(terms), 'distance': np.concatenate(distances)})
+        best = hits.groupby(['row', 'term'])['distance'].min().groupby(level='row').agg(['count', 'sum'])
+        best = best[best['count'] == len(query_terms)]
+        ranked = best.sort_values('sum', kind='stable')
+        return ranked.index.to_numpy(dtype=np.intp)[:limit]
\ No newline at end of file
@@ -1,12 +1,90 @@
-from gemini_bot import GeminiBot
+from openrouter_bot import AsyncOpenRouterBot
+from async_runner import run_sync
+from config import Config
+from intent_classifier import get_intent_classifier
+from structured_routing import build_routing_prompt, empty_route, extract_limit, merge_route, parse_route
+from prefetch import Prefetch
+from conversation_state import ConversationState
+from row_renderer import RowRenderer
+from metrics_cube import percent_change, resolve_window
+from analytics_pool import AnalyticsTimeout, get_analytics_pool
 from data_loader import DataLoader
+from logger import logger
 import pandas as pd
+import asyncio
+import functools
+import json
+import threading
+
+INSIGHTS_INTENTS = {
+    'comprehensive_overview': 'User wants general business overview, overall insights, or summary',
+    'member_analytics': 'User wants member statistics, member insights, or customer analytics',
+    'revenue_analytics': 'User wants revenue, income, earnings, or financial information',
+    'growth_metrics': 'User wants growth trends, progress, or performance over time',
+    'activity_metrics': 'User wants activity, engagement, retention, or usage stats',
+    'cohort_retention': 'User wants retention by signup cohort: how many members come back N months after joining',
+    'acquisition_sources': 'User wants to know where members come from',
+    'payment_methods': 'User wants payment method breakdown',
+    'top_performers': 'User wants top members, best customers, or high spenders',
+    'general_question': 'General analytical question',
+}
+
+INSIGHTS_INTENT_EXAMPLES = {
+    'comprehensive_overview': ['give me a business overview', 'how is the gym doing', 'overall summary', 'key insights'],
+    'member_analytics': ['member statistics', 'how many members do we have', 'customer analytics', 'membership numbers'],
+    'revenue_analytics': ['revenue breakdown', 'how much did we earn', 'processing fees', 'net revenue'],
+    'growth_metrics': ['are we growing', 'monthly growth', 'new members per month', 'trend over time'],
+    'activity_metrics': ['how engaged are members', 'retention rate', 'active members last 30 days', 'usage stats'],
+    'cohort_retention': ['cohort analysis', 'retention by signup month', 'do new members keep coming back', 'retention curve'],
+    'acquisition_sources': ['where do members come from', 'acquisition channels', 'lead sources', 'signup sources'],
+    'payment_methods': ['payment method analysis', 'how do people pay', 'card vs cash usage'],
+    'top_performers': ['top members', 'best customers', 'highest spenders', 'vip members'],
+    'general_question': ['what should we improve', 'any recommendations', 'what stands out in the data'],
+}
+
+# Ordered to mirror the routing priority in select_handler
+INSIGHTS_INTENT_RULES = [
+    (r'\b(overview|overall|summary|big picture|snapshot)\b', 'comprehensive_overview'),
+    (r'\b(sources?|acquisition|channels?|referrals?|come from)\b', 'acquisition_sources'),
+    (r'\bpayment methods?\b|\bhow (do|did) (people|customers|members) pay\b', 'payment_methods'),
+    (r'\bcohorts?\b|\bretention (curve|matrix|table|by)\b|\b(months? )?(after|since) (signing up|signup|joining)\b|\b(keep|kept) coming back\b', 'cohort_retention'),
+    (r'\b(top|best|highest|biggest|vip)\b', 'top_performers'),
+    (r'\b(growth|growing|grow|trends?|over time)\b', 'growth_metrics'),
+    (r'\b(q[1-4]|(this|last|previous) (week|month|quarter|year)|ytd|year to date|(week|month|year)[- ]over[- ](week|month|year)|yoy|vs\.?|versus|compared (to|with))\b', 'growth_metrics'),
+    (r'\b(activity|active|engagement|engaged|retention|churn|usage)\b', 'activity_metrics'),
+    (r'\b(revenue|income|earnings?|financial|fees|net)\b', 'revenue_analytics'),
+    (r'\b(members?|membership|customers?)\b', 'member_analytics'),
+]
+
+def cached_report(method):
+    """Serve a report that depends only on the loaded data from the per-version report cache"""
+    @functools.wraps(method)
+    def wrapper(self):
+        return self.get_report(method.__name__, lambda: method(self))
+    return wrapper
 
 class InsightsBot:
+    # Reports built by precompute_reports, cheapest first
+    PRECOMPUTED_REPORTS = (
+        'build_comprehensive_context', 'get_comprehensive_insights', 'get_member_insights',
+        'get_member_sources', 'get_activity_metrics', 'get_revenue_insights',
+        'get_payment_analysis', 'get_growth_metrics', 'get_cohort_retention',
+    )
+    
+    # Months since signup shown as columns of the cohort report
+    COHORT_OFFSETS = (0, 1, 2, 3, 6, 12, 24)
+    
     def __init__(self, data_loader):
         self.data_loader = data_loader
-        self.gemini = GeminiBot()
-        self.conversation_history = []
+        self.gemini = AsyncOpenRouterBot(caller='insights')
+        self.intent_classifier = get_intent_classifier('insights', INSIGHTS_INTENTS, INSIGHTS_INTENT_EXAMPLES, INSIGHTS_INTENT_RULES)
+        self.conversation_history = ConversationState()
+        self.prefetch = None
+        self.renderer = RowRenderer()
+        self.precompute_thread = None
+        
+        if Config.INSIGHTS_PRECOMPUTE:
+            self.start_precompute()
     
     def start(self):
         print("\n" + "=" * 60)
@@ -24,64 +102,237 @@ class InsightsBot:
             
             if query.lower() in ['exit', 'quit', 'menu', 'back']:
                 print("Returning to main menu...\n")
-                self.conversation_history = []
+                self.conversation_history.clear()
                 break
             
-            response = self.process_query(query)
-            print(f"\nBot: {response}\n")
+            print("\nBot: ", end="", flush=True)
+            for chunk in self.process_query_stream(query):
+                print(chunk, end="", flush=True)
+            print("\n")
     
-    def understand_intent_with_ai(self, query):
-        context = f"""Analyze this user query about business insights/analytics and determine the intent. Return ONLY the intent name.
+    def format_intent_list(self):
+        return '\n'.join(f"- {name}: {description}" for name, description in INSIGHTS_INTENTS.items())
+    
+    def build_intent_prompt(self, query):
+        return f"""Analyze this user query about business insights/analytics and determine the intent. Return ONLY the intent name.
 
 Available intents:
-- comprehensive_overview: User wants general business overview, overall insights, or summary
-- member_analytics: User wants member statistics, member insights, or customer analytics
-- revenue_analytics: User wants revenue, income, earnings, or financial information
-- growth_metrics: User wants growth trends, progress, or performance over time
-- activity_metrics: User wants activity, engagement, retention, or usage stats
-- acquisition_sources: User wants to know where members come from
-- payment_methods: User wants payment method breakdown
-- top_performers: User wants top members, best customers, or high spenders
-- general_question: General analytical question
+{self.format_intent_list()}
 
 User query: "{query}"
 
 Return only one word - the intent name."""
-        
-        intent = self.gemini.get_response(context, "").strip().lower()
-        return intent
     
-    def process_query(self, query):
-        self.conversation_history.append(query)
+    def understand_intent_with_ai(self, query):
+        return run_sync(self.understand_intent_with_ai_async(query))
+    
+    async def understand_intent_with_ai_async(self, query):
+        intent, confidence = self.intent_classifier.classify(query)
+        if confidence >= Config.INTENT_CONFIDENCE_THRESHOLD or self.gemini.is_offline():
+            return intent
+        
+        intent = await self.gemini.get_response(
+            self.build_intent_prompt(query), "",
+            temperature=Config.INTENT_TEMPERATURE,
+            data_version=self.data_loader.data_version,
+            phase='intent',
+            fallback=lambda: intent
+        )
+        return intent.strip().lower()
+    
+    def extract_entities(self, query):
+        """Regex entity extraction for queries routed without the LLM"""
+        entities = empty_route()['entities']
+        entities['limit'] = extract_limit(query)
+        return entities
+    
+    def build_routing_prompt(self, query):
+        return build_routing_prompt(
+            "gym business analytics assistant",
+            self.format_intent_list(),
+            query,
+            context=self.build_comprehensive_context()
+        )
+    
+    def route_query(self, query):
+        return run_sync(self.route_query_async(query))
+    
+    async def route_query_async(self, query):
+        """Resolve intent, entities and possibly the answer with at most one LLM call"""
+        intent, confidence = self.intent_classifier.classify(query)
+        local_route = empty_route(intent)
+        local_route['entities'] = self.extract_entities(query)
+        
+        if confidence >= Config.INTENT_CONFIDENCE_THRESHOLD or self.gemini.is_offline():
+            return local_route
+        
+        if not Config.STRUCTURED_ROUTING:
+            local_route['intent'] = await self.understand_intent_with_ai_async(query)
+            return local_route
+        
+        prompt = await asyncio.to_thread(self.build_routing_prompt, query)
+        reply = await self.gemini.get_response(
+            prompt, "",
+            temperature=Config.INTENT_TEMPERATURE,
+            data_version=self.data_loader.data_version,
+            phase='intent',
+            fallback=lambda: json.dumps(local_route)
+        )
+        
+        return merge_route(parse_route(reply, INSIGHTS_INTENTS), local_route)
+    
+    def select_handler(self, query, intent, entities=None):
+        """Map an intent to a local handler, or None when the LLM should answer"""
+        if entities is None:
+            entities = self.extract_entities(query)
         
-        intent = self.understand_intent_with_ai(query)
+        # Any named window or comparison is answered from the daily metrics cube
+        window = self.window_for(query)
+        if window and any(name in intent for name in ('comprehensive', 'overview', 'member', 'revenue', 'growth', 'activity')):
+            return lambda: self.get_window_metrics(window)
         
         if 'comprehensive' in intent or 'overview' in intent:
-            return self.get_comprehensive_insights()
+            return self.get_comprehensive_insights
         
         if 'member' in intent:
-            return self.get_member_insights()
+            return self.get_member_insights
         
         if 'revenue' in intent:
-            return self.get_revenue_insights()
+            return self.get_revenue_insights
         
         if 'growth' in intent:
-            return self.get_growth_metrics()
+            return self.get_growth_metrics
         
         if 'activity' in intent:
-            return self.get_activity_metrics()
+            return self.get_activity_metrics
+        
+        if 'cohort' in intent or 'retention' in intent:
+            return self.get_cohort_retention
         
         if 'acquisition' in intent or 'sources' in intent:
-            return self.get_member_sources()
+            return self.get_member_sources
         
         if 'payment_methods' in intent:
-            return self.get_payment_analysis()
+            return self.get_payment_analysis
         
         if 'top' in intent or 'performers' in intent:
-            return self.get_top_members()
+            limit = entities.get('limit') or 10
+            return lambda: self.get_top_members(limit)
         
-        return self.intelligent_response(query)
+        return None
+    
+    def start_prefetch(self, query):
+        """Begin the report the local classifier expects while routing is in flight"""
+        prefetch = Prefetch()
+        
+        # A confident local route (or offline mode) makes no network call to hide the work behind
+        intent, confidence = self.intent_classifier.classify(query)
+        if confidence >= Config.INTENT_CONFIDENCE_THRESHOLD or self.gemini.is_offline():
+            return prefetch
+        
+        entities = self.extract_entities(query)
+        handler = self.select_handler(query, intent, entities)
+        if handler is not None:
+            prefetch.submit(self.handler_key(intent, entities), handler)
+        
+        return prefetch
+    
+    def handler_key(self, intent, entities):
+        return ('handler', intent, json.dumps(entities, sort_keys=True))
     
+    def fetch_data(self, key, fn, *args):
+        """fn(*args), served from this turn's prefetch when it was speculated"""
+        prefetch = self.prefetch
+        if prefetch is not None:
+            return prefetch.get(key, fn, *args)
+        return fn(*args)
+    
+    def process_query(self, query):
+        return run_sync(self.process_query_async(query))
+    
+    async def process_query_async(self, query):
+        reply = await self.answer_async(query)
+        self.conversation_history.record(query, reply)
+        return reply
+    
+    def process_query_stream(self, query):
+        """Like process_query, but yields the reply in chunks as the LLM produces it"""
+        yield from self.conversation_history.record_stream(query, self.answer_stream(query))
+    
+    async def answer_async(self, query):
+        self.prefetch = self.start_prefetch(query)
+        try:
+            route = await self.route_query_async(query)
+            
+            handler = self.select_handler(query, route['intent'], route['entities'])
+            if handler is not None:
+                key = self.handler_key(route['intent'], route['entities'])
+                return await asyncio.to_thread(self.fetch_data, key, handler)
+            
+            if route['answer']:
+                return route['answer']
+            
+            return await self.intelligent_response_async(query)
+        finally:
+            self.prefetch.close()
+            self.prefetch = None
+    
+    def answer_stream(self, query):
+        self.prefetch = self.start_prefetch(query)
+        try:
+            route = self.route_query(query)
+            
+            handler = self.select_handler(query, route['intent'], route['entities'])
+            if handler is not None:
+                yield self.fetch_data(self.handler_key(route['intent'], route['entities']), handler)
+                return
+            
+            if route['answer']:
+                yield route['answer']
+                return
+            
+            if self.gemini.is_offline():
+                yield self.offline_response(query)
+                return
+            
+            yield from self.gemini.stream_response(
+                query, self.build_response_context(query),
+                data_version=self.data_loader.data_version,
+                history=self.conversation_history.context(),
+                fallback=lambda: self.degraded_response(query)
+            )
+        finally:
+            self.prefetch.close()
+            self.prefetch = None
+    
+    def get_report(self, name, compute):
+        """compute() once per data version and render target, shared by every InsightsBot on this data loader"""
+        return self.data_loader.cached_aggregate(('insights_report', self.renderer.target, name), compute)
+    
+    def start_precompute(self):
+        """Build every cached report on a background thread so the first questions are served from cache.
+
+        The reports are shared by every InsightsBot on the data loader, so only
+        the first bot per data version starts the thread; the others return None.
+        """
+        with self.data_loader.precompute_lock:
+            if self.data_loader.precompute_version == self.data_loader.data_version:
+                return None
+            self.data_loader.precompute_version = self.data_loader.data_version
+        
+        self.precompute_thread = threading.Thread(target=self.precompute_reports, name="InsightsPrecompute", daemon=True)
+        self.precompute_thread.start()
+        return self.precompute_thread
+    
+    def precompute_reports(self):
+        for name in self.PRECOMPUTED_REPORTS:
+            try:
+                getattr(self, name)()
+            except Exception as e:
+                logger.warning(f"Precomputing insights report {name} failed: {e}")
+        logger.info(f"Insights reports precomputed for data version {self.data_loader.data_version}")
+    
+    @cached_report
     def get_comprehensive_insights(self):
         stats = self.data_loader.get_summary_stats()
         data_df = self.data_loader.get_dataframe('data')
@@ -98,9 +349,9 @@ Total Members: {stats.get('total_members', 0):,}
         if data_df is not None:
             activity_col = next((c for c in data_df.columns if 'activity' in c.lower() and 'date' in c.lower()), None)
             if activity_col:
-                data_df[activity_col] = pd.to_datetime(data_df[activity_col], errors='coerce')
-                latest_date = data_df[activity_col].max()
-                active_30d = len(data_df[data_df[activity_col] >= latest_date - pd.Timedelta(days=30)])
+                activity = pd.to_datetime(data_df[activity_col], errors='coerce')
+                latest_date = activity.max()
+                active_30d = len(data_df[activity >= latest_date - pd.Timedelta(days=30)])
                 activity_rate = (active_30d / len(data_df) * 100) if len(data_df) > 0 else 0
                 info += f"Active Members (30 days): {active_30d:,} ({activity_rate:.1f}%)\n"
         
@@ -117,14 +368,14 @@ Total Revenue: CAD ${stats.get('total_revenue', 0):,.2f}
         if orders_df is not None:
             amount_col = next((c for c in orders_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
             if amount_col:
-                orders_df[amount_col] = pd.to_numeric(orders_df[amount_col], errors='coerce')
-                avg_order = orders_df[amount_col].mean()
+                avg_order = pd.to_numeric(orders_df[amount_col], errors='coerce').mean()
                 info += f"Average Order Value: CAD ${avg_order:.2f}\n"
         
         info += "=" * 60
         
         return info
     
+    @cached_report
     def get_member_insights(self):
         data_df = self.data_loader.get_dataframe('data')
         
@@ -140,10 +391,10 @@ Total Revenue: CAD ${stats.get('total_revenue', 0):,.2f}
         
         active_members = 0
         if activity_col:
-            data_df[activity_col] = pd.to_datetime(data_df[activity_col], errors='coerce')
-            latest_date = data_df[activity_col].max()
+            activity = pd.to_datetime(data_df[activity_col], errors='coerce')
+            latest_date = activity.max()
             thirty_days_ago = latest_date - pd.Timedelta(days=30)
-            active_members = len(data_df[data_df[activity_col] >= thirty_days_ago])
+            active_members = len(data_df[activity >= thirty_days_ago])
         
         info = f"""
 MEMBER ANALYTICS:
@@ -163,6 +414,7 @@ Activity Rate: {(active_members/total_members*100):.1f}%
         
         return info
     
+    @cached_report
     def get_revenue_insights(self):
         payments_df = self.data_loader.get_dataframe('payments')
         
@@ -175,22 +427,20 @@ Activity Rate: {(active_members/total_members*100):.1f}%
         status_col = next((c for c in payments_df.columns if 'status' in c.lower()), None)
         
         if amount_col:
-            payments_df[amount_col] = pd.to_numeric(payments_df[amount_col], errors='coerce')
-            total_revenue = payments_df[amount_col].sum()
-            avg_transaction = payments_df[amount_col].mean()
+            amounts = pd.to_numeric(payments_df[amount_col], errors='coerce')
+            total_revenue = amounts.sum()
+            avg_transaction = amounts.mean()
         else:
             total_revenue = 0
             avg_transaction = 0
         
         if net_col:
-            payments_df[net_col] = pd.to_numeric(payments_df[net_col], errors='coerce')
-            total_net = payments_df[net_col].sum()
+            total_net = pd.to_numeric(payments_df[net_col], errors='coerce').sum()
         else:
             total_net = 0
         
         if fee_col:
-            payments_df[fee_col] = pd.to_numeric(payments_df[fee_col], errors='coerce')
-            total_fees = payments_df[fee_col].sum()
+            total_fees = pd.to_numeric(payments_df[fee_col], errors='coerce').sum()
         else:
             total_fees = 0
         
@@ -213,13 +463,19 @@ Total Transactions: {len(payments_df):,}
         return info
     
     def get_growth_metrics(self):
+        try:
+            return self.growth_report()
+        except AnalyticsTimeout as e:
+            return str(e)
+    
+    @cached_report
+    def growth_report(self):
         data_df = self.data_loader.get_dataframe('data')
-        orders_df = self.data_loader.get_dataframe('orders')
         
         if data_df is None:
             return "I don't have access to member data right now."
         
-        created_col = next((c for c in data_df.columns if 'created' in c.lower() and 'at' in c.lower()), None)
+        growth = get_analytics_pool().run(self.data_loader, 'monthly_growth', 6)
         
         info = f"""
 GROWTH METRICS:
@@ -227,32 +483,32 @@ GROWTH METRICS:
 Total Members: {len(data_df):,}
 """
         
-        if created_col:
-            data_df[created_col] = pd.to_datetime(data_df[created_col], errors='coerce')
-            members_by_month = data_df.groupby(data_df[created_col].dt.to_period('M')).size()
-            
+        if growth['members'] is not None:
             info += "\nMEMBER GROWTH (Last 6 Months):\n"
-            for period, count in members_by_month.tail(6).items():
+            for period, count in growth['members'].items():
                 info += f"{period}: +{count} new members\n"
         
-        if orders_df is not None:
-            date_col = next((c for c in orders_df.columns if 'date' in c.lower() and 'created' in c.lower()), None)
-            amount_col = next((c for c in orders_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
-            
-            if date_col and amount_col:
-                orders_df[date_col] = pd.to_datetime(orders_df[date_col], errors='coerce')
-                orders_df[amount_col] = pd.to_numeric(orders_df[amount_col], errors='coerce')
-                revenue_by_month = orders_df.groupby(orders_df[date_col].dt.to_period('M'))[amount_col].sum()
-                
-                info += f"\nREVENUE GROWTH (Last 6 Months):\n"
-                for period, revenue in revenue_by_month.tail(6).items():
-                    info += f"{period}: CAD ${revenue:,.2f}\n"
+        if growth['revenue'] is not None:
+            info += f"\nREVENUE GROWTH (Last 6 Months):\n"
+            for period, revenue in growth['revenue'].items():
+                info += f"{period}: CAD ${revenue:,.2f}\n"
         
         info += "=" * 60
         
         return info
     
     def get_activity_metrics(self):
+        try:
+            return self.activity_report()
+        except AnalyticsTimeout:
+            # Served without the retention section and left uncached, so the next request retries it
+            return self.build_activity_report(None)
+    
+    @cached_report
+    def activity_report(self):
+        return self.build_activity_report(self.data_loader.get_cohort_matrix())
+    
+    def build_activity_report(self, matrix):
         data_df = self.data_loader.get_dataframe('data')
         
         if data_df is None:
@@ -263,12 +519,12 @@ Total Members: {len(data_df):,}
         if activity_col is None:
             return "I don't have activity date information available."
         
-        data_df[activity_col] = pd.to_datetime(data_df[activity_col], errors='coerce')
-        latest_date = data_df[activity_col].max()
+        activity = pd.to_datetime(data_df[activity_col], errors='coerce')
+        latest_date = activity.max()
         
-        active_7d = len(data_df[data_df[activity_col] >= latest_date - pd.Timedelta(days=7)])
-        active_30d = len(data_df[data_df[activity_col] >= latest_date - pd.Timedelta(days=30)])
-        active_90d = len(data_df[data_df[activity_col] >= latest_date - pd.Timedelta(days=90)])
+        active_7d = len(data_df[activity >= latest_date - pd.Timedelta(days=7)])
+        active_30d = len(data_df[activity >= latest_date - pd.Timedelta(days=30)])
+        active_90d = len(data_df[activity >= latest_date - pd.Timedelta(days=90)])
         
         total = len(data_df)
         
@@ -281,16 +537,60 @@ ACTIVE MEMBERS:
 Last 7 days: {active_7d:,} ({(active_7d/total*100):.1f}%)
 Last 30 days: {active_30d:,} ({(active_30d/total*100):.1f}%)
 Last 90 days: {active_90d:,} ({(active_90d/total*100):.1f}%)
-
-RETENTION RATES:
-7-day: {(active_7d/total*100):.1f}%
-30-day: {(active_30d/total*100):.1f}%
-90-day: {(active_90d/total*100):.1f}%
+"""
+        
+        if matrix is not None:
+            curve = matrix.curve('activity')
+            info += "\nRETENTION (members with an order or payment N months after signup):\n"
+            for month in (1, 3, 6, 12):
+                if month < matrix.months and curve[month] == curve[month]:
+                    info += f"Month {month}: {curve[month] * 100:.1f}%\n"
+            info += "Ask for 'cohort retention' to see it by signup month.\n"
+        
+        info += "=" * 60
+        
+        return info
+    
+    def get_cohort_retention(self):
+        try:
+            return self.cohort_report()
+        except AnalyticsTimeout as e:
+            return str(e)
+    
+    @cached_report
+    def cohort_report(self):
+        matrix = self.data_loader.get_cohort_matrix()
+        
+        if matrix is None:
+            return "I need member signup dates plus orders or payments to build cohorts."
+        
+        offsets = [n for n in self.COHORT_OFFSETS if n < matrix.months]
+        info = f"""
+COHORT RETENTION:
 {'=' * 60}
+Members grouped by signup month; each column is the share of the
+cohort with activity N months after joining ("-" = not reached yet).
 """
         
+        for kind, title in (('activity', 'ANY ORDER OR PAYMENT'), ('purchase', 'PAID PURCHASE')):
+            frame = matrix.to_frame(kind, Config.COHORT_REPORT_COHORTS)
+            info += f"\n{title}:\n"
+            info += f"{'Cohort':<9}{'Members':>9}" + ''.join(f"{'M' + str(n):>8}" for n in offsets) + "\n"
+            for cohort, row in frame.iterrows():
+                cells = ''.join(f"{row[f'M{n}'] * 100:>7.1f}%" if row[f'M{n}'] == row[f'M{n}'] else f"{'-':>8}" for n in offsets)
+                info += f"{str(cohort):<9}{int(row['members']):>9,}{cells}\n"
+            
+            curve = matrix.curve(kind)
+            info += f"{'All':<9}{int(matrix.sizes.sum()):>9,}" + ''.join(f"{curve[n] * 100:>7.1f}%" if curve[n] == curve[n] else f"{'-':>8}" for n in offsets) + "\n"
+        
+        info += "=" * 60
+        
+        if self.renderer.target == 'markdown':
+            # Keep the columns aligned in Streamlit
+            return f"```\n{info.strip()}\n```"
         return info
     
+    @cached_report
     def get_member_sources(self):
         data_df = self.data_loader.get_dataframe('data')
         
@@ -314,56 +614,96 @@ RETENTION RATES:
         
         return info
     
+    @cached_report
     def get_payment_analysis(self):
-        payments_df = self.data_loader.get_dataframe('payments')
-        
-        if payments_df is None:
+        if self.data_loader.get_dataframe('payments') is None:
             return "I don't have access to payment data right now."
         
-        method_col = next((c for c in payments_df.columns if 'method' in c.lower()), None)
-        amount_col = next((c for c in payments_df.columns if 'amount' in c.lower() and 'processing' not in c.lower()), None)
-        
-        if method_col is None:
+        methods = self.data_loader.get_payment_mix()
+        if methods is None:
             return "I don't have payment method information available."
         
-        methods = payments_df[method_col].value_counts()
-        
         info = "PAYMENT METHOD ANALYSIS:\n" + "=" * 60 + "\n\n"
         
-        for method, count in methods.items():
-            percentage = (count/len(payments_df))*100
-            
-            if amount_col:
-                payments_df[amount_col] = pd.to_numeric(payments_df[amount_col], errors='coerce')
-                total_amount = payments_df[payments_df[method_col] == method][amount_col].sum()
-                avg_amount = total_amount / count
-                info += f"{method}:\n"
-                info += f"Transactions: {count:,} ({percentage:.1f}%)\n"
-                info += f"Total: CAD ${total_amount:,.2f}\n"
-                info += f"Average: CAD ${avg_amount:.2f}\n\n"
-            else:
-                info += f"{method}: {count:,} transactions ({percentage:.1f}%)\n\n"
+        for row in methods.itertuples():
+            info += f"{row.Index}:\n"
+            info += f"Transactions: {row.transactions:,} ({row.share:.1f}%)\n"
+            info += f"Total: CAD ${row.gross:,.2f}\n"
+            if row.fees:
+                info += f"Fees: CAD ${row.fees:,.2f} | Net: CAD ${row.net:,.2f}\n"
+            info += f"Average: CAD ${row.average:.2f}\n\n"
         
         info += "=" * 60
         
         return info
     
+    def window_for(self, query):
+        """Date window named in the query, relative to the last day in the data, or None"""
+        cube = self.data_loader.metrics_cube
+        return resolve_window(query, cube.latest()) if cube is not None else None
+    
+    def get_window_metrics(self, window):
+        cube = self.data_loader.metrics_cube
+        if cube is None:
+            return "I don't have dated data to answer that."
+        
+        current, previous = cube.compare(window)
+        
+        title = f"BUSINESS METRICS FOR {window['label'].upper()}"
+        if previous is not None:
+            title += f" VS {window['compare']['label'].upper()}"
+        
+        info = f"""
+{title}:
+{'=' * 60}
+Period: {window['start']:%Y-%m-%d} to {window['end']:%Y-%m-%d}
+"""
+        if previous is not None:
+            info += f"Compared with: {window['compare']['start']:%Y-%m-%d} to {window['compare']['end']:%Y-%m-%d}\n"
+        info += "\n"
+        
+        rows = [
+            ("New Members", 'new_members', False),
+            ("Members Last Active", 'active_members', False),
+            ("Orders", 'orders', False),
+            ("Paid Orders", 'paid', False),
+            ("Order Revenue", 'revenue', True),
+            ("Payments Collected", 'payment_amount', True),
+        ]
+        for label, key, money in rows:
+            value = f"CAD ${current[key]:,.2f}" if money else f"{current[key]:,.0f}"
+            if previous is None:
+                info += f"{label}: {value}\n"
+            else:
+                before = f"CAD ${previous[key]:,.2f}" if money else f"{previous[key]:,.0f}"
+                info += f"{label}: {value} vs {before} ({percent_change(current[key], previous[key])})\n"
+        
+        info += "=" * 60
+        return info
+    
     def get_top_members(self, limit=10):
-        top_members = self.data_loader.get_top_members_by_spending(limit)
+        try:
+            top_members = self.data_loader.get_top_members_by_spending(limit)
+        except AnalyticsTimeout as e:
+            return str(e)
         
         if top_members is None:
             return "I couldn't retrieve the top members data right now."
         
         info = f"TOP {limit} MEMBERS BY REVENUE:\n{'=' * 60}\n\n"
         
-        for idx, row in top_members.iterrows():
-            info += f"{idx + 1}. {row['email']}\n"
-            info += f"   Orders: {int(row['order_count'])} | Revenue: CAD ${row['total_spent']:,.2f}\n\n"
+        info += self.renderer.render(
+            top_members,
+            "{rank}. {email}\n   Orders: {orders:.0f} | Revenue: CAD ${revenue:,.2f}\n\n",
+            {'email': 'email'},
+            amounts={'orders': 'order_count', 'revenue': 'total_spent'}
+        )
         
         info += "=" * 60
         
         return info
     
+    @cached_report
     def build_comprehensive_context(self):
         stats = self.data_loader.get_summary_stats()
         data_df = self.data_loader.get_dataframe('data')
@@ -380,9 +720,9 @@ MEMBERS:
         if data_df is not None:
             activity_col = next((c for c in data_df.columns if 'activity' in c.lower() and 'date' in c.lower()), None)
             if activity_col:
-                data_df[activity_col] = pd.to_datetime(data_df[activity_col], errors='coerce')
-                latest_date = data_df[activity_col].max()
-                active_30d = len(data_df[data_df[activity_col] >= latest_date - pd.Timedelta(days=30)])
+                activity = pd.to_datetime(data_df[activity_col], errors='coerce')
+                latest_date = activity.max()
+                active_30d = len(data_df[activity >= latest_date - pd.Timedelta(days=30)])
                 context += f"- Active (30 days): {active_30d:,}\n"
             
             source_col = next((c for c in data_df.columns if 'source' in c.lower()), None)
@@ -404,8 +744,7 @@ REVENUE:
         if orders_df is not None:
             amount_col = next((c for c in orders_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
             if amount_col:
-                orders_df[amount_col] = pd.to_numeric(orders_df[amount_col], errors='coerce')
-                avg_order = orders_df[amount_col].mean()
+                avg_order = pd.to_numeric(orders_df[amount_col], errors='coerce').mean()
                 context += f"- Average Order Value: CAD ${avg_order:.2f}\n"
         
         if payments_df is not None:
@@ -417,6 +756,29 @@ REVENUE:
         return context
     
     def intelligent_response(self, query):
+        return run_sync(self.intelligent_response_async(query))
+    
+    async def intelligent_response_async(self, query):
+        if self.gemini.is_offline():
+            return await asyncio.to_thread(self.offline_response, query)
+        
+        context = await asyncio.to_thread(self.build_response_context, query)
+        return await self.gemini.get_response(
+            query, context,
+            data_version=self.data_loader.data_version,
+            history=self.conversation_history.context(),
+            fallback=lambda: self.degraded_response(query)
+        )
+    
+    def degraded_response(self, query):
+        """Local answer used when the LLM is unreachable"""
+        return "The AI assistant is temporarily unavailable, so here is the latest data summary instead:\n" + self.offline_response(query)
+    
+    def offline_response(self, query):
+        """Templated answer for questions no local handler covers"""
+        return self.get_comprehensive_insights()
+    
+    def build_response_context(self, query):
         context_data = self.build_comprehensive_context()
         
         context = f"""You are a data analyst for a gym management system. Provide insights based on this data:
@@ -427,4 +789,4 @@ User question: "{query}"
 
 Analyze the data, identify trends, and provide actionable insights. Be conversational, specific, and data-driven. If you need more information to give a better answer, ask the user."""
         
-        return self.gemini.get_response(query, context)
\ No newline at end of file
+        return context
\ No newline at end of file
@@ -0,0 +1,106 @@
+import re
+import threading
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    """Lowercase word tokens with light suffix stripping, plus adjacent bigrams"""
+    words = []
+    for word in TOKEN_PATTERN.findall(str(text).lower()):
+        for suffix in ('ing', 'ed', 'es', 's'):
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        words.append(word)
+    
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+class IntentClassifier:
+    """Local intent classifier: ordered keyword rules, then TF-IDF + softmax regression.
+
+    intents maps each intent name to the one-line description used in the LLM
+    prompt; those descriptions double as training sentences alongside any extra
+    examples. rules is an ordered list of (regex, intent) pairs, and the first
+    matching rule wins with rule_confidence.
+    """
+    
+    def __init__(self, intents, examples=None, rules=None, rule_confidence=0.9,
+                 epochs=500, learning_rate=2.0, l2=1e-4):
+        self.labels = list(intents)
+        self.rules = [(re.compile(pattern, re.IGNORECASE), intent) for pattern, intent in (rules or [])]
+        self.rule_confidence = rule_confidence
+        
+        texts, targets = [], []
+        for index, intent in enumerate(self.labels):
+            samples = [intent.replace('_', ' '), intents[intent]] + list((examples or {}).get(intent, []))
+            texts.extend(samples)
+            targets.extend([index] * len(samples))
+        
+        self.vocabulary = {}
+        for text in texts:
+            for token in set(tokenize(text)):
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+        
+        document_frequency = np.zeros(len(self.vocabulary))
+        for text in texts:
+            for token in set(tokenize(text)):
+                document_frequency[self.vocabulary[token]] += 1
+        self.idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+        
+        X = np.vstack([self.vectorize(text) for text in texts])
+        Y = np.eye(len(self.labels))[targets]
+        self.weights, self.bias = self._train(X, Y, epochs, learning_rate, l2)
+    
+    def vectorize(self, text):
+        vector = np.zeros(len(self.vocabulary))
+        for token in tokenize(text):
+            index = self.vocabulary.get(token)
+            if index is not None:
+                vector[index] += 1
+        
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    @staticmethod
+    def _softmax(scores):
+        scores = scores - scores.max(axis=-1, keepdims=True)
+        exp = np.exp(scores)
+        return exp / exp.sum(axis=-1, keepdims=True)
+    
+    def _train(self, X, Y, epochs, learning_rate, l2):
+        weights = np.zeros((X.shape[1], Y.shape[1]))
+        bias = np.zeros(Y.shape[1])
+        
+        for _ in range(epochs):
+            gradient = (self._softmax(X @ weights + bias) - Y) / len(X)
+            weights -= learning_rate * (X.T @ gradient + l2 * weights)
+            bias -= learning_rate * gradient.sum(axis=0)
+        
+        return weights, bias
+    
+    def predict_proba(self, text):
+        """Return {intent: probability} from the linear model alone"""
+        probabilities = self._softmax(self.vectorize(text) @ self.weights + self.bias)
+        return dict(zip(self.labels, probabilities.tolist()))
+    
+    def classify(self, text):
+        """Return (intent, confidence) for a user query"""
+        for pattern, intent in self.rules:
+            if pattern.search(text):
+                return intent, self.rule_confidence
+        
+        probabilities = self._softmax(self.vectorize(text) @ self.weights + self.bias)
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+def get_intent_classifier(name, intents, examples=None, rules=None):
+    """Build each bot's classifier once per process and share it across sessions"""
+    with _classifiers_lock:
+        if name not in _classifiers:
+            _classifiers[name] = IntentClassifier(intents, examples, rules)
+        return _classifiers[name]
\ No newline at end of file
@@ -0,0 +1,213 @@
+import csv
+import io
+import json
+import threading
+import time
+from collections import deque
+import numpy as np
+from config import Config
+
+RECORD_FIELDS = [
+    'timestamp', 'bot', 'phase', 'model', 'outcome', 'status', 'wall_time', 'ttfb',
+    'retries', 'prompt_tokens', 'completion_tokens', 'cache_hit', 'coalesced', 'streamed', 'hedged',
+]
+
+class LLMMetrics:
+    """Rolling window of per-call LLM measurements with percentile summaries.
+
+    Every OpenRouter call (cache hits included) is recorded once, when it
+    finishes. Summaries are computed over the last `window` calls.
+    """
+    
+    def __init__(self, window=None):
+        self.records = deque(maxlen=window or Config.LLM_METRICS_WINDOW)
+        self.lock = threading.Lock()
+        self.total_calls = 0
+    
+    def start(self, bot, phase, model):
+        """Open a record for one call; the client fills it in as the call progresses"""
+        return {
+            'bot': bot,
+            'phase': phase,
+            'model': model,
+            'outcome': 'ok',
+            'status': None,
+            'ttfb': None,
+            'retries': 0,
+            'prompt_tokens': None,
+            'completion_tokens': None,
+            'cache_hit': False,
+            'coalesced': False,
+            'streamed': False,
+            'hedged': False,
+            'started': time.perf_counter(),
+        }
+    
+    def finish(self, call, outcome=None):
+        if outcome is not None:
+            call['outcome'] = outcome
+        
+        record = {field: call.get(field) for field in RECORD_FIELDS}
+        record['timestamp'] = time.time()
+        record['wall_time'] = time.perf_counter() - call['started']
+        
+        with self.lock:
+            self.records.append(record)
+            self.total_calls += 1
+        return record
+    
+    def get_records(self):
+        with self.lock:
+            return list(self.records)
+    
+    @staticmethod
+    def percentiles(values):
+        values = [v for v in values if v is not None]
+        if not values:
+            return {'p50': None, 'p95': None, 'p99': None}
+        
+        p50, p95, p99 = np.percentile(np.array(values, dtype=float), [50, 95, 99])
+        return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+    
+    def summarize(self, records):
+        # Cache hits and coalesced waits say nothing about upstream latency
+        upstream = [r for r in records if not r['cache_hit'] and not r['coalesced']]
+        wall = self.percentiles([r['wall_time'] for r in upstream])
+        ttfb = self.percentiles([r['ttfb'] for r in upstream])
+        
+        return {
+            'calls': len(records),
+            'upstream_calls': len(upstream),
+            'cache_hits': sum(1 for r in records if r['cache_hit']),
+            'coalesced': sum(1 for r in records if r['coalesced']),
+            'errors': sum(1 for r in records if r['outcome'] != 'ok'),
+            'hedged': sum(1 for r in records if r.get('hedged')),
+            'retries': sum(r['retries'] or 0 for r in records),
+            'prompt_tokens': sum(r['prompt_tokens'] or 0 for r in records),
+            'completion_tokens': sum(r['completion_tokens'] or 0 for r in records),
+            'wall_p50': wall['p50'],
+            'wall_p95': wall['p95'],
+            'wall_p99': wall['p99'],
+            'ttfb_p50': ttfb['p50'],
+            'ttfb_p95': ttfb['p95'],
+            'ttfb_p99': ttfb['p99'],
+        }
+    
+    def get_summary(self):
+        """Summary rows: one overall, then one per (bot, phase)"""
+        records = self.get_records()
+        
+        groups = {}
+        for record in records:
+            groups.setdefault((record['bot'] or '-', record['phase'] or '-'), []).append(record)
+        
+        rows = [dict(bot='all', phase='all', **self.summarize(records))]
+        for (bot, phase), group in sorted(groups.items()):
+            rows.append(dict(bot=bot, phase=phase, **self.summarize(group)))
+        return rows
+    
+    def format_summary(self):
+        """Plain-text table for the CLI stats screen"""
+        rows = self.get_summary()
+        if not rows[0]['calls']:
+            return "No LLM calls recorded yet."
+        
+        def ms(value):
+            return f"{value * 1000:,.0f}" if value is not None else "-"
+        
+        lines = [f"{'Bot/Phase':<20}{'Calls':>7}{'Hits':>6}{'Err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'TTFB p50':>10}{'Tokens':>9}"]
+        for row in rows:
+            tokens = row['prompt_tokens'] + row['completion_tokens']
+            lines.append(
+                f"{row['bot'] + '/' + row['phase']:<20}{row['calls']:>7}{row['cache_hits']:>6}{row['errors']:>5}"
+                f"{ms(row['wall_p50']):>9}{ms(row['wall_p95']):>9}{ms(row['wall_p99']):>9}{ms(row['ttfb_p50']):>10}{tokens:>9,}"
+            )
+        return '\n'.join(lines)
+    
+    def export_text(self, fmt='jsonl'):
+        records = self.get_records()
+        
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=RECORD_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+            return buffer.getvalue()
+        
+        return ''.join(json.dumps(record) + '\n' for record in records)
+    
+    def export(self, path=None):
+        """Write the current window to path (.csv or JSON lines) and return the path"""
+        path = str(path or Config.LLM_METRICS_FILE)
+        fmt = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(self.export_text(fmt))
+        return path
+    
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+class ModelLatencyTracker:
+    """Recent upstream latency per (model, phase), used to time hedged requests"""
+    
+    def __init__(self, window=200):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+    
+    def observe(self, model, phase, seconds):
+        if seconds is None:
+            return
+        with self.lock:
+            self.samples.setdefault((model, phase), deque(maxlen=self.window)).append(seconds)
+    
+    def percentile(self, model, phase, q):
+        with self.lock:
+            samples = list(self.samples.get((model, phase), ()))
+        if not samples:
+            return None
+        return float(np.percentile(np.array(samples, dtype=float), q))
+    
+    def hedge_delay(self, model, phase):
+        """Seconds to wait on model before hedging: its observed p95 once there is enough history"""
+        with self.lock:
+            count = len(self.samples.get((model, phase), ()))
+        if count < Config.HEDGE_MIN_SAMPLES:
+            return Config.HEDGE_DEFAULT_DELAY
+        return max(Config.HEDGE_MIN_DELAY, self.percentile(model, phase, 95))
+    
+    def get_summary(self):
+        with self.lock:
+            keys = sorted(self.samples)
+        
+        rows = []
+        for model, phase in keys:
+            rows.append({
+                'model': model,
+                'phase': phase,
+                'samples': len(self.samples[(model, phase)]),
+                'p50': self.percentile(model, phase, 50),
+                'p95': self.percentile(model, phase, 95),
+            })
+        return rows
+
+_shared_metrics = None
+_shared_latency = None
+_shared_lock = threading.Lock()
+
+def get_llm_metrics():
+    """Return the process-wide metrics window shared by every client"""
+    global _shared_metrics
+    with _shared_lock:
+        if _shared_metrics is None:
+            _shared_metrics = LLMMetrics()
+        return _shared_metrics
+
+def get_model_latency():
+    """Return the process-wide per-model latency tracker"""
+    global _shared_latency
+    with _shared_lock:
+        if _shared_latency is None:
+            _shared_latency = ModelLatencyTracker()
+        return _shared_latency
\ No newline at end of file
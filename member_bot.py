@@ -1,14 +1,57 @@
-from gemini_bot import GeminiBot
+from openrouter_bot import AsyncOpenRouterBot
+from async_runner import run_sync
+from config import Config
+from intent_classifier import get_intent_classifier
+from structured_routing import build_routing_prompt, empty_route, merge_route, parse_route
+from prefetch import Prefetch
+from conversation_state import ConversationState
+from row_renderer import RowRenderer
+from result_cursor import PagedReply, ResultCursor, is_more_request
 from data_loader import DataLoader
 import pandas as pd
+import asyncio
+import json
 import re
 
+MEMBER_INTENTS = {
+    'search_member': 'User wants to find/search for a member',
+    'contact_info': 'User wants contact details (email, phone)',
+    'activity_info': 'User wants to know about member activity or last login',
+    'payment_info': 'User wants payment/spending information',
+    'order_info': 'User wants order/purchase information',
+    'general_question': 'General question about current member',
+}
+
+MEMBER_INTENT_EXAMPLES = {
+    'search_member': ['find john smith', 'search for member sarah', 'look up jane doe', 'who is mike', 'show member M-1024'],
+    'contact_info': ['what is their email', 'give me the phone number', 'how can I reach them', 'contact details please'],
+    'activity_info': ['when did they last visit', 'last login date', 'when did she join', 'is he still active'],
+    'payment_info': ['how much have they paid', 'show payments', 'total spending', 'payment history'],
+    'order_info': ['what did they buy', 'show their orders', 'purchase history', 'list orders'],
+    'general_question': ['tell me about this member', 'anything else I should know', 'summarize this person'],
+}
+
+# Ordered: the first matching rule wins
+MEMBER_INTENT_RULES = [
+    (r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', 'search_member'),
+    (r'\bM-\d+\b', 'search_member'),
+    (r'\b(payments?|paid|pays?|spen[dt]|spending|transactions?)\b', 'payment_info'),
+    (r'\b(orders?|purchases?|purchased|bought|buy)\b', 'order_info'),
+    (r'\b(contact|e-?mail|phone|reach|call)\b', 'contact_info'),
+    (r'\b(activity|active|last (login|seen|visit)|logged in|joined|sign(ed)? ?up)\b', 'activity_info'),
+    (r'\b(find|search|look ?up|who is)\b', 'search_member'),
+]
+
 class MemberBot:
     def __init__(self, data_loader):
         self.data_loader = data_loader
-        self.gemini = GeminiBot()
+        self.gemini = AsyncOpenRouterBot(caller='member')
+        self.intent_classifier = get_intent_classifier('member', MEMBER_INTENTS, MEMBER_INTENT_EXAMPLES, MEMBER_INTENT_RULES)
         self.current_member = None
-        self.conversation_history = []
+        self.conversation_history = ConversationState()
+        self.prefetch = None
+        self.renderer = RowRenderer()
+        self.cursor = None
     
     def start(self):
         print("\n" + "=" * 60)
@@ -27,11 +70,13 @@ class MemberBot:
             if query.lower() in ['exit', 'quit', 'menu', 'back']:
                 print("Returning to main menu...\n")
                 self.current_member = None
-                self.conversation_history = []
+                self.conversation_history.clear()
                 break
             
-            response = self.process_query(query)
-            print(f"\nBot: {response}\n")
+            print("\nBot: ", end="", flush=True)
+            for chunk in self.process_query_stream(query):
+                print(chunk, end="", flush=True)
+            print("\n")
     
     def extract_member_identifier(self, query):
         email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
@@ -53,66 +98,244 @@ class MemberBot:
         
         return None
     
-    def understand_intent_with_ai(self, query):
-        context = f"""Analyze this user query and determine the intent. Return ONLY the intent name.
+    def format_intent_list(self):
+        return '\n'.join(f"- {name}: {description}" for name, description in MEMBER_INTENTS.items())
+    
+    def build_intent_prompt(self, query):
+        return f"""Analyze this user query and determine the intent. Return ONLY the intent name.
 
 Current member selected: {"Yes - " + str(self.current_member.get('Name', 'Unknown')) if self.current_member is not None else "No"}
 
 Available intents:
-- search_member: User wants to find/search for a member
-- contact_info: User wants contact details (email, phone)
-- activity_info: User wants to know about member activity or last login
-- payment_info: User wants payment/spending information
-- order_info: User wants order/purchase information
-- general_question: General question about current member
+{self.format_intent_list()}
 
 User query: "{query}"
 
 Return only one word - the intent name."""
+    
+    def understand_intent_with_ai(self, query):
+        return run_sync(self.understand_intent_with_ai_async(query))
+    
+    async def understand_intent_with_ai_async(self, query):
+        intent, confidence = self.intent_classifier.classify(query)
+        if confidence >= Config.INTENT_CONFIDENCE_THRESHOLD or self.gemini.is_offline():
+            return intent
+        
+        intent = await self.gemini.get_response(
+            self.build_intent_prompt(query), "",
+            temperature=Config.INTENT_TEMPERATURE,
+            data_version=self.data_loader.data_version,
+            phase='intent',
+            fallback=lambda: intent
+        )
+        return intent.strip().lower()
+    
+    def extract_entities(self, query):
+        """Regex entity extraction for queries routed without the LLM"""
+        entities = empty_route()['entities']
+        entities['member_identifier'] = self.extract_member_identifier(query)
+        return entities
+    
+    def build_routing_prompt(self, query):
+        if self.current_member is not None:
+            state = f"Current member selected: Yes - {self.current_member.get('Name', 'Unknown')}"
+            context = self.build_member_info()
+        else:
+            stats = self.data_loader.get_summary_stats()
+            state = "Current member selected: No"
+            context = f"- Total members: {stats.get('total_members', 0)}\n- Total orders: {stats.get('total_orders', 0)}"
+        
+        return build_routing_prompt(
+            "gym member support assistant",
+            self.format_intent_list(),
+            query,
+            context=context,
+            state=state
+        )
+    
+    def route_query(self, query):
+        return run_sync(self.route_query_async(query))
+    
+    async def route_query_async(self, query):
+        """Resolve intent, entities and possibly the answer with at most one LLM call"""
+        intent, confidence = self.intent_classifier.classify(query)
+        local_route = empty_route(intent)
+        local_route['entities'] = self.extract_entities(query)
+        
+        if confidence >= Config.INTENT_CONFIDENCE_THRESHOLD or self.gemini.is_offline():
+            return local_route
+        
+        if not Config.STRUCTURED_ROUTING:
+            local_route['intent'] = await self.understand_intent_with_ai_async(query)
+            return local_route
+        
+        prompt = await asyncio.to_thread(self.build_routing_prompt, query)
+        reply = await self.gemini.get_response(
+            prompt, "",
+            temperature=Config.INTENT_TEMPERATURE,
+            data_version=self.data_loader.data_version,
+            phase='intent',
+            fallback=lambda: json.dumps(local_route)
+        )
+        
+        return merge_route(parse_route(reply, MEMBER_INTENTS), local_route)
+    
+    def select_handler(self, intent, identifier):
+        """Map an intent to a local handler, or None when the LLM should answer"""
+        if 'search' in intent and identifier:
+            if identifier.upper().startswith('M-'):
+                return lambda: self.handle_member_id_search(identifier)
+            else:
+                return lambda: self.handle_member_search(identifier)
+        
+        # Fixed: Check if current_member is None properly
+        if identifier and self.current_member is None:
+            return lambda: self.handle_member_search(identifier)
+        
+        # Fixed: Check if current_member exists properly
+        if self.current_member is not None:
+            if 'contact' in intent:
+                return self.get_contact_info
+            
+            if 'activity' in intent:
+                return self.get_member_activity
+            
+            if 'payment' in intent:
+                return self.get_member_payments
+            
+            if 'order' in intent or 'purchase' in intent:
+                return self.get_member_orders
         
-        intent = self.gemini.get_response(context, "").strip().lower()
-        return intent
+        # General questions fall through to intelligent_response, which
+        # answers with the selected member's context when there is one
+        return None
+    
+    def current_member_email(self):
+        if self.current_member is None:
+            return None
+        
+        data_df = self.data_loader.get_dataframe('data')
+        email_col = next((c for c in data_df.columns if 'email' in c.lower()), None) if data_df is not None else None
+        email = self.current_member.get(email_col) if email_col else None
+        return str(email) if email is not None and pd.notna(email) and email else None
+    
+    def start_prefetch(self, query):
+        """Begin the member lookups this query will probably need while routing is in flight"""
+        prefetch = Prefetch()
+        
+        # A confident local route (or offline mode) makes no network call to hide the work behind
+        if self.intent_classifier.classify(query)[1] >= Config.INTENT_CONFIDENCE_THRESHOLD or self.gemini.is_offline():
+            return prefetch
+        
+        identifier = self.extract_member_identifier(query)
+        if identifier and not identifier.upper().startswith('M-'):
+            prefetch.submit(('search', identifier), self.data_loader.search_member, identifier)
+        
+        # A follow-up about the selected member usually wants their orders or payments
+        email = self.current_member_email()
+        if email:
+            prefetch.submit(('orders', email), self.data_loader.get_member_orders, email)
+            prefetch.submit(('payments', email), self.data_loader.get_member_payments, email)
+        
+        return prefetch
+    
+    def fetch_data(self, key, fn, *args):
+        """fn(*args), served from this turn's prefetch when it was speculated"""
+        prefetch = self.prefetch
+        if prefetch is not None:
+            return prefetch.get(key, fn, *args)
+        return fn(*args)
     
     def process_query(self, query):
+        return run_sync(self.process_query_async(query))
+    
+    def next_page(self, query):
+        """The next page of the last listed results when the query asks for more, else None"""
+        if self.cursor is None or not is_more_request(query):
+            return None
+        return self.cursor.next_page(self.data_loader.data_version)
+    
+    def keep_cursor(self, reply):
+        """Remember the cursor of the reply being sent, if it is a paged list"""
+        self.cursor = getattr(reply, 'cursor', None)
+        return reply
+    
+    async def process_query_async(self, query):
+        reply = await self.answer_async(query)
+        self.conversation_history.record(query, reply)
+        return reply
+    
+    def process_query_stream(self, query):
+        """Like process_query, but yields the reply in chunks as the LLM produces it"""
+        yield from self.conversation_history.record_stream(query, self.answer_stream(query))
+    
+    async def answer_async(self, query):
+        page = self.next_page(query)
+        if page is not None:
+            return page
+        
+        # Only the list this turn sends (if any) can be paged on the next one
+        self.cursor = None
+        self.prefetch = self.start_prefetch(query)
         try:
-            self.conversation_history.append(query)
+            route = await self.route_query_async(query)
             
-            identifier = self.extract_member_identifier(query)
-            intent = self.understand_intent_with_ai(query)
+            handler = self.select_handler(route['intent'], route['entities']['member_identifier'])
+            if handler is not None:
+                return self.keep_cursor(await asyncio.to_thread(handler))
             
-            if 'search' in intent and identifier:
-                if identifier.upper().startswith('M-'):
-                    return self.handle_member_id_search(identifier)
-                else:
-                    return self.handle_member_search(identifier)
+            if route['answer']:
+                return route['answer']
             
-            # Fixed: Check if current_member is None properly
-            if identifier and self.current_member is None:
-                return self.handle_member_search(identifier)
+            return await self.intelligent_response_async(query)
+        except Exception as e:
+            import traceback
+            print(f"\nError in process_query: {str(e)}")
+            print(f"Traceback:\n{traceback.format_exc()}")
+            return f"I encountered an error processing your request: {str(e)}"
+        finally:
+            self.prefetch.close()
+            self.prefetch = None
+    
+    def answer_stream(self, query):
+        page = self.next_page(query)
+        if page is not None:
+            yield page
+            return
+        
+        # Only the list this turn sends (if any) can be paged on the next one
+        self.cursor = None
+        self.prefetch = self.start_prefetch(query)
+        try:
+            route = self.route_query(query)
+            
+            handler = self.select_handler(route['intent'], route['entities']['member_identifier'])
+            if handler is not None:
+                yield self.keep_cursor(handler())
+                return
             
-            # Fixed: Check if current_member exists properly
-            if self.current_member is not None:
-                if 'contact' in intent:
-                    return self.get_contact_info()
-                
-                if 'activity' in intent:
-                    return self.get_member_activity()
-                
-                if 'payment' in intent:
-                    return self.get_member_payments()
-                
-                if 'order' in intent or 'purchase' in intent:
-                    return self.get_member_orders()
-                
-                if 'general' in intent:
-                    return self.answer_with_context(query)
+            if route['answer']:
+                yield route['answer']
+                return
             
-            return self.intelligent_response(query)
+            if self.gemini.is_offline():
+                yield self.offline_response(query)
+                return
+            
+            yield from self.gemini.stream_response(
+                query, self.build_response_context(query),
+                data_version=self.data_loader.data_version,
+                history=self.conversation_history.context(),
+                fallback=lambda: self.degraded_response(query)
+            )
         except Exception as e:
             import traceback
             print(f"\nError in process_query: {str(e)}")
             print(f"Traceback:\n{traceback.format_exc()}")
-            return f"I encountered an error processing your request: {str(e)}"
+            yield f"I encountered an error processing your request: {str(e)}"
+        finally:
+            self.prefetch.close()
+            self.prefetch = None
     
     def handle_member_id_search(self, member_id):
         data_df = self.data_loader.get_dataframe('data')
@@ -133,35 +356,45 @@ Return only one word - the intent name."""
         return self.display_member_info(self.current_member)
     
     def handle_member_search(self, identifier):
-        results = self.data_loader.search_member(identifier)
+        results = self.fetch_data(('search', identifier), self.data_loader.search_member, identifier)
         
         if results is None or len(results) == 0:
             return f"I couldn't find any member matching '{identifier}'. Could you provide more details?"
         
-        if len(results) == 1:
+        # A fuzzy match is only a guess, so it is listed for the user to pick rather than selected
+        if len(results) == 1 and not results.attrs.get('fuzzy'):
             self.current_member = results.iloc[0]
             return self.display_member_info(self.current_member)
         
         return self.format_multiple_results(results, identifier)
     
     def format_multiple_results(self, results, query):
-        response = f"I found {len(results)} members matching '{query}':\n\n"
+        if results.attrs.get('fuzzy'):
+            response = f"I couldn't find an exact match for '{query}'. " + ("These are the closest:\n\n" if len(results) > 1 else "Did you mean:\n\n")
+        else:
+            response = f"I found {len(results)} members matching '{query}':\n\n"
         
         name_col = next((c for c in results.columns if 'name' in c.lower()), None)
         email_col = next((c for c in results.columns if 'email' in c.lower()), None)
         id_col = next((c for c in results.columns if 'member' in c.lower() and 'id' in c.lower()), None)
         
-        for idx, row in results.head(5).iterrows():
-            name = str(row[name_col]) if name_col and pd.notna(row[name_col]) else 'Unknown'
-            email = str(row[email_col]) if email_col and pd.notna(row[email_col]) else 'No email'
-            member_id = str(row[id_col]) if id_col and pd.notna(row[id_col]) else 'N/A'
-            response += f"{name} ({email}) - ID: {member_id}\n"
-        
-        if len(results) > 5:
-            response += f"\n... and {len(results) - 5} more\n"
+        cursor = ResultCursor.over(
+            results,
+            lambda rows: self.renderer.render(
+                rows,
+                "{name} ({email}) - ID: {member_id}\n",
+                {'name': name_col, 'email': email_col, 'member_id': id_col},
+                defaults={'name': 'Unknown', 'email': 'No email'}
+            ),
+            'members', page_size=5, data_version=self.data_loader.data_version
+        )
+        response += cursor.first_page()
         
-        response += "\nWhich one would you like to know about?"
-        return response
+        if len(results) == 1:
+            response += "\nIf that's who you meant, tell me their full name, email or ID to look them up."
+        else:
+            response += "\nWhich one would you like to know about?"
+        return PagedReply(response, cursor)
     
     def display_member_info(self, member):
         data_df = self.data_loader.get_dataframe('data')
@@ -186,6 +419,10 @@ Return only one word - the intent name."""
         
         phone_display = phone if phone and phone != '' else 'Not available'
         
+        profile = self.data_loader.get_member_profile(email if email != 'N/A' else None) or {}
+        order_count = profile.get('order_count', 0)
+        spent = f" (CAD ${profile.get('total_spent', 0):,.2f} spent)" if order_count else ""
+        
         info = f"""
 MEMBER INFORMATION:
 {'=' * 60}
@@ -196,6 +433,7 @@ Phone: {phone_display}
 Joined: {created}
 Last Activity: {last_activity}
 Source: {source}
+Orders: {order_count}{spent}
 {'=' * 60}
 
 What would you like to know about {name}?
@@ -249,24 +487,18 @@ Acquisition Source: {source}
         name_col = next((c for c in data_df.columns if 'name' in c.lower()), None)
         name = str(self.current_member.get(name_col, email)) if name_col else str(email)
         
-        payments = self.data_loader.get_member_payments(str(email))
+        profile = self.data_loader.get_member_profile(email) or {}
+        payment_count = profile.get('payment_count', 0)
         
-        if payments is None or len(payments) == 0:
+        if not payment_count:
             return f"{name} hasn't made any payments yet."
         
-        # Create a copy to avoid warnings
-        payments_copy = payments.copy()
+        total_paid = profile.get('total_paid', 0)
         
+        # Only this member's rows are read from the payments table; the cursor pages through them
+        payments_copy = self.fetch_data(('payments', str(email)), self.data_loader.get_member_payments, str(email))
         amount_col = next((c for c in payments_copy.columns if 'amount' in c.lower() and 'processing' not in c.lower()), None)
         
-        if amount_col:
-            payments_copy[amount_col] = pd.to_numeric(payments_copy[amount_col], errors='coerce')
-            total_paid = payments_copy[amount_col].sum()
-        else:
-            total_paid = 0
-        
-        payment_count = len(payments_copy)
-        
         info = f"""
 PAYMENT SUMMARY FOR {name.upper()}:
 {'=' * 60}
@@ -281,29 +513,19 @@ RECENT PAYMENTS:
         status_col = next((c for c in payments_copy.columns if 'status' in c.lower()), None)
         method_col = next((c for c in payments_copy.columns if 'method' in c.lower()), None)
         
-        for idx, payment in payments_copy.head(5).iterrows():
-            date_val = str(payment.get(date_col, 'N/A')) if date_col and pd.notna(payment.get(date_col)) else 'N/A'
-            status_val = str(payment.get(status_col, 'N/A')) if status_col and pd.notna(payment.get(status_col)) else 'N/A'
-            method_val = str(payment.get(method_col, 'N/A')) if method_col and pd.notna(payment.get(method_col)) else 'N/A'
-            
-            # Safe amount retrieval
-            if amount_col:
-                try:
-                    amount_val = pd.to_numeric(payment.get(amount_col, 0), errors='coerce')
-                    if pd.isna(amount_val):
-                        amount_val = 0
-                except:
-                    amount_val = 0
-            else:
-                amount_val = 0
-            
-            info += f"\n{date_val} - CAD ${amount_val:.2f}"
-            info += f"\nStatus: {status_val}, Method: {method_val}\n"
-        
-        if len(payments_copy) > 5:
-            info += f"\n... and {len(payments_copy) - 5} more payments"
-        
-        return info
+        cursor = ResultCursor.over(
+            payments_copy,
+            lambda rows: self.renderer.render(
+                rows,
+                "\n{date} - CAD ${amount:.2f}\nStatus: {status}, Method: {method}\n",
+                {'date': date_col, 'status': status_col, 'method': method_col},
+                amounts={'amount': amount_col}
+            ),
+            'payments', page_size=5, data_version=self.data_loader.data_version
+        )
+        info += cursor.first_page()
+        
+        return PagedReply(info, cursor)
     
     def get_member_orders(self):
         if self.current_member is None:
@@ -322,29 +544,20 @@ RECENT PAYMENTS:
         name_col = next((c for c in data_df.columns if 'name' in c.lower()), None)
         name = str(self.current_member.get(name_col, email)) if name_col else str(email)
         
-        orders = self.data_loader.get_member_orders(str(email))
+        profile = self.data_loader.get_member_profile(email) or {}
+        total_orders = profile.get('order_count', 0)
         
-        if orders is None or len(orders) == 0:
+        if not total_orders:
             return f"{name} hasn't placed any orders yet."
         
-        total_orders = len(orders)
+        paid_orders = profile.get('paid_count', 0)
+        total_spent = profile.get('total_spent', 0)
         
+        # Only this member's rows are read from the orders table; the cursor pages through them
+        orders = self.fetch_data(('orders', str(email)), self.data_loader.get_member_orders, str(email))
         status_col = next((c for c in orders.columns if 'status' in c.lower() and 'payment' in c.lower()), None)
-        # Fixed: Safe boolean comparison
-        if status_col:
-            paid_orders = (orders[status_col].astype(str) == 'Paid').sum()
-        else:
-            paid_orders = 0
-        
         amount_col = next((c for c in orders.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
         
-        if amount_col:
-            orders_copy = orders.copy()
-            orders_copy[amount_col] = pd.to_numeric(orders_copy[amount_col], errors='coerce')
-            total_spent = orders_copy[amount_col].sum()
-        else:
-            total_spent = 0
-        
         info = f"""
 ORDER SUMMARY FOR {name.upper()}:
 {'=' * 60}
@@ -359,29 +572,19 @@ RECENT ORDERS:
         order_num_col = next((c for c in orders.columns if 'order' in c.lower() and 'number' in c.lower()), None)
         date_col = next((c for c in orders.columns if 'date' in c.lower() and 'created' in c.lower()), None)
         
-        for idx, order in orders.head(5).iterrows():
-            order_num = str(order.get(order_num_col, 'N/A')) if order_num_col else 'N/A'
-            date_val = str(order.get(date_col, 'N/A')) if date_col else 'N/A'
-            status_val = str(order.get(status_col, 'N/A')) if status_col else 'N/A'
-            
-            # Safe amount retrieval
-            if amount_col:
-                try:
-                    amount_val = pd.to_numeric(order.get(amount_col, 0), errors='coerce')
-                    if pd.isna(amount_val):
-                        amount_val = 0
-                except:
-                    amount_val = 0
-            else:
-                amount_val = 0
-            
-            info += f"\nOrder #{order_num} - {date_val}"
-            info += f"\nStatus: {status_val}, Amount: CAD ${amount_val:.2f}\n"
-        
-        if len(orders) > 5:
-            info += f"\n... and {len(orders) - 5} more orders"
-        
-        return info
+        cursor = ResultCursor.over(
+            orders,
+            lambda rows: self.renderer.render(
+                rows,
+                "\nOrder #{order} - {date}\nStatus: {status}, Amount: CAD ${amount:.2f}\n",
+                {'order': order_num_col, 'date': date_col, 'status': status_col},
+                amounts={'amount': amount_col}
+            ),
+            'orders', page_size=5, data_version=self.data_loader.data_version
+        )
+        info += cursor.first_page()
+        
+        return PagedReply(info, cursor)
     
     def get_contact_info(self):
         if self.current_member is None:
@@ -416,8 +619,43 @@ Member ID: {member_id}
 """
     
     def intelligent_response(self, query):
+        return run_sync(self.intelligent_response_async(query))
+    
+    async def intelligent_response_async(self, query):
+        if self.gemini.is_offline():
+            return await asyncio.to_thread(self.offline_response, query)
+        
+        if self.current_member is not None:
+            return await self.answer_with_context_async(query)
+        
+        context = await asyncio.to_thread(self.build_response_context, query)
+        return await self.gemini.get_response(
+            query, context,
+            data_version=self.data_loader.data_version,
+            history=self.conversation_history.context(),
+            fallback=lambda: self.degraded_response(query)
+        )
+    
+    def degraded_response(self, query):
+        """Local answer used when the LLM is unreachable"""
         if self.current_member is not None:
-            return self.answer_with_context(query)
+            return "The AI assistant is temporarily unavailable, so here is the latest data summary instead:\n" + self.offline_response(query)
+        
+        return ("The AI assistant is temporarily unavailable. "
+                "Please tell me the member's name, email, or ID and I'll look them up.")
+    
+    def offline_response(self, query):
+        """Templated answer for questions no local handler covers"""
+        if self.current_member is not None:
+            return self.display_member_info(self.current_member)
+        
+        stats = self.data_loader.get_summary_stats()
+        return (f"I can look up any of our {stats.get('total_members', 0):,} members. "
+                "Please tell me the member's name, email, or ID.")
+    
+    def build_response_context(self, query):
+        if self.current_member is not None:
+            return self.build_member_context(query)
         
         stats = self.data_loader.get_summary_stats()
         
@@ -435,71 +673,68 @@ If they're asking about a specific member, politely ask them to provide the memb
 If they're asking general questions about members, answer based on the stats provided.
 Be conversational and helpful."""
         
-        return self.gemini.get_response(query, context)
+        return context
     
     def answer_with_context(self, query):
+        return run_sync(self.answer_with_context_async(query))
+    
+    async def answer_with_context_async(self, query):
         try:
-            data_df = self.data_loader.get_dataframe('data')
-            cols = data_df.columns.tolist()
-            
-            def safe_get(key, default='N/A'):
-                val = self.current_member.get(key)
-                return str(val) if pd.notna(val) and val else default
-            
-            member_info = f"Current Member: {safe_get('Name', 'Unknown')}\n"
-            for col in cols[:10]:
-                value = safe_get(col)
-                if value and value != 'N/A' and value != '':
-                    member_info += f"- {col}: {value}\n"
-            
-            email_col = next((c for c in data_df.columns if 'email' in c.lower()), None)
-            if email_col:
-                email = self.current_member.get(email_col)
-                if pd.notna(email) and email:
-                    email_str = str(email)
-                    
-                    # Get orders safely
-                    try:
-                        orders = self.data_loader.get_member_orders(email_str)
-                        if orders is not None and len(orders) > 0:
-                            member_info += f"\n- Total Orders: {len(orders)}"
-                            
-                            amount_col = next((c for c in orders.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
-                            if amount_col:
-                                orders_copy = orders.copy()
-                                orders_copy[amount_col] = pd.to_numeric(orders_copy[amount_col], errors='coerce')
-                                total_spent = orders_copy[amount_col].sum()
-                                member_info += f"\n- Total Spent: CAD ${total_spent:.2f}"
-                    except Exception as e:
-                        print(f"Error getting orders: {e}")
-                    
-                    # Get payments safely
-                    try:
-                        payments = self.data_loader.get_member_payments(email_str)
-                        if payments is not None and len(payments) > 0:
-                            member_info += f"\n- Total Payments: {len(payments)}"
-                            
-                            amount_col = next((c for c in payments.columns if 'amount' in c.lower() and 'processing' not in c.lower()), None)
-                            if amount_col:
-                                payments_copy = payments.copy()
-                                payments_copy[amount_col] = pd.to_numeric(payments_copy[amount_col], errors='coerce')
-                                total_paid = payments_copy[amount_col].sum()
-                                member_info += f"\n- Total Paid: CAD ${total_paid:.2f}"
-                    except Exception as e:
-                        print(f"Error getting payments: {e}")
-            
-            context = f"""You are a helpful gym member support assistant. Answer the user's question about the current member.
+            context = await asyncio.to_thread(self.build_member_context, query)
+            return await self.gemini.get_response(
+                query, context,
+                data_version=self.data_loader.data_version,
+                history=self.conversation_history.context(),
+                fallback=lambda: self.degraded_response(query)
+            )
+        
+        except Exception as e:
+            import traceback
+            print(f"\nError in answer_with_context: {str(e)}")
+            print(f"Traceback:\n{traceback.format_exc()}")
+            return f"I encountered an error: {str(e)}"
+    
+    def build_member_context(self, query):
+        member_info = self.build_member_info()
+        
+        context = f"""You are a helpful gym member support assistant. Answer the user's question about the current member.
 
 {member_info}
 
 User question: "{query}"
 
 Provide a clear, conversational answer based on the information above. If the information isn't available, say so politely."""
+        
+        return context
+    
+    def build_member_info(self):
+        data_df = self.data_loader.get_dataframe('data')
+        cols = data_df.columns.tolist()
+        
+        def safe_get(key, default='N/A'):
+            val = self.current_member.get(key)
+            return str(val) if pd.notna(val) and val else default
+        
+        member_info = f"Current Member: {safe_get('Name', 'Unknown')}\n"
+        for col in cols[:10]:
+            value = safe_get(col)
+            if value and value != 'N/A' and value != '':
+                member_info += f"- {col}: {value}\n"
+        
+        profile = self.data_loader.get_member_profile(self.current_member_email())
+        if profile:
+            if profile.get('order_count'):
+                member_info += f"\n- Total Orders: {profile['order_count']} ({profile.get('paid_count', 0)} paid)"
+                member_info += f"\n- Total Spent: CAD ${profile.get('total_spent', 0):.2f}"
+                if pd.notna(profile.get('first_order')):
+                    member_info += f"\n- First Order: {profile['first_order']:%Y-%m-%d}"
+                if pd.notna(profile.get('last_order')):
+                    member_info += f"\n- Last Order: {profile['last_order']:%Y-%m-%d}"
             
-            return self.gemini.get_response(query, context)
+            if profile.get('payment_count'):
+                member_info += f"\n- Total Payments: {profile['payment_count']}"
+                member_info += f"\n- Total Paid: CAD ${profile.get('total_paid', 0):.2f}"
+                if pd.notna(profile.get('last_payment_method')):
+                    member_info += f"\n- Last Payment Method: {profile['last_payment_method']}"
         
-        except Exception as e:
-            import traceback
-            print(f"\nError in answer_with_context: {str(e)}")
-            print(f"Traceback:\n{traceback.format_exc()}")
-            return f"I encountered an error: {str(e)}"
\ No newline at end of file
+        return member_info
\ No newline at end of file
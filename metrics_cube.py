@@ -0,0 +1,254 @@
+import re
+import numpy as np
+import pandas as pd
+from logger import logger
+
+QUARTERS = {'q1': 1, 'q2': 2, 'q3': 3, 'q4': 4}
+
+class DailyMetricsCube:
+    """Per-day business totals with prefix sums, built once per data load.
+
+    Every metric is a contiguous float64 array with one slot per calendar day
+    from the first to the last dated event in orders, payments or members.
+    Prefix sums make the total over any [start, end] window two lookups.
+    Payments are also split by method into (days x methods) arrays.
+    """
+    
+    METRICS = ('orders', 'paid', 'refunded', 'revenue', 'new_members', 'active_members', 'payments', 'payment_amount')
+    
+    def __init__(self, first_day, values, methods=(), method_counts=None, method_amounts=None):
+        self.first_day = pd.Timestamp(first_day).normalize()
+        self.length = len(next(iter(values.values())))
+        self.last_day = self.first_day + pd.Timedelta(days=self.length - 1)
+        self.values = values
+        self.prefix = {name: np.concatenate(([0.0], np.cumsum(array))) for name, array in values.items()}
+        
+        # Last day each metric saw activity, so "last N days" of orders ends on the last order
+        self.last_days = {}
+        for name, array in values.items():
+            nonzero = np.flatnonzero(array)
+            if len(nonzero):
+                self.last_days[name] = self.first_day + pd.Timedelta(days=int(nonzero[-1]))
+        
+        self.methods = list(methods)
+        empty = np.zeros((self.length, len(self.methods)))
+        self.method_prefix = {
+            'count': np.vstack([np.zeros(len(self.methods)), np.cumsum(empty if method_counts is None else method_counts, axis=0)]),
+            'amount': np.vstack([np.zeros(len(self.methods)), np.cumsum(empty if method_amounts is None else method_amounts, axis=0)]),
+        }
+    
+    @classmethod
+    def build(cls, data_loader):
+        """Bin orders, payments and members by day; returns None when nothing is dated"""
+        events = []
+        
+        orders_df = data_loader.get_dataframe('orders')
+        if orders_df is not None:
+            date_col = next((c for c in orders_df.columns if 'date' in c.lower() and 'created' in c.lower()), None)
+            date_col = date_col or next((c for c in orders_df.columns if 'date' in c.lower()), None)
+            if date_col:
+                status_col = next((c for c in orders_df.columns if 'status' in c.lower() and 'payment' in c.lower()), None)
+                amount_col = next((c for c in orders_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
+                status = orders_df[status_col].astype(str) if status_col else pd.Series('', index=orders_df.index)
+                amount = pd.to_numeric(orders_df[amount_col], errors='coerce').fillna(0) if amount_col else 0.0
+                events.append(pd.DataFrame({
+                    'day': pd.to_datetime(orders_df[date_col], errors='coerce').dt.normalize(),
+                    'orders': 1.0,
+                    'paid': (status == 'Paid').astype(float),
+                    'refunded': (status == 'Refunded').astype(float),
+                    'revenue': amount,
+                }))
+        
+        data_df = data_loader.get_dataframe('data')
+        if data_df is not None:
+            created_col = next((c for c in data_df.columns if 'created' in c.lower() and 'at' in c.lower()), None)
+            activity_col = next((c for c in data_df.columns if 'activity' in c.lower() and 'date' in c.lower()), None)
+            if created_col:
+                events.append(pd.DataFrame({'day': pd.to_datetime(data_df[created_col], errors='coerce').dt.normalize(), 'new_members': 1.0}))
+            if activity_col:
+                # A member counts on the day of their last activity, so a window's sum is members last seen in it
+                events.append(pd.DataFrame({'day': pd.to_datetime(data_df[activity_col], errors='coerce').dt.normalize(), 'active_members': 1.0}))
+        
+        payments = None
+        payments_df = data_loader.get_dataframe('payments')
+        if payments_df is not None:
+            date_col = next((c for c in payments_df.columns if 'date' in c.lower()), None)
+            if date_col:
+                amount_col = next((c for c in payments_df.columns if 'amount' in c.lower() and 'processing' not in c.lower()), None)
+                method_col = next((c for c in payments_df.columns if 'method' in c.lower()), None)
+                payments = pd.DataFrame({
+                    'day': pd.to_datetime(payments_df[date_col], errors='coerce').dt.normalize(),
+                    'payments': 1.0,
+                    'payment_amount': pd.to_numeric(payments_df[amount_col], errors='coerce').fillna(0) if amount_col else 0.0,
+                    'method': payments_df[method_col].astype(str).where(payments_df[method_col].notna(), 'Unknown') if method_col else 'Unknown',
+                })
+                events.append(payments.drop(columns='method'))
+        
+        events = [e[e['day'].notna()] for e in events]
+        events = [e for e in events if len(e)]
+        if not events:
+            return None
+        
+        first_day = min(e['day'].min() for e in events)
+        last_day = max(e['day'].max() for e in events)
+        length = (last_day - first_day).days + 1
+        
+        values = {name: np.zeros(length) for name in cls.METRICS}
+        for frame in events:
+            offsets = (frame['day'] - first_day).dt.days.to_numpy()
+            for name in frame.columns.drop('day'):
+                values[name] += np.bincount(offsets, weights=frame[name].to_numpy(dtype=float), minlength=length)
+        
+        methods, method_counts, method_amounts = [], None, None
+        if payments is not None:
+            payments = payments[payments['day'].notna()]
+            codes, methods = pd.factorize(payments['method'])
+            cells = (payments['day'] - first_day).dt.days.to_numpy() * len(methods) + codes
+            size = length * len(methods)
+            method_counts = np.bincount(cells, minlength=size).reshape(length, len(methods)).astype(float)
+            method_amounts = np.bincount(cells, weights=payments['payment_amount'].to_numpy(), minlength=size).reshape(length, len(methods))
+        
+        cube = cls(first_day, values, methods, method_counts, method_amounts)
+        logger.info(f"Built daily metrics cube: {length} day(s) from {cube.first_day:%Y-%m-%d} to {cube.last_day:%Y-%m-%d}")
+        return cube
+    
+    def latest(self, metric=None):
+        return self.last_days.get(metric, self.last_day) if metric else self.last_day
+    
+    def span(self, start, end):
+        """Prefix-sum positions [i, j) for the inclusive day window, clipped to the cube"""
+        i = (pd.Timestamp(start).normalize() - self.first_day).days
+        j = (pd.Timestamp(end).normalize() - self.first_day).days + 1
+        return min(max(i, 0), self.length), min(max(j, 0), self.length)
+    
+    def total(self, metric, start, end):
+        i, j = self.span(start, end)
+        prefix = self.prefix[metric]
+        return float(prefix[max(j, i)] - prefix[i])
+    
+    def totals(self, start, end):
+        """Every metric summed over the window, plus (count, amount) per payment method"""
+        i, j = self.span(start, end)
+        j = max(i, j)
+        result = {name: float(prefix[j] - prefix[i]) for name, prefix in self.prefix.items()}
+        
+        counts = self.method_prefix['count'][j] - self.method_prefix['count'][i]
+        amounts = self.method_prefix['amount'][j] - self.method_prefix['amount'][i]
+        result['payment_methods'] = {
+            method: (int(count), float(amount))
+            for method, count, amount in sorted(zip(self.methods, counts, amounts), key=lambda m: -m[1])
+            if count
+        }
+        return result
+    
+    def compare(self, window):
+        """(current totals, previous totals or None) for a window from resolve_window"""
+        current = self.totals(window['start'], window['end'])
+        previous = window.get('compare')
+        return current, self.totals(previous['start'], previous['end']) if previous else None
+
+def percent_change(current, previous):
+    if not previous:
+        return "n/a"
+    return f"{(current - previous) / previous * 100:+.1f}%"
+
+def _window(label, start, end, partial=False):
+    """partial marks a period still in progress, such as this week so far"""
+    return {'label': label, 'start': pd.Timestamp(start).normalize(), 'end': pd.Timestamp(end).normalize(), 'compare': None, 'partial': partial}
+
+def _single_window(text, latest):
+    """The one window a phrase names, relative to the latest day in the data"""
+    text = text.lower()
+    
+    match = re.search(r'\blast (\d+) (day|week|month)s?\b', text)
+    if match:
+        count, unit = int(match.group(1)), match.group(2)
+        days = count * {'day': 1, 'week': 7, 'month': 30}[unit]
+        return _window(f"Last {count} {unit}{'s' if count != 1 else ''}", latest - pd.Timedelta(days=days), latest)
+    
+    week_start = latest - pd.Timedelta(days=latest.weekday())
+    if re.search(r'\b(this|current) week\b', text):
+        return _window("This week", week_start, latest, partial=True)
+    if re.search(r'\b(last|previous|prior) week\b', text):
+        return _window("Last week", week_start - pd.Timedelta(days=7), week_start - pd.Timedelta(days=1))
+    
+    month_start = latest.replace(day=1)
+    if re.search(r'\b(this|current) month\b', text):
+        return _window("This month", month_start, latest, partial=True)
+    if re.search(r'\b(last|previous|prior) month\b', text):
+        previous = month_start - pd.DateOffset(months=1)
+        return _window(f"{previous:%B %Y}", previous, month_start - pd.Timedelta(days=1))
+    
+    quarter_start = pd.Timestamp(latest.year, 3 * ((latest.month - 1) // 3) + 1, 1)
+    if re.search(r'\b(this|current) quarter\b', text):
+        return _window(f"Q{latest.quarter} {latest.year}", quarter_start, latest, partial=True)
+    if re.search(r'\b(last|previous|prior) quarter\b', text):
+        previous = quarter_start - pd.DateOffset(months=3)
+        return _window(f"Q{previous.quarter} {previous.year}", previous, quarter_start - pd.Timedelta(days=1))
+    
+    match = re.search(r'\b(q[1-4])\b(?:\s*(?:of\s*)?(\d{4}))?', text)
+    if match:
+        quarter = QUARTERS[match.group(1)]
+        year = int(match.group(2)) if match.group(2) else latest.year
+        start = pd.Timestamp(year, 3 * quarter - 2, 1)
+        if not match.group(2) and start > latest:
+            start = start - pd.DateOffset(years=1)
+        return _window(f"Q{quarter} {start.year}", start, start + pd.DateOffset(months=3) - pd.Timedelta(days=1))
+    
+    if re.search(r'\b(ytd|year to date|this year|current year)\b', text):
+        return _window(f"{latest.year} to date", pd.Timestamp(latest.year, 1, 1), latest, partial=True)
+    if re.search(r'\b(last|previous|prior) year\b', text):
+        return _window(str(latest.year - 1), pd.Timestamp(latest.year - 1, 1, 1), pd.Timestamp(latest.year - 1, 12, 31))
+    
+    # A bare 20xx only at the start of the phrase or after a word naming it as a year, not "top 2025 orders"
+    match = re.search(r'(?:^\s*|\b(?:in|during|for|of|year)\s+)(20\d{2})\b', text)
+    if match:
+        year = int(match.group(1))
+        return _window(str(year), pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 31))
+    
+    return None
+
+def _shifted(window, offset, label):
+    return _window(label, window['start'] - offset, window['end'] - offset)
+
+def resolve_window(query, latest):
+    """Parse a date window and an optional comparison window from a query.
+
+    Understands "last N days/weeks/months", this/last week, month, quarter and
+    year, Q1-Q4 (with an optional year), a bare year, "A vs B" comparisons and
+    week-over-week, month-over-month and year-over-year. Relative windows end
+    on `latest`, the last day in the data. Returns None when no window is named.
+    """
+    if latest is None or pd.isna(latest):
+        return None
+    latest = pd.Timestamp(latest).normalize()
+    text = query.lower()
+    
+    overs = {
+        'week': (r'\bweek[- ]over[- ]week\b', pd.Timedelta(days=7), "Previous week"),
+        'month': (r'\bmonth[- ]over[- ]month\b', pd.DateOffset(months=1), "Previous month"),
+        'year': (r'\byear[- ]over[- ]year\b|\byoy\b', pd.DateOffset(years=1), "Same period last year"),
+    }
+    for unit, (pattern, offset, label) in overs.items():
+        if re.search(pattern, text):
+            window = _single_window(re.sub(pattern, ' ', text), latest) or _single_window(f"this {unit}", latest)
+            window['compare'] = _shifted(window, offset, label)
+            return window
+    
+    parts = re.split(r'\b(?:vs\.?|versus|compared (?:to|with)|against)\b', text, maxsplit=1)
+    window = _single_window(parts[0], latest)
+    if window is None:
+        return None
+    
+    if len(parts) == 2:
+        other = _single_window(parts[1], latest)
+        # "last month vs previous month" names the same window twice; compare with the one before
+        if other is None or (other['start'], other['end']) == (window['start'], window['end']):
+            length = window['end'] - window['start'] + pd.Timedelta(days=1)
+            other = _shifted(window, length, "Previous period")
+        elif window['partial'] and other['end'] - other['start'] > window['end'] - window['start']:
+            # This week so far against the same weekdays of last week, not all seven
+            days = (window['end'] - window['start']).days + 1
+            other = _window(f"{other['label']} (first {days} day{'s' if days != 1 else ''})", other['start'], other['start'] + pd.Timedelta(days=days - 1))
+        window['compare'] = other
+    return window
\ No newline at end of file
@@ -0,0 +1,288 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from intent_classifier import IntentClassifier
+
+# Run with:  python mock_openrouter.py --port 8787
+# then:      GYM_BOT_OPENROUTER_URL=http://127.0.0.1:8787/api/v1/chat/completions python chatbot_main.py
+
+class LatencyProfile:
+    """Seconds to wait before the first byte, drawn from a named distribution.
+
+    Specs look like "fixed:0.5", "uniform:0.2:1.5", "normal:0.8:0.2" (mean, stddev)
+    or "lognormal:0.8:0.5" (median, sigma).
+    """
+    
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal')
+    
+    def __init__(self, kind='fixed', a=0.0, b=0.0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}', expected one of {', '.join(self.KINDS)}")
+        self.kind = kind
+        self.a = a
+        self.b = b
+    
+    @classmethod
+    def parse(cls, spec):
+        parts = str(spec).split(':')
+        values = [float(p) for p in parts[1:]] + [0.0, 0.0]
+        return cls(parts[0], values[0], values[1])
+    
+    def sample(self, rng):
+        if self.kind == 'fixed':
+            value = self.a
+        elif self.kind == 'uniform':
+            value = rng.uniform(self.a, self.b)
+        elif self.kind == 'normal':
+            value = rng.gauss(self.a, self.b)
+        else:
+            value = rng.lognormvariate(math.log(self.a) if self.a > 0 else 0.0, self.b)
+        return max(0.0, value)
+    
+    def __str__(self):
+        return f"{self.kind}:{self.a:g}:{self.b:g}"
+
+class MockOpenRouterServer:
+    """Local stand-in for the OpenRouter chat-completions endpoint.
+
+    Answers plain and streaming (SSE) requests with deterministic canned text,
+    recognises the bots' intent and routing prompts and answers them with a
+    valid intent, and can inject 429 and 5xx failures at configurable rates.
+    """
+    
+    def __init__(self, host='127.0.0.1', port=0, latency=None, token_delay=0.02,
+                 rate_429=0.0, rate_5xx=0.0, retry_after=1, answer_words=60, seed=None, model_latency=None):
+        self.latency = latency or LatencyProfile()
+        self.model_latency = model_latency or {}
+        self.token_delay = token_delay
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.answer_words = answer_words
+        
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.classifiers = {}
+        self.stats = {'requests': 0, 'streams': 0, 'injected_429': 0, 'injected_5xx': 0}
+        
+        self.httpd = ThreadingHTTPServer((host, port), MockOpenRouterHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = None
+    
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+    
+    def start(self):
+        """Serve on a daemon thread (for benchmarks) and return self"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="MockOpenRouter", daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def serve_forever(self):
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.httpd.server_close()
+    
+    def plan(self, model=None):
+        """Draw the fate of one request: (error status or None, first-byte delay)"""
+        with self.lock:
+            self.stats['requests'] += 1
+            roll = self.rng.random()
+            delay = self.model_latency.get(model, self.latency).sample(self.rng)
+            
+            if roll < self.rate_429:
+                self.stats['injected_429'] += 1
+                return 429, delay
+            if roll < self.rate_429 + self.rate_5xx:
+                self.stats['injected_5xx'] += 1
+                return self.rng.choice((500, 502, 503)), delay
+        
+        return None, delay
+    
+    def classify(self, intents, query):
+        key = tuple(sorted(intents.items()))
+        with self.lock:
+            if key not in self.classifiers:
+                self.classifiers[key] = IntentClassifier(intents)
+            classifier = self.classifiers[key]
+        return classifier.classify(query)[0]
+    
+    def reply_for(self, prompt):
+        """Deterministic reply text for a prompt"""
+        listing = re.search(r'Available intents:\n((?:- .+\n?)+)', prompt)
+        intents = dict(re.findall(r'^- (\w+): (.+)$', listing.group(1), re.MULTILINE)) if listing else {}
+        match = re.search(r'User query: "(.*)"', prompt)
+        # Answer prompts are the data context followed by the raw question
+        query = match.group(1) if match else prompt.rsplit('\n\n', 1)[-1].strip()
+        
+        if intents and 'Respond with ONLY a JSON object' in prompt:
+            intent = self.classify(intents, query)
+            numbers = [int(n) for n in re.findall(r'\b\d+\b', query)]
+            identifier = re.search(r'[\w.+-]+@[\w.-]+\.\w+|\bM-\d+\b', query, re.IGNORECASE)
+            return json.dumps({
+                'intent': intent,
+                'entities': {
+                    'member_identifier': identifier.group(0) if identifier else None,
+                    'order_number': numbers[0] if numbers else None,
+                    'time_window': None,
+                    'limit': numbers[0] if numbers else None,
+                },
+                'answer': self.canned_answer(query) if intent == 'general_question' else None,
+            })
+        
+        if intents:
+            return self.classify(intents, query)
+        
+        return self.canned_answer(query)
+    
+    def canned_answer(self, query):
+        words = ("This is a simulated answer from the local OpenRouter stand-in "
+                 "so latency and throughput can be measured without a network connection").split()
+        seed = sum(query.encode('utf-8'))
+        body = ' '.join(words[(seed + i) % len(words)] for i in range(max(0, self.answer_words - 4)))
+        return f'Mock answer to "{query[:60]}": {body}.'
+
+class MockOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+    
+    def do_POST(self):
+        mock = self.server.mock
+        
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_json(404, {'error': {'message': f'No route for {self.path}', 'code': 404}})
+            return
+        
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            prompt = payload['messages'][-1]['content']
+        except (ValueError, KeyError, IndexError, TypeError):
+            self.send_json(400, {'error': {'message': 'Malformed chat-completions request', 'code': 400}})
+            return
+        
+        status, delay = mock.plan(payload.get('model'))
+        time.sleep(delay)
+        
+        if status == 429:
+            self.send_json(429, {'error': {'message': 'Rate limit exceeded (injected)', 'code': 429}},
+                           headers={'Retry-After': str(mock.retry_after)})
+            return
+        if status is not None:
+            self.send_json(status, {'error': {'message': 'Upstream error (injected)', 'code': status}})
+            return
+        
+        text = mock.reply_for(prompt)
+        completion_id = f"gen-mock-{uuid.uuid4().hex[:12]}"
+        model = payload.get('model', 'mock')
+        usage = {
+            'prompt_tokens': len(prompt.split()),
+            'completion_tokens': len(text.split()),
+            'total_tokens': len(prompt.split()) + len(text.split()),
+        }
+        
+        if not payload.get('stream'):
+            self.send_json(200, {
+                'id': completion_id,
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+            return
+        
+        with mock.lock:
+            mock.stats['streams'] += 1
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        
+        try:
+            self.write_chunk(': OPENROUTER PROCESSING\n\n')
+            for index, word in enumerate(re.findall(r'\S+\s*', text)):
+                if index:
+                    time.sleep(mock.token_delay)
+                chunk = {'id': completion_id, 'model': model,
+                         'choices': [{'index': 0, 'delta': {'content': word}, 'finish_reason': None}]}
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            
+            final = {'id': completion_id, 'model': model,
+                     'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage}
+            self.write_chunk(f"data: {json.dumps(final)}\n\n")
+            self.write_chunk('data: [DONE]\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading mid-stream
+            pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenRouter-compatible stand-in for offline testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--latency', default='fixed:0.3', help="fixed:S | uniform:LO:HI | normal:MEAN:SD | lognormal:MEDIAN:SIGMA")
+    parser.add_argument('--model-latency', action='append', default=[], metavar='MODEL=SPEC',
+                        help="latency for one model, e.g. to test hedging (repeatable)")
+    parser.add_argument('--token-delay', type=float, default=0.02, help="seconds between streamed words")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help="fraction of requests answered with 500/502/503")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--answer-words', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    
+    server = MockOpenRouterServer(
+        host=args.host, port=args.port,
+        latency=LatencyProfile.parse(args.latency),
+        token_delay=args.token_delay,
+        rate_429=args.rate_429, rate_5xx=args.rate_5xx,
+        retry_after=args.retry_after,
+        answer_words=args.answer_words,
+        seed=args.seed,
+        model_latency={
+            model: LatencyProfile.parse(spec)
+            for model, spec in (item.split('=', 1) for item in args.model_latency)
+        }
+    )
+    
+    print(f"Mock OpenRouter listening on {server.url}")
+    print(f"Latency {server.latency}, 429 rate {args.rate_429}, 5xx rate {args.rate_5xx}")
+    print(f"Point the bots at it with GYM_BOT_OPENROUTER_URL={server.url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,94 +1,594 @@
+import asyncio
+import hashlib
 import requests
 import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
 from config import Config
+from async_runner import get_loop, run_on_loop, run_sync
+from response_cache import get_response_cache
+from request_scheduler import UpstreamUnavailableError, get_request_scheduler
+from singleflight import get_singleflight
+from llm_metrics import get_llm_metrics, get_model_latency
+from logger import logger
 
 # Alias for backward compatibility
 GeminiBot = None
 
+class LLMRequestError(Exception):
+    """A chat-completions call that did not produce usable content"""
+    
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
 class OpenRouterBot:
-    def __init__(self):
+    _hedge_executor = None
+    _hedge_lock = threading.Lock()
+    
+    def __init__(self, caller=None):
+        self.caller = caller
         self.api_key = Config.OPENROUTER_API_KEY
         self.model = Config.MODEL_NAME
         self.temperature = Config.TEMPERATURE
         self.max_tokens = Config.MAX_TOKENS
-        self.api_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.timeout = Config.REQUEST_TIMEOUT
+        self.api_url = Config.OPENROUTER_API_URL
+        self.session = requests.Session()
+        self.cache = get_response_cache()
+        self.scheduler = get_request_scheduler()
+        self.flights = get_singleflight()
+        self.metrics = get_llm_metrics()
+        self.model_latency = get_model_latency()
+        # Offline for this client only, on top of the process-wide Config.OFFLINE_MODE
+        self.offline = False
+    
+    def is_offline(self):
+        return Config.OFFLINE_MODE or self.offline
+    
+    def build_headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "http://localhost:8000",  # Optional
+            "X-Title": "Gym Chatbot System"  # Optional
+        }
+    
+    @classmethod
+    def _get_hedge_executor(cls):
+        with cls._hedge_lock:
+            if cls._hedge_executor is None:
+                cls._hedge_executor = ThreadPoolExecutor(
+                    max_workers=2 * Config.MAX_CONCURRENT_REQUESTS,
+                    thread_name_prefix="openrouter-hedge"
+                )
+            return cls._hedge_executor
+    
+    def model_for(self, phase):
+        if phase == 'intent' and Config.INTENT_MODEL:
+            return Config.INTENT_MODEL
+        return self.model
+    
+    def fallback_chain(self, model):
+        """The requested model first, then the primary model and the configured fallbacks"""
+        chain = []
+        for candidate in [model, self.model] + list(Config.FALLBACK_MODELS):
+            if candidate and candidate not in chain:
+                chain.append(candidate)
+        return chain
+    
+    def should_fall_back(self, error):
+        # Auth and billing failures are account-wide; another model will not help
+        status = getattr(error, 'status_code', None) or getattr(getattr(error, 'cause', None), 'status_code', None)
+        return status not in (401, 402)
+    
+    def build_payload(self, prompt, context="", temperature=None, model=None, history=""):
+        full_prompt = "\n\n".join(part for part in (history, context, prompt) if part)
+        
+        return {
+            "model": model or self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": full_prompt
+                }
+            ],
+            "temperature": self.temperature if temperature is None else temperature,
+            "max_tokens": self.max_tokens
+        }
+    
+    def cache_key(self, prompt, context="", temperature=None, data_version=None, model=None, history=""):
+        """Cache key for one request; None with the cache disabled.
+        
+        The conversation history is keyed with the data context, so a
+        follow-up is never answered with another conversation's reply.
+        """
+        if self.cache is None:
+            return None
+        
+        temperature = self.temperature if temperature is None else temperature
+        context = "\n\n".join(part for part in (history, context) if part)
+        return self.cache.make_key(model or self.model, temperature, prompt, context, data_version)
+    
+    def flight_key(self, payload, cache_key=None):
+        """Key under which identical in-flight requests are coalesced"""
+        if cache_key is not None:
+            return cache_key
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def start_call(self, phase):
+        return self.metrics.start(self.caller, phase, self.model_for(phase))
     
-    def get_response(self, prompt, context=""):
+    def finish_call(self, call, error=None):
+        if error is None:
+            return self.metrics.finish(call)
+        
+        if call['status'] is None:
+            call['status'] = getattr(error, 'status_code', None)
+        outcome = 'unavailable' if isinstance(error, UpstreamUnavailableError) else 'error'
+        return self.metrics.finish(call, outcome)
+    
+    def get_response(self, prompt, context="", temperature=None, data_version=None, fallback=None, phase='answer', history=""):
+        if self.is_offline():
+            return self.offline_reply(fallback)
+        
+        call = self.start_call(phase)
+        
+        model = self.model_for(phase)
+        key = self.cache_key(prompt, context, temperature, data_version, model, history)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                call['cache_hit'] = True
+                self.finish_call(call)
+                return cached
+        
+        return self.send_request(self.build_payload(prompt, context, temperature, model, history), key, fallback, call)
+    
+    def send_request(self, payload, cache_key=None, fallback=None, call=None):
+        """Run a scheduled chat-completions call and map the outcome to a reply string.
+        
+        Identical concurrent requests share one upstream call. fallback, if
+        given, is called for a degraded local answer when the upstream is
+        unhealthy (circuit open or retries exhausted).
+        """
+        if self.is_offline():
+            return self.offline_reply(fallback)
+        
+        call = call if call is not None else self.start_call('answer')
+        
+        # Only the leader's fetch_and_cache runs, and it clears the flag
+        call['coalesced'] = True
         try:
-            full_prompt = f"{context}\n\n{prompt}" if context else prompt
+            content = self.flights.do(
+                self.flight_key(payload, cache_key),
+                lambda: self.fetch_and_cache(payload, cache_key, call)
+            )
+        except (UpstreamUnavailableError, LLMRequestError) as e:
+            self.finish_call(call, e)
+            return self.failure_reply(e, fallback)
+        
+        self.finish_call(call)
+        return content
+    
+    def fetch_and_cache(self, payload, cache_key=None, call=None):
+        if call is not None:
+            call['coalesced'] = False
+        
+        content = self.fetch_hedged(payload, call)
+        
+        # Only real answers are cached, never error text
+        if cache_key is not None:
+            self.cache.set(cache_key, content)
+        return content
+    
+    def fetch_hedged(self, payload, call=None):
+        """Fetch with model fallback and one hedged request.
+        
+        The payload's model goes first. If it is still running after its
+        observed p95, the next model in the chain is asked the same thing and
+        the first success wins. If every running request fails, the next
+        model is tried. A losing request cannot be aborted mid-flight; it
+        finishes on its worker thread and is discarded.
+        """
+        phase = call['phase'] if call is not None else 'answer'
+        models = self.fallback_chain(payload['model'])
+        executor = self._get_hedge_executor()
+        
+        pending = {}
+        queue = list(models)
+        hedged = False
+        last_error = None
+        
+        def launch(model):
+            pending[executor.submit(self.attempt, payload, model, phase)] = model
+            return time.perf_counter() + self.model_latency.hedge_delay(model, phase)
+        
+        hedge_at = launch(queue.pop(0))
+        while pending:
+            timeout = None
+            if queue and not hedged and Config.HEDGE_ENABLED:
+                timeout = max(0.0, hedge_at - time.perf_counter())
             
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "http://localhost:8000",  # Optional
-                "X-Title": "Gym Chatbot System"  # Optional
-            }
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                logger.info(f"Hedging slow {pending[next(iter(pending))]} request to {queue[0]}")
+                launch(queue.pop(0))
+                continue
             
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": full_prompt
-                    }
-                ],
-                "temperature": self.temperature,
-                "max_tokens": self.max_tokens
-            }
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    content, info = future.result()
+                except (UpstreamUnavailableError, LLMRequestError) as e:
+                    last_error = e
+                    continue
+                
+                for other in pending:
+                    other.cancel()
+                if call is not None:
+                    call.update(info)
+                    call['model'] = model
+                    call['hedged'] = hedged
+                return content
             
-            response = requests.post(
+            if not pending and queue and self.should_fall_back(last_error):
+                logger.warning(f"Falling back to {queue[0]}: {getattr(last_error, 'message', last_error)}")
+                hedge_at = launch(queue.pop(0))
+        
+        raise last_error
+    
+    def attempt(self, payload, model, phase):
+        """One scheduled call to a single model; returns (content, call info)"""
+        info = {'status': None, 'ttfb': None, 'retries': 0, 'prompt_tokens': None, 'completion_tokens': None}
+        content = self.scheduler.call(
+            lambda: self.fetch_completion(dict(payload, model=model), info),
+            lambda attempt, error: info.update(retries=attempt)
+        )
+        self.model_latency.observe(model, phase, info['ttfb'])
+        return content, info
+    
+    def offline_reply(self, fallback=None):
+        """Reply without touching the network while offline mode is on"""
+        if fallback is not None:
+            return fallback()
+        return "The AI assistant is offline. Ask about specific members, orders or reports to get answers from the local data."
+    
+    def failure_reply(self, error, fallback=None):
+        """Each caller maps a shared failure with its own fallback"""
+        if isinstance(error, UpstreamUnavailableError) and fallback is not None:
+            return fallback()
+        return error.message
+    
+    def fetch_completion(self, payload, call=None):
+        """POST a chat-completions payload and return its content, raising LLMRequestError on failure.
+        
+        call, if given, is the metrics record to fill with status, TTFB and usage.
+        """
+        try:
+            response = self.session.post(
                 self.api_url,
-                headers=headers,
+                headers=self.build_headers(),
                 json=payload,
-                timeout=30
+                timeout=self.timeout
+            )
+        except Exception as e:
+            raise LLMRequestError(self.describe_exception(e)) from e
+        
+        if call is not None:
+            call['status'] = response.status_code
+            call['ttfb'] = response.elapsed.total_seconds()
+        
+        if response.status_code != 200:
+            raise LLMRequestError(
+                self.describe_error_status(response),
+                status_code=response.status_code,
+                retry_after=response.headers.get('Retry-After')
             )
+        
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise LLMRequestError(self.describe_exception(e), status_code=response.status_code) from e
+        
+        if call is not None:
+            self.record_usage(call, data.get('usage'))
+        
+        if 'choices' in data and len(data['choices']) > 0:
+            message = data['choices'][0].get('message', {})
+            content = message.get('content', '')
             
-            if response.status_code == 200:
-                data = response.json()
-                
-                if 'choices' in data and len(data['choices']) > 0:
-                    message = data['choices'][0].get('message', {})
-                    content = message.get('content', '')
+            if content:
+                return content.strip()
+            else:
+                raise LLMRequestError("I received an empty response. Please try again.", status_code=200)
+        else:
+            raise LLMRequestError("I couldn't generate a response. Please try rephrasing your question.", status_code=200)
+    
+    def record_usage(self, call, usage):
+        if usage:
+            call['prompt_tokens'] = usage.get('prompt_tokens')
+            call['completion_tokens'] = usage.get('completion_tokens')
+    
+    def open_stream(self, payload, call=None):
+        """Start a streaming call, raising LLMRequestError unless the server accepts it"""
+        if call is not None:
+            call['sent'] = time.perf_counter()
+        
+        try:
+            response = self.session.post(
+                self.api_url,
+                headers=self.build_headers(),
+                json=payload,
+                timeout=self.timeout,
+                stream=True
+            )
+        except Exception as e:
+            raise LLMRequestError(self.describe_exception(e)) from e
+        
+        if call is not None:
+            call['status'] = response.status_code
+        
+        if response.status_code != 200:
+            error = LLMRequestError(
+                self.describe_error_status(response),
+                status_code=response.status_code,
+                retry_after=response.headers.get('Retry-After')
+            )
+            response.close()
+            raise error
+        
+        return response
+    
+    def stream_response(self, prompt, context="", temperature=None, data_version=None, fallback=None, phase='answer', history=""):
+        """Yield reply text chunks as they arrive over the SSE stream.
+        
+        If the same request is already in flight, wait for it and yield its
+        full answer instead of opening a second upstream stream.
+        """
+        if self.is_offline():
+            yield self.offline_reply(fallback)
+            return
+        
+        call = self.start_call(phase)
+        call['streamed'] = True
+        
+        model = self.model_for(phase)
+        key = self.cache_key(prompt, context, temperature, data_version, model, history)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                call['cache_hit'] = True
+                self.finish_call(call)
+                yield cached
+                return
+        
+        payload = self.build_payload(prompt, context, temperature, model, history)
+        flight_key = self.flight_key(payload, key)
+        flight, leader = self.flights.join(flight_key)
+        
+        if not leader:
+            call['coalesced'] = True
+            try:
+                content = flight.future.result()
+            except (UpstreamUnavailableError, LLMRequestError) as e:
+                self.finish_call(call, e)
+                yield self.failure_reply(e, fallback)
+                return
+            self.finish_call(call)
+            yield content
+            return
+        
+        payload['stream'] = True
+        parts = []
+        try:
+            with self.stream_slot():
+                for content in self.iter_stream(payload, call):
+                    parts.append(content)
+                    yield content
+            
+            content = ''.join(parts).strip()
+            if key is not None:
+                self.cache.set(key, content)
+            self.flights.resolve(flight_key, flight, content)
+            self.finish_call(call)
+        except (UpstreamUnavailableError, LLMRequestError) as e:
+            self.flights.reject(flight_key, flight, e)
+            self.finish_call(call, e)
+            yield ("\n" if parts else "") + self.failure_reply(e, fallback)
+        finally:
+            if not flight.future.done():
+                # The consumer stopped reading before the stream finished
+                self.flights.reject(flight_key, flight, LLMRequestError("The response was interrupted. Please try again."))
+                self.metrics.finish(call, 'interrupted')
+    
+    def stream_slot(self):
+        """Held for the duration of one upstream stream"""
+        return nullcontext()
+    
+    def iter_stream(self, payload, call=None):
+        """Yield content deltas from a streaming call, raising LLMRequestError on failure"""
+        on_retry = None if call is None else (lambda attempt, error: call.update(retries=attempt))
+        
+        # Streams fall back to the next model only while nothing has been yielded
+        models = self.fallback_chain(payload['model'])
+        for index, model in enumerate(models):
+            try:
+                response = self.scheduler.call(lambda: self.open_stream(dict(payload, model=model), call), on_retry)
+                break
+            except (UpstreamUnavailableError, LLMRequestError) as e:
+                if index + 1 >= len(models) or not self.should_fall_back(e):
+                    raise
+                logger.warning(f"Falling back to {models[index + 1]}: {getattr(e, 'message', e)}")
+        
+        if call is not None:
+            call['model'] = model
+        
+        try:
+            with response:
+                started = False
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    # Blank keep-alives and ": OPENROUTER PROCESSING" comments carry no data
+                    if not line or not line.startswith('data:'):
+                        continue
+                    
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+                    
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+                    
+                    if 'error' in chunk:
+                        raise LLMRequestError(chunk['error'].get('message', 'The response stream failed.'), status_code=200)
+                    
+                    # OpenRouter reports usage on the last event of the stream
+                    if call is not None:
+                        self.record_usage(call, chunk.get('usage'))
                     
+                    choices = chunk.get('choices') or []
+                    if not choices:
+                        continue
+                    
+                    content = (choices[0].get('delta') or {}).get('content')
+                    if content and not started:
+                        content = content.lstrip()
                     if content:
-                        return content.strip()
-                    else:
-                        return "I received an empty response. Please try again."
-                else:
-                    return "I couldn't generate a response. Please try rephrasing your question."
-            
-            elif response.status_code == 429:
-                return "Rate limit exceeded. Please wait a moment and try again."
-            
-            elif response.status_code == 401:
-                return "Authentication error. Please check your API key."
-            
-            elif response.status_code == 402:
-                return "Insufficient credits. Please check your OpenRouter account."
-            
-            else:
-                error_msg = f"API request failed with status {response.status_code}"
-                try:
-                    error_data = response.json()
-                    if 'error' in error_data:
-                        error_msg += f": {error_data['error'].get('message', 'Unknown error')}"
-                except:
-                    pass
-                return error_msg
-                
-        except requests.exceptions.Timeout:
+                        if not started and call is not None:
+                            call['ttfb'] = time.perf_counter() - call['sent']
+                        started = True
+                        yield content
+        
+        except LLMRequestError:
+            raise
+        except Exception as e:
+            raise LLMRequestError(self.describe_exception(e)) from e
+        
+        if not started:
+            raise LLMRequestError("I received an empty response. Please try again.", status_code=200)
+    
+    def describe_error_status(self, response):
+        if response.status_code == 429:
+            return "Rate limit exceeded. Please wait a moment and try again."
+        
+        elif response.status_code == 401:
+            return "Authentication error. Please check your API key."
+        
+        elif response.status_code == 402:
+            return "Insufficient credits. Please check your OpenRouter account."
+        
+        else:
+            error_msg = f"API request failed with status {response.status_code}"
+            try:
+                error_data = response.json()
+                if 'error' in error_data:
+                    error_msg += f": {error_data['error'].get('message', 'Unknown error')}"
+            except:
+                pass
+            return error_msg
+    
+    def describe_exception(self, e):
+        if isinstance(e, requests.exceptions.Timeout):
             return "Request timed out. Please try again."
         
-        except requests.exceptions.ConnectionError:
+        if isinstance(e, requests.exceptions.ConnectionError):
             return "Connection error. Please check your internet connection."
         
-        except Exception as e:
-            error_msg = str(e).lower()
-            
-            if 'timeout' in error_msg:
-                return "Request timed out. Please try again."
-            elif 'connection' in error_msg:
-                return "Connection error. Please check your internet connection."
-            else:
-                print(f"Error details: {str(e)}")
-                return "I encountered an error. Please try again with a simpler question."
\ No newline at end of file
+        error_msg = str(e).lower()
+        
+        if 'timeout' in error_msg:
+            return "Request timed out. Please try again."
+        elif 'connection' in error_msg:
+            return "Connection error. Please check your internet connection."
+        else:
+            print(f"Error details: {str(e)}")
+            return "I encountered an error. Please try again with a simpler question."
+
+
+class AsyncOpenRouterBot(OpenRouterBot):
+    """Awaitable OpenRouter client.
+
+    Every instance shares one semaphore and one HTTP worker pool, both owned by
+    the background loop in async_runner, so Config.MAX_CONCURRENT_REQUESTS bounds
+    upstream calls for the whole process no matter how many sessions are open.
+    Cancelling the awaiting task releases its slot immediately; the abandoned
+    HTTP call finishes (or times out) on its worker thread and is discarded.
+    Identical requests are coalesced before taking a slot, and a shared call is
+    only cancelled once every session waiting on it has been cancelled.
+    """
+    
+    _semaphore = None
+    _executor = None
+    _init_lock = threading.Lock()
+    
+    @classmethod
+    def _get_semaphore(cls):
+        with cls._init_lock:
+            if cls._semaphore is None:
+                cls._semaphore = asyncio.Semaphore(Config.MAX_CONCURRENT_REQUESTS)
+            return cls._semaphore
+    
+    @classmethod
+    def _get_executor(cls):
+        with cls._init_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=Config.MAX_CONCURRENT_REQUESTS,
+                    thread_name_prefix="openrouter"
+                )
+            return cls._executor
+    
+    async def get_response(self, prompt, context="", temperature=None, data_version=None, fallback=None, phase='answer', history=""):
+        if self.is_offline():
+            return await asyncio.to_thread(self.offline_reply, fallback)
+        
+        call = self.start_call(phase)
+        
+        model = self.model_for(phase)
+        key = self.cache_key(prompt, context, temperature, data_version, model, history)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                call['cache_hit'] = True
+                self.finish_call(call)
+                return cached
+        
+        payload = self.build_payload(prompt, context, temperature, model, history)
+        call['coalesced'] = True
+        try:
+            content = await run_on_loop(self.flights.do_async(
+                self.flight_key(payload, key),
+                lambda: self._fetch_bounded(payload, key, call)
+            ))
+        except (UpstreamUnavailableError, LLMRequestError) as e:
+            self.finish_call(call, e)
+            # Fallbacks build local reports with pandas, so keep them off the loop
+            return await asyncio.to_thread(self.failure_reply, e, fallback)
+        except asyncio.CancelledError:
+            self.metrics.finish(call, 'cancelled')
+            raise
+        
+        self.finish_call(call)
+        return content
+    
+    async def _fetch_bounded(self, payload, cache_key=None, call=None):
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), self.fetch_and_cache, payload, cache_key, call)
+    
+    @contextmanager
+    def stream_slot(self):
+        """Hold a concurrency slot while streaming"""
+        semaphore = self._get_semaphore()
+        run_sync(semaphore.acquire())
+        try:
+            yield
+        finally:
+            get_loop().call_soon_threadsafe(semaphore.release)
\ No newline at end of file
@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from logger import logger
+
+_executor = None
+_executor_lock = threading.Lock()
+_stats = {'submitted': 0, 'used': 0, 'wasted': 0}
+
+def get_prefetch_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=Config.PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        return _executor
+
+def _count(key, amount=1):
+    with _executor_lock:
+        _stats[key] += amount
+
+def get_prefetch_stats():
+    with _executor_lock:
+        stats = dict(_stats)
+    stats['hit_rate'] = stats['used'] / stats['submitted'] if stats['submitted'] else 0.0
+    return stats
+
+class Prefetch:
+    """Speculative data work for one chat turn.
+
+    submit() starts fn(*args) on the shared prefetch pool while the intent call
+    is in flight; get() with the same key returns that result, or runs fn
+    inline when nothing was prefetched (or the prefetch never got a worker).
+    close() discards whatever the turn did not use.
+    """
+    
+    def __init__(self):
+        self.futures = {}
+        self.used = set()
+    
+    def submit(self, key, fn, *args):
+        if not Config.SPECULATIVE_PREFETCH or key in self.futures:
+            return
+        self.futures[key] = get_prefetch_executor().submit(fn, *args)
+        _count('submitted')
+    
+    def get(self, key, fn, *args):
+        future = self.futures.get(key)
+        
+        # A prefetch still queued behind other work is cheaper to run here
+        if future is None or future.cancel():
+            return fn(*args)
+        
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning(f"Prefetch {key!r} failed, recomputing: {e}")
+            return fn(*args)
+        
+        if key not in self.used:
+            self.used.add(key)
+            _count('used')
+        return result
+    
+    def close(self):
+        for key, future in self.futures.items():
+            if key not in self.used:
+                future.cancel()
+                _count('wasted')
+        self.futures.clear()
\ No newline at end of file
@@ -0,0 +1,247 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from config import Config
+from logger import logger
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+class UpstreamUnavailableError(Exception):
+    """Raised when the scheduler will not (or can no longer) reach OpenRouter"""
+    
+    def __init__(self, message, cause=None):
+        super().__init__(message)
+        self.message = message
+        self.cause = cause
+
+class TokenBucket:
+    """Blocking token bucket shared by every thread that talks to OpenRouter"""
+    
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.waiting = 0
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to timeout seconds; returns the seconds waited or None"""
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        
+        with self.condition:
+            self.waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return time.monotonic() - start
+                    
+                    needed = (1 - self.tokens) / self.rate
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return None
+                        needed = min(needed, remaining)
+                    self.condition.wait(needed)
+            finally:
+                self.waiting -= 1
+    
+    def drain(self, seconds):
+        """Hold back new calls for a while after the server asks us to (Retry-After)"""
+        with self.condition:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open probe after reset_timeout"""
+    
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+    
+    def allow(self):
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self.probe_in_flight = False
+            
+            if self.state == 'half_open' and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            
+            return False
+    
+    def record_success(self):
+        with self.lock:
+            if self.state != 'closed':
+                logger.info("OpenRouter circuit breaker closed")
+            self.state = 'closed'
+            self.failures = 0
+            self.probe_in_flight = False
+    
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning(f"OpenRouter circuit breaker opened after {self.failures} failure(s)")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+class RequestScheduler:
+    """Client-side admission control for OpenRouter calls.
+
+    call() waits for a rate-limit token, refuses immediately while the circuit is
+    open, and retries retryable failures with jittered exponential backoff,
+    honouring Retry-After when the server sends it.
+    """
+    
+    def __init__(self, requests_per_minute=None, burst=None, max_attempts=None,
+                 base_delay=None, max_delay=None, max_queue_wait=None,
+                 failure_threshold=None, reset_timeout=None):
+        self.bucket = TokenBucket(
+            requests_per_minute or Config.OPENROUTER_REQUESTS_PER_MINUTE,
+            burst or Config.RATE_LIMIT_BURST
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout or Config.CIRCUIT_RESET_TIMEOUT
+        )
+        self.max_attempts = max_attempts or Config.RETRY_MAX_ATTEMPTS
+        self.base_delay = base_delay if base_delay is not None else Config.RETRY_BASE_DELAY
+        self.max_delay = max_delay if max_delay is not None else Config.RETRY_MAX_DELAY
+        self.max_queue_wait = max_queue_wait if max_queue_wait is not None else Config.RATE_LIMIT_MAX_WAIT
+        
+        self.lock = threading.Lock()
+        self.metrics = {
+            'calls': 0,
+            'retries': 0,
+            'rejected_open_circuit': 0,
+            'rejected_queue_timeout': 0,
+            'failures': 0,
+            'max_queue_depth': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+        }
+    
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.metrics[key] += amount
+    
+    def is_retryable(self, error):
+        status = getattr(error, 'status_code', None)
+        return status is None or status in RETRYABLE_STATUS_CODES
+    
+    @staticmethod
+    def parse_retry_after(value):
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+    
+    def backoff_delay(self, attempt, error):
+        retry_after = self.parse_retry_after(getattr(error, 'retry_after', None))
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        
+        # Full jitter keeps concurrent sessions from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+    
+    def call(self, fn, on_retry=None):
+        """Run fn() under rate limiting, retries and the circuit breaker"""
+        self._count('calls')
+        
+        last_error = None
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                self._count('rejected_open_circuit')
+                raise UpstreamUnavailableError("The AI service is temporarily unavailable.", last_error)
+            
+            with self.lock:
+                self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], self.bucket.waiting + 1)
+            
+            waited = self.bucket.acquire(self.max_queue_wait)
+            if waited is None:
+                self._count('rejected_queue_timeout')
+                raise UpstreamUnavailableError("Rate limit exceeded. Please wait a moment and try again.", last_error)
+            
+            with self.lock:
+                self.metrics['total_wait_seconds'] += waited
+                self.metrics['max_wait_seconds'] = max(self.metrics['max_wait_seconds'], waited)
+            
+            try:
+                result = fn()
+            except Exception as e:
+                if not self.is_retryable(e):
+                    # The upstream answered; the request itself was bad
+                    self.breaker.record_success()
+                    raise
+                
+                self.breaker.record_failure()
+                self._count('failures')
+                last_error = e
+                
+                if attempt + 1 >= self.max_attempts:
+                    break
+                
+                delay = self.backoff_delay(attempt, e)
+                if getattr(e, 'status_code', None) == 429:
+                    self.bucket.drain(delay)
+                
+                self._count('retries')
+                if on_retry is not None:
+                    on_retry(attempt + 1, e)
+                time.sleep(delay)
+                continue
+            
+            self.breaker.record_success()
+            return result
+        
+        raise UpstreamUnavailableError(getattr(last_error, 'message', str(last_error)), last_error)
+    
+    def get_metrics(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        
+        metrics['queue_depth'] = self.bucket.waiting
+        metrics['circuit_state'] = self.breaker.state
+        admitted = metrics['calls'] - metrics['rejected_open_circuit'] - metrics['rejected_queue_timeout']
+        metrics['avg_wait_seconds'] = metrics['total_wait_seconds'] / admitted if admitted > 0 else 0.0
+        return metrics
+
+_shared_scheduler = None
+_shared_lock = threading.Lock()
+
+def get_request_scheduler():
+    """Return the process-wide scheduler so every session shares one quota"""
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = RequestScheduler()
+        return _shared_scheduler
\ No newline at end of file
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+from logger import logger
+
+class ResponseCache:
+    """Two-tier LLM response cache: an in-memory LRU in front of a SQLite file.
+
+    Entries expire after ttl seconds in both tiers. The memory tier keeps at most
+    max_entries items; the disk tier is pruned back to max_disk_entries (least
+    recently used first) every prune_interval writes.
+    """
+    
+    def __init__(self, path=None, max_entries=None, max_disk_entries=None, ttl=None, prune_interval=100):
+        self.path = path or Config.LLM_CACHE_FILE
+        self.max_entries = max_entries or Config.LLM_CACHE_MAX_ENTRIES
+        self.max_disk_entries = max_disk_entries or Config.LLM_CACHE_MAX_DISK_ENTRIES
+        self.ttl = ttl or Config.LLM_CACHE_TTL
+        self.prune_interval = prune_interval
+        
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.writes_since_prune = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        
+        self.db = None
+        try:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.db.commit()
+        except Exception as e:
+            logger.error(f"LLM response cache running memory-only, could not open {self.path}: {e}")
+            self.db = None
+    
+    @staticmethod
+    def normalize(text):
+        return ' '.join(str(text).lower().split())
+    
+    def make_key(self, model, temperature, prompt, context="", data_version=None):
+        context_digest = hashlib.sha256(self.normalize(context).encode('utf-8')).hexdigest()
+        raw = json.dumps([model, float(temperature), self.normalize(prompt), context_digest, data_version or ''])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        now = time.time()
+        
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self.memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return value
+                del self.memory[key]
+            
+            if self.db is not None:
+                try:
+                    row = self.db.execute(
+                        "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and row[1] > now:
+                        self.db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                        self.db.commit()
+                        self._remember(key, row[0], row[1])
+                        self.stats['disk_hits'] += 1
+                        return row[0]
+                except Exception as e:
+                    logger.error(f"LLM response cache read failed: {e}")
+            
+            self.stats['misses'] += 1
+            return None
+    
+    def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl
+        
+        with self.lock:
+            self._remember(key, value, expires_at)
+            self.stats['writes'] += 1
+            
+            if self.db is None:
+                return
+            
+            try:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now)
+                )
+                self.db.commit()
+                
+                self.writes_since_prune += 1
+                if self.writes_since_prune >= self.prune_interval:
+                    self._prune_disk(now)
+            except Exception as e:
+                logger.error(f"LLM response cache write failed: {e}")
+    
+    def _remember(self, key, value, expires_at):
+        self.memory[key] = (value, expires_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.stats['evictions'] += 1
+    
+    def _prune_disk(self, now):
+        self.writes_since_prune = 0
+        self.db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        self.db.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY last_access DESC LIMIT ?)",
+            (self.max_disk_entries,)
+        )
+        self.db.commit()
+    
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
+    
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self.memory)
+            stats['disk_entries'] = 0
+            if self.db is not None:
+                try:
+                    stats['disk_entries'] = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                except Exception:
+                    pass
+        
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+def get_response_cache():
+    """Return the process-wide response cache, or None when caching is disabled"""
+    global _shared_cache
+    if not Config.LLM_CACHE_ENABLED:
+        return None
+    
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
\ No newline at end of file
@@ -0,0 +1,78 @@
+import re
+import numpy as np
+
+MORE_PATTERN = re.compile(
+    r"^\s*(?:please\s+)?(?:show|see|give me|load|list)?\s*(?:me\s+)?(?:(?:the\s+)?next(?:\s+page|\s+\d+|\s+ones?)?|more|\d+\s+more|the rest|keep going|continue)(?:\s+please)?[\s.!?]*$",
+    re.IGNORECASE
+)
+
+def is_more_request(query):
+    """True for follow-ups like "show more", "next page" or "next 10" """
+    return bool(MORE_PATTERN.match(query or ''))
+
+class PagedReply(str):
+    """A handler's reply text carrying the cursor for its "show more" follow-ups.
+
+    The bot installs the cursor only when it actually sends this reply, so a
+    speculative handler run whose result is discarded leaves no cursor behind.
+    """
+    
+    def __new__(cls, text, cursor):
+        reply = super().__new__(cls, text)
+        reply.cursor = cursor
+        return reply
+
+class ResultCursor:
+    """Paging position over a result set kept in a bot's conversation state.
+
+    The handler that filtered the data stores the source frame, the row
+    positions that matched and a render function; each page is an iloc over
+    the next slice of positions, so "show more" never re-runs the filter.
+    The cursor goes stale when the data is reloaded.
+    """
+    
+    def __init__(self, frame, positions, render, noun, page_size=10, data_version=None):
+        self.frame = frame
+        self.positions = np.asarray(positions, dtype=np.intp)
+        self.render = render
+        self.noun = noun
+        self.page_size = page_size
+        self.data_version = data_version
+        self.offset = 0
+    
+    @classmethod
+    def over(cls, frame, render, noun, page_size=10, data_version=None):
+        """Cursor over every row of an already-filtered frame"""
+        return cls(frame, np.arange(len(frame)), render, noun, page_size, data_version)
+    
+    @property
+    def total(self):
+        return len(self.positions)
+    
+    @property
+    def remaining(self):
+        return max(0, self.total - self.offset)
+    
+    def take(self):
+        """Rows of the next page, advancing the cursor past them"""
+        page = self.frame.iloc[self.positions[self.offset:self.offset + self.page_size]]
+        self.offset += len(page)
+        return page
+    
+    def first_page(self):
+        return self.render(self.take()) + self.footer()
+    
+    def footer(self):
+        if not self.remaining:
+            return ""
+        return f"\n... and {self.remaining:,} more {self.noun}. Say 'show more' for the next {min(self.page_size, self.remaining)}.\n"
+    
+    def next_page(self, data_version=None):
+        if self.data_version != data_version:
+            return "The data has been reloaded since that list was made. Please ask again for fresh results."
+        if not self.remaining:
+            return f"That's all {self.total:,} {self.noun}. Ask a new question to see something else."
+        
+        start = self.offset + 1
+        page = self.take()
+        return f"{self.noun.upper()} {start:,}-{self.offset:,} OF {self.total:,}:\n" + self.render(page) + self.footer()
\ No newline at end of file
@@ -0,0 +1,67 @@
+from string import Formatter
+import pandas as pd
+
+class RowRenderer:
+    """Formats rows of a result slice column by column instead of with iterrows.
+
+    fields maps template names to text columns (missing values and missing
+    columns become the field's default); amounts maps names to numeric columns
+    (missing values become 0). Every row also gets a 1-based 'rank'.
+
+    The 'text' target fills a str.format template per row for the CLI; the
+    'markdown' target draws a table for Streamlit. Subclasses add a target by
+    defining render_<target>().
+    """
+    
+    def __init__(self, target='text'):
+        if not hasattr(self, f"render_{target}"):
+            raise ValueError(f"Unknown render target '{target}'")
+        self.target = target
+    
+    @staticmethod
+    def text_values(df, column, default='N/A'):
+        if column is None or column not in df.columns:
+            return [default] * len(df)
+        values = df[column]
+        return values.astype(str).where(values.notna(), default).tolist()
+    
+    @staticmethod
+    def amount_values(df, column):
+        if column is None or column not in df.columns:
+            return [0.0] * len(df)
+        return pd.to_numeric(df[column], errors='coerce').fillna(0).tolist()
+    
+    def values(self, df, fields, amounts=None, defaults=None):
+        """{name: list of cell values}, built one column at a time"""
+        defaults = defaults or {}
+        columns = {'rank': list(range(1, len(df) + 1))}
+        for name, column in fields.items():
+            columns[name] = self.text_values(df, column, defaults.get(name, 'N/A'))
+        for name, column in (amounts or {}).items():
+            columns[name] = self.amount_values(df, column)
+        return columns
+    
+    def render(self, df, template, fields, amounts=None, defaults=None):
+        if df is None or len(df) == 0:
+            return ""
+        return getattr(self, f"render_{self.target}")(df, template, fields, amounts or {}, defaults)
+    
+    def render_text(self, df, template, fields, amounts, defaults):
+        columns = self.values(df, fields, amounts, defaults)
+        names = list(columns)
+        return ''.join(template.format_map(dict(zip(names, row))) for row in zip(*columns.values()))
+    
+    def render_markdown(self, df, template, fields, amounts, defaults):
+        columns = self.values(df, fields, amounts, defaults)
+        
+        # Numbers keep the format spec the text template gives them
+        specs = {name: spec for _, name, spec, _ in Formatter().parse(template) if name}
+        for name in amounts:
+            columns[name] = [format(value, specs.get(name) or ',.2f') for value in columns[name]]
+        
+        headers = ['#'] + [name.replace('_', ' ').title() for name in list(columns)[1:]]
+        cells = [[str(value).replace('|', '\\|') for value in row] for row in zip(*columns.values())]
+        
+        lines = ['| ' + ' | '.join(headers) + ' |', '|' + '---|' * len(headers)]
+        lines += ['| ' + ' | '.join(row) + ' |' for row in cells]
+        return '\n' + '\n'.join(lines) + '\n\n'
\ No newline at end of file
@@ -1,13 +1,77 @@
-from gemini_bot import GeminiBot
+from openrouter_bot import AsyncOpenRouterBot
+from async_runner import run_sync
+from config import Config
+from intent_classifier import get_intent_classifier
+from structured_routing import build_routing_prompt, empty_route, extract_limit, merge_route, parse_route
+from prefetch import Prefetch
+from conversation_state import ConversationState
+from row_renderer import RowRenderer
+from result_cursor import PagedReply, ResultCursor, is_more_request
+from metrics_cube import percent_change, resolve_window
+from analytics_pool import AnalyticsTimeout
 from data_loader import DataLoader
 import pandas as pd
+import numpy as np
+import asyncio
+import calendar
+import json
 import re
 
+SALES_INTENTS = {
+    'order_details': 'User wants details about a specific order number',
+    'recent_orders': 'User wants to see recent orders',
+    'sales_summary': 'User wants overall sales summary or report',
+    'top_customers': 'User wants to see top spending customers',
+    'revenue_info': 'User wants revenue/income information',
+    'average_order': 'User wants average order value',
+    'payment_status': 'User wants to know about paid/unpaid orders',
+    'popular_items': 'User wants to see top selling items',
+    'payment_methods': 'User wants to see payment method breakdown',
+    'time_period_sales': 'User wants sales for a specific time period',
+    'orders_in_queue': 'User wants to see orders that are pending/in queue',
+    'general_question': 'General question about sales',
+}
+
+SALES_INTENT_EXAMPLES = {
+    'order_details': ['show order 27951', 'details for order number 1200', 'what was in order #500'],
+    'recent_orders': ['show recent orders', 'latest orders', 'newest purchases', 'last few orders'],
+    'sales_summary': ['give me a sales summary', 'sales report', 'how are sales overall', 'sales overview'],
+    'top_customers': ['top customers', 'who spends the most', 'best customers', 'biggest spenders'],
+    'revenue_info': ['total revenue', 'how much money did we make', 'income so far', 'earnings'],
+    'average_order': ['average order value', 'typical order size', 'mean order amount'],
+    'payment_status': ['how many orders are paid', 'unpaid orders', 'completed orders', 'payment status of orders'],
+    'popular_items': ['top selling items', 'most popular products', 'best sellers', 'what sells the most'],
+    'payment_methods': ['payment method breakdown', 'how do customers pay', 'card vs cash'],
+    'time_period_sales': ['sales in march', 'sales last 7 days', 'orders this week', 'sales for last month'],
+    'orders_in_queue': ['orders in queue', 'pending orders', 'orders waiting for payment'],
+    'general_question': ['how is the business doing', 'any tips to improve sales', 'what should we focus on'],
+}
+
+# Ordered to mirror the routing priority in select_handler
+SALES_INTENT_RULES = [
+    (r'\b(queue|pending|outstanding)\b', 'orders_in_queue'),
+    (r'\border\s*(#|no\.?|number)?\s*#?\d+', 'order_details'),
+    (r'\b(top|best|biggest|highest)\s+(\d+\s+)?(customers?|members?|clients?|spenders?|buyers?)\b', 'top_customers'),
+    (r'\b(top|best|most)\s+(\d+\s+)?(popular|selling|sold|items?|products?)\b|\bbest ?sellers?\b|\bpopular (items?|products?)\b', 'popular_items'),
+    (r'\bpayment methods?\b|\bhow (do|did) (people|customers|members) pay\b', 'payment_methods'),
+    (r'\b(unpaid|payment status|paid orders|completed orders)\b', 'payment_status'),
+    (r'\b(average|avg|aov|mean) (order|sale|purchase|transaction)', 'average_order'),
+    (r'\b(recent|latest|newest)\b', 'recent_orders'),
+    (r'\b(january|february|march|april|may|june|july|august|september|october|november|december|today|yesterday|this week|last week|last month|last \d+ (days?|weeks?|months?))\b', 'time_period_sales'),
+    (r'\b(q[1-4]|(this|last|previous) (quarter|year)|ytd|year to date|(week|month|year)[- ]over[- ](week|month|year)|yoy)\b', 'time_period_sales'),
+    (r'\b(revenue|income|earnings?)\b', 'revenue_info'),
+    (r'\b(summary|overview|report|overall)\b', 'sales_summary'),
+]
+
 class SalesBot:
     def __init__(self, data_loader):
         self.data_loader = data_loader
-        self.gemini = GeminiBot()
-        self.conversation_history = []
+        self.gemini = AsyncOpenRouterBot(caller='sales')
+        self.intent_classifier = get_intent_classifier('sales', SALES_INTENTS, SALES_INTENT_EXAMPLES, SALES_INTENT_RULES)
+        self.conversation_history = ConversationState()
+        self.prefetch = None
+        self.renderer = RowRenderer()
+        self.cursor = None
     
     def start(self):
         print("\n" + "=" * 60)
@@ -25,11 +89,13 @@ class SalesBot:
             
             if query.lower() in ['exit', 'quit', 'menu', 'back']:
                 print("Returning to main menu...\n")
-                self.conversation_history = []
+                self.conversation_history.clear()
                 break
             
-            response = self.process_query(query)
-            print(f"\nBot: {response}\n")
+            print("\nBot: ", end="", flush=True)
+            for chunk in self.process_query_stream(query):
+                print(chunk, end="", flush=True)
+            print("\n")
     
     def extract_numbers(self, query):
         numbers = re.findall(r'\b\d+\b', query)
@@ -67,82 +133,256 @@ class SalesBot:
         
         return None
     
-    def understand_intent_with_ai(self, query):
-        context = f"""Analyze this user query about sales/orders and determine the intent. Return ONLY the intent name.
+    def format_intent_list(self):
+        return '\n'.join(f"- {name}: {description}" for name, description in SALES_INTENTS.items())
+    
+    def build_intent_prompt(self, query):
+        return f"""Analyze this user query about sales/orders and determine the intent. Return ONLY the intent name.
 
 Available intents:
-- order_details: User wants details about a specific order number
-- recent_orders: User wants to see recent orders
-- sales_summary: User wants overall sales summary or report
-- top_customers: User wants to see top spending customers
-- revenue_info: User wants revenue/income information
-- average_order: User wants average order value
-- payment_status: User wants to know about paid/unpaid orders
-- popular_items: User wants to see top selling items
-- payment_methods: User wants to see payment method breakdown
-- time_period_sales: User wants sales for a specific time period
-- orders_in_queue: User wants to see orders that are pending/in queue
-- general_question: General question about sales
+{self.format_intent_list()}
 
 User query: "{query}"
 
 Return only one word - the intent name."""
-        
-        intent = self.gemini.get_response(context, "").strip().lower()
-        return intent
     
-    def process_query(self, query):
-        self.conversation_history.append(query)
-        
-        intent = self.understand_intent_with_ai(query)
+    def understand_intent_with_ai(self, query):
+        return run_sync(self.understand_intent_with_ai_async(query))
+    
+    async def understand_intent_with_ai_async(self, query):
+        intent, confidence = self.intent_classifier.classify(query)
+        if confidence >= Config.INTENT_CONFIDENCE_THRESHOLD or self.gemini.is_offline():
+            return intent
+        
+        intent = await self.gemini.get_response(
+            self.build_intent_prompt(query), "",
+            temperature=Config.INTENT_TEMPERATURE,
+            data_version=self.data_loader.data_version,
+            phase='intent',
+            fallback=lambda: intent
+        )
+        return intent.strip().lower()
+    
+    def extract_entities(self, query):
+        """Regex entity extraction for queries routed without the LLM"""
         numbers = self.extract_numbers(query)
-        time_period = self.extract_time_period(query)
+        entities = empty_route()['entities']
+        entities['order_number'] = numbers[0] if numbers else None
+        entities['limit'] = extract_limit(query)
+        entities['time_window'] = self.extract_time_period(query)
+        return entities
+    
+    def build_routing_prompt(self, query):
+        return build_routing_prompt(
+            "gym sales and orders assistant",
+            self.format_intent_list(),
+            query,
+            context=self.build_context_data()
+        )
+    
+    def route_query(self, query):
+        return run_sync(self.route_query_async(query))
+    
+    async def route_query_async(self, query):
+        """Resolve intent, entities and possibly the answer with at most one LLM call"""
+        intent, confidence = self.intent_classifier.classify(query)
+        local_route = empty_route(intent)
+        local_route['entities'] = self.extract_entities(query)
+        
+        if confidence >= Config.INTENT_CONFIDENCE_THRESHOLD or self.gemini.is_offline():
+            return local_route
+        
+        if not Config.STRUCTURED_ROUTING:
+            local_route['intent'] = await self.understand_intent_with_ai_async(query)
+            return local_route
+        
+        prompt = await asyncio.to_thread(self.build_routing_prompt, query)
+        reply = await self.gemini.get_response(
+            prompt, "",
+            temperature=Config.INTENT_TEMPERATURE,
+            data_version=self.data_loader.data_version,
+            phase='intent',
+            fallback=lambda: json.dumps(local_route)
+        )
+        
+        # An unparseable reply still routes, just with the regex entities
+        return merge_route(parse_route(reply, SALES_INTENTS), local_route)
+    
+    def select_handler(self, query, intent, entities=None):
+        """Map an intent to a local handler, or None when the LLM should answer"""
+        if entities is None:
+            entities = self.extract_entities(query)
+        order_number = entities.get('order_number')
+        time_period = entities.get('time_window')
+        
+        # Quarters, years and comparisons are answered from the daily metrics cube; plain
+        # "last N days" and month questions keep their order listings
+        window = self.window_for(query)
+        if window and ('time_period' not in intent or window['compare'] or not time_period) and \
+                any(name in intent for name in ('time_period', 'revenue', 'sales_summary', 'average')):
+            return lambda: self.get_window_report(window)
         
         # Handle "in queue" or pending orders
         if 'queue' in intent or 'queue' in query.lower() or 'pending' in query.lower():
-            return self.get_orders_in_queue()
+            return self.get_orders_in_queue
         
-        if 'order_details' in intent and numbers:
-            return self.get_order_details(numbers[0])
+        if 'order_details' in intent and order_number is not None:
+            return lambda: self.get_order_details(order_number)
         
         if 'recent' in intent and time_period:
-            return self.get_recent_orders_by_days(time_period['value'])
+            return lambda: self.get_recent_orders_by_days(time_period['value'])
         
         if 'recent' in intent:
-            return self.get_recent_orders(10)
+            return lambda: self.get_recent_orders(10)
         
         if 'top_customers' in intent or 'top_member' in intent:
-            limit = numbers[0] if numbers else 10
-            return self.get_top_members(limit)
+            limit = entities.get('limit') or 10
+            return lambda: self.get_top_members(limit)
         
         if 'time_period' in intent and time_period:
             if time_period['type'] == 'month':
-                return self.get_monthly_sales_report(time_period['value'])
+                return lambda: self.get_monthly_sales_report(time_period['value'])
             else:
-                return self.get_recent_orders_by_days(time_period['value'])
+                return lambda: self.get_recent_orders_by_days(time_period['value'])
         
         if 'sales_summary' in intent:
-            return self.get_sales_summary()
+            return self.get_sales_summary
         
         if 'revenue' in intent:
-            return self.get_revenue_summary()
+            return self.get_revenue_summary
         
         if 'average' in intent:
-            return self.get_average_order()
+            return self.get_average_order
         
         if 'payment_status' in intent:
             if 'unpaid' in query.lower() or 'pending' in query.lower():
-                return self.get_unpaid_orders()
+                return self.get_unpaid_orders
             else:
-                return self.get_completed_orders()
+                return self.get_completed_orders
         
         if 'popular' in intent or 'items' in intent:
-            return self.get_top_items()
+            limit = entities.get('limit') or 10
+            by = 'revenue' if re.search(r'revenue|money|earn|income', query.lower()) else 'count'
+            return lambda: self.get_top_items(limit, by, time_period)
         
         if 'payment_methods' in intent:
-            return self.get_payment_methods()
+            return lambda: self.get_payment_methods(time_period)
         
-        return self.intelligent_response(query)
+        return None
+    
+    def start_prefetch(self, query):
+        """Begin the report and order slice this query will probably need while routing is in flight"""
+        prefetch = Prefetch()
+        
+        # A confident local route (or offline mode) makes no network call to hide the work behind
+        intent, confidence = self.intent_classifier.classify(query)
+        if confidence >= Config.INTENT_CONFIDENCE_THRESHOLD or self.gemini.is_offline():
+            return prefetch
+        
+        entities = self.extract_entities(query)
+        window = entities['time_window']
+        if window and window['type'] == 'month':
+            prefetch.submit(('month', window['value']), self.data_loader.get_orders_by_month, window['value'])
+        elif window:
+            prefetch.submit(('days', window['value']), lambda: self.data_loader.get_orders_by_date_range(days=window['value']))
+        
+        handler = self.select_handler(query, intent, entities)
+        if handler is not None:
+            prefetch.submit(self.handler_key(intent, entities), handler)
+        
+        return prefetch
+    
+    def handler_key(self, intent, entities):
+        return ('handler', intent, json.dumps(entities, sort_keys=True))
+    
+    def fetch_data(self, key, fn, *args):
+        """fn(*args), served from this turn's prefetch when it was speculated"""
+        prefetch = self.prefetch
+        if prefetch is not None:
+            return prefetch.get(key, fn, *args)
+        return fn(*args)
+    
+    def process_query(self, query):
+        return run_sync(self.process_query_async(query))
+    
+    def next_page(self, query):
+        """The next page of the last listed results when the query asks for more, else None"""
+        if self.cursor is None or not is_more_request(query):
+            return None
+        return self.cursor.next_page(self.data_loader.data_version)
+    
+    def keep_cursor(self, reply):
+        """Remember the cursor of the reply being sent, if it is a paged list"""
+        self.cursor = getattr(reply, 'cursor', None)
+        return reply
+    
+    async def process_query_async(self, query):
+        reply = await self.answer_async(query)
+        self.conversation_history.record(query, reply)
+        return reply
+    
+    def process_query_stream(self, query):
+        """Like process_query, but yields the reply in chunks as the LLM produces it"""
+        yield from self.conversation_history.record_stream(query, self.answer_stream(query))
+    
+    async def answer_async(self, query):
+        page = self.next_page(query)
+        if page is not None:
+            return page
+        
+        # Only the list this turn sends (if any) can be paged on the next one
+        self.cursor = None
+        self.prefetch = self.start_prefetch(query)
+        try:
+            route = await self.route_query_async(query)
+            
+            handler = self.select_handler(query, route['intent'], route['entities'])
+            if handler is not None:
+                key = self.handler_key(route['intent'], route['entities'])
+                return self.keep_cursor(await asyncio.to_thread(self.fetch_data, key, handler))
+            
+            if route['answer']:
+                return route['answer']
+            
+            return await self.intelligent_response_async(query)
+        finally:
+            self.prefetch.close()
+            self.prefetch = None
+    
+    def answer_stream(self, query):
+        page = self.next_page(query)
+        if page is not None:
+            yield page
+            return
+        
+        # Only the list this turn sends (if any) can be paged on the next one
+        self.cursor = None
+        self.prefetch = self.start_prefetch(query)
+        try:
+            route = self.route_query(query)
+            
+            handler = self.select_handler(query, route['intent'], route['entities'])
+            if handler is not None:
+                yield self.keep_cursor(self.fetch_data(self.handler_key(route['intent'], route['entities']), handler))
+                return
+            
+            if route['answer']:
+                yield route['answer']
+                return
+            
+            if self.gemini.is_offline():
+                yield self.offline_response(query)
+                return
+            
+            yield from self.gemini.stream_response(
+                query, self.build_response_context(query),
+                data_version=self.data_loader.data_version,
+                history=self.conversation_history.context(),
+                fallback=lambda: self.degraded_response(query)
+            )
+        finally:
+            self.prefetch.close()
+            self.prefetch = None
     
     def get_orders_in_queue(self):
         """Get orders that are pending payment"""
@@ -156,24 +396,23 @@ Return only one word - the intent name."""
         if status_col is None:
             return "I can't find the payment status column."
         
-        # Fixed: Use .copy() to avoid SettingWithCopyWarning
-        pending_orders = orders_df[orders_df[status_col].astype(str) != 'Paid'].copy()
+        # Row positions, not a copy: the cursor pages through them on "show more"
+        pending = np.flatnonzero((orders_df[status_col].astype(str) != 'Paid').to_numpy())
         
-        if len(pending_orders) == 0:
+        if len(pending) == 0:
             return "Great news! There are no orders in queue. All orders have been paid."
         
         amount_col = next((c for c in orders_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
         
         if amount_col:
-            pending_orders[amount_col] = pd.to_numeric(pending_orders[amount_col], errors='coerce')
-            total_pending = pending_orders[amount_col].sum()
+            total_pending = pd.to_numeric(orders_df[amount_col].iloc[pending], errors='coerce').sum()
         else:
             total_pending = 0
         
         info = f"""
 ORDERS IN QUEUE (PENDING PAYMENT):
 {'=' * 60}
-Total Orders in Queue: {len(pending_orders):,}
+Total Orders in Queue: {len(pending):,}
 Total Pending Amount: CAD ${total_pending:,.2f}
 {'=' * 60}
 
@@ -184,21 +423,22 @@ RECENT PENDING ORDERS:
         date_col = next((c for c in orders_df.columns if 'date' in c.lower() and 'created' in c.lower()), None)
         email_col = next((c for c in orders_df.columns if 'email' in c.lower()), None)
         
-        for idx, order in pending_orders.head(10).iterrows():
-            order_num = str(order.get(order_num_col, 'N/A')) if order_num_col else 'N/A'
-            date_val = str(order.get(date_col, 'N/A')) if date_col else 'N/A'
-            email = str(order.get(email_col, 'N/A')) if email_col else 'N/A'
-            status = str(order.get(status_col, 'N/A')) if status_col else 'N/A'
-            amount = order.get(amount_col, 0) if amount_col else 0
-            
-            info += f"\nOrder #{order_num} - {date_val}"
-            info += f"\nCustomer: {email}"
-            info += f"\nStatus: {status} | Amount: CAD ${amount:.2f}\n"
-        
-        if len(pending_orders) > 10:
-            info += f"\n... and {len(pending_orders) - 10} more pending orders"
+        cursor = ResultCursor(
+            orders_df, pending,
+            lambda rows: self.render_orders(rows, order_num_col, date_col, email_col, status_col, amount_col),
+            'pending orders', page_size=10, data_version=self.data_loader.data_version
+        )
+        info += cursor.first_page()
         
-        return info
+        return PagedReply(info, cursor)
+    
+    def render_orders(self, orders, order_num_col, date_col, email_col, status_col, amount_col):
+        return self.renderer.render(
+            orders,
+            "\nOrder #{order} - {date}\nCustomer: {email}\nStatus: {status} | Amount: CAD ${amount:.2f}\n",
+            {'order': order_num_col, 'date': date_col, 'email': email_col, 'status': status_col},
+            amounts={'amount': amount_col}
+        )
     
     def get_order_details(self, order_num):
         orders_df = self.data_loader.get_dataframe('orders')
@@ -212,8 +452,7 @@ RECENT PENDING ORDERS:
             return "I can't find the order number column in the database."
         
         # Fixed: Use proper boolean indexing with conversion to numeric
-        orders_df[order_num_col] = pd.to_numeric(orders_df[order_num_col], errors='coerce')
-        order = orders_df[orders_df[order_num_col] == order_num]
+        order = orders_df[pd.to_numeric(orders_df[order_num_col], errors='coerce') == order_num]
         
         if len(order) == 0:
             return f"I couldn't find any order with number {order_num}. Would you like to check a different order?"
@@ -231,13 +470,16 @@ RECENT PENDING ORDERS:
             val = order.get(col)
             return str(val) if pd.notna(val) else default
         
+        amount = pd.to_numeric(order.get(amount_col), errors='coerce') if amount_col else 0
+        amount = amount if pd.notna(amount) else 0
+        
         info = f"""
 ORDER #{order_num} DETAILS:
 {'=' * 60}
 Date: {safe_get(date_col)}
 Customer: {safe_get(email_col)}
 Status: {safe_get(status_col)}
-Amount: CAD ${order.get(amount_col, 0):.2f if amount_col and pd.notna(order.get(amount_col)) else 0}
+Amount: CAD ${amount:.2f}
 {'=' * 60}
 
 ITEMS ORDERED:
@@ -248,19 +490,20 @@ ITEMS ORDERED:
             item_order_col = next((c for c in items_df.columns if 'order' in c.lower() and 'number' in c.lower()), None)
             
             if item_order_col:
-                items_df[item_order_col] = pd.to_numeric(items_df[item_order_col], errors='coerce')
-                items = items_df[items_df[item_order_col] == order_num]
+                items = items_df[pd.to_numeric(items_df[item_order_col], errors='coerce') == order_num]
                 
                 if len(items) > 0:
                     item_col = next((c for c in items.columns if 'item' in c.lower() and 'order' not in c.lower()), None)
                     qty_col = next((c for c in items.columns if 'qty' in c.lower() or 'quantity' in c.lower()), None)
                     item_amount_col = next((c for c in items.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
                     
-                    for idx, item in items.iterrows():
-                        item_name = str(item.get(item_col, 'Unknown Item')) if item_col else 'Unknown Item'
-                        qty = item.get(qty_col, 1) if qty_col else 1
-                        item_amount = item.get(item_amount_col, 0) if item_amount_col else 0
-                        info += f"{item_name} (Qty: {qty}) - CAD ${item_amount:.2f}\n"
+                    info += self.renderer.render(
+                        items,
+                        "{item} (Qty: {qty}) - CAD ${amount:.2f}\n",
+                        {'item': item_col, 'qty': qty_col},
+                        amounts={'amount': item_amount_col},
+                        defaults={'item': 'Unknown Item', 'qty': '1'}
+                    )
                 else:
                     info += "No item details available\n"
             else:
@@ -284,29 +527,13 @@ ITEMS ORDERED:
         status_col = next((c for c in orders_df.columns if 'status' in c.lower() and 'payment' in c.lower()), None)
         amount_col = next((c for c in orders_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
         
-        def safe_get(row, col, default='N/A'):
-            if col is None:
-                return default
-            val = row.get(col)
-            return str(val) if pd.notna(val) else default
-        
         info = f"HERE ARE THE {limit} MOST RECENT ORDERS:\n{'=' * 60}\n\n"
-        
-        for idx, order in recent.iterrows():
-            order_num = safe_get(order, order_num_col)
-            date_val = safe_get(order, date_col)
-            email = safe_get(order, email_col)
-            status = safe_get(order, status_col)
-            amount = order.get(amount_col, 0) if amount_col and pd.notna(order.get(amount_col)) else 0
-            
-            info += f"Order #{order_num} - {date_val}\n"
-            info += f"Customer: {email}\n"
-            info += f"Status: {status} | Amount: CAD ${amount:.2f}\n\n"
+        info += self.render_orders(recent, order_num_col, date_col, email_col, status_col, amount_col).lstrip('\n')
         
         return info
     
     def get_recent_orders_by_days(self, days):
-        orders = self.data_loader.get_orders_by_date_range(days=days)
+        orders = self.fetch_data(('days', days), lambda: self.data_loader.get_orders_by_date_range(days=days))
         
         if orders is None or len(orders) == 0:
             return f"I couldn't find any orders from the last {days} days."
@@ -314,20 +541,21 @@ ITEMS ORDERED:
         amount_col = next((c for c in orders.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
         status_col = next((c for c in orders.columns if 'status' in c.lower() and 'payment' in c.lower()), None)
         
-        if amount_col:
-            orders[amount_col] = pd.to_numeric(orders[amount_col], errors='coerce')
-            total_amount = orders[amount_col].sum()
-            avg_amount = total_amount / len(orders) if len(orders) > 0 else 0
+        cube = self.data_loader.metrics_cube
+        if cube is not None:
+            latest = cube.latest('orders')
+            totals = cube.totals(latest - pd.Timedelta(days=days), latest)
+            total_orders, paid_count, total_amount = int(totals['orders']), int(totals['paid']), totals['revenue']
         else:
-            total_amount = 0
-            avg_amount = 0
-        
-        paid_count = len(orders[orders[status_col] == 'Paid']) if status_col else 0
+            total_orders = len(orders)
+            paid_count = len(orders[orders[status_col] == 'Paid']) if status_col else 0
+            total_amount = pd.to_numeric(orders[amount_col], errors='coerce').sum() if amount_col else 0
+        avg_amount = total_amount / total_orders if total_orders > 0 else 0
         
         info = f"""
 SALES FROM LAST {days} DAYS:
 {'=' * 60}
-Total Orders: {len(orders)}
+Total Orders: {total_orders}
 Paid Orders: {paid_count}
 Total Revenue: CAD ${total_amount:,.2f}
 Average Order: CAD ${avg_amount:.2f}
@@ -340,30 +568,71 @@ RECENT ORDERS:
         date_col = next((c for c in orders.columns if 'date' in c.lower() and 'created' in c.lower()), None)
         email_col = next((c for c in orders.columns if 'email' in c.lower()), None)
         
-        def safe_get(row, col, default='N/A'):
-            if col is None:
-                return default
-            val = row.get(col)
-            return str(val) if pd.notna(val) else default
+        cursor = ResultCursor.over(
+            orders,
+            lambda rows: self.render_orders(rows, order_num_col, date_col, email_col, status_col, amount_col),
+            'orders', page_size=10, data_version=self.data_loader.data_version
+        )
+        info += cursor.first_page()
         
-        for idx, order in orders.head(10).iterrows():
-            order_num = safe_get(order, order_num_col)
-            date_val = safe_get(order, date_col)
-            email = safe_get(order, email_col)
-            status = safe_get(order, status_col)
-            amount = order.get(amount_col, 0) if amount_col and pd.notna(order.get(amount_col)) else 0
-            
-            info += f"\nOrder #{order_num} - {date_val}"
-            info += f"\nCustomer: {email}"
-            info += f"\nStatus: {status} | Amount: CAD ${amount:.2f}\n"
+        return PagedReply(info, cursor)
+    
+    def window_for(self, query):
+        """Date window named in the query, relative to the last order day, or None"""
+        cube = self.data_loader.metrics_cube
+        return resolve_window(query, cube.latest('orders')) if cube is not None else None
+    
+    def get_window_report(self, window):
+        cube = self.data_loader.metrics_cube
+        if cube is None:
+            return "I don't have dated sales data to answer that."
+        
+        current, previous = cube.compare(window)
         
-        if len(orders) > 10:
-            info += f"\n... and {len(orders) - 10} more orders"
+        def line(label, key, money=False):
+            value = f"CAD ${current[key]:,.2f}" if money else f"{current[key]:,.0f}"
+            if previous is None:
+                return f"{label}: {value}\n"
+            before = f"CAD ${previous[key]:,.2f}" if money else f"{previous[key]:,.0f}"
+            return f"{label}: {value} vs {before} ({percent_change(current[key], previous[key])})\n"
         
+        title = f"SALES FOR {window['label'].upper()}"
+        if previous is not None:
+            title += f" VS {window['compare']['label'].upper()}"
+        
+        info = f"""
+{title}:
+{'=' * 60}
+Period: {window['start']:%Y-%m-%d} to {window['end']:%Y-%m-%d}"""
+        if previous is not None:
+            info += f"\nCompared with: {window['compare']['start']:%Y-%m-%d} to {window['compare']['end']:%Y-%m-%d}"
+        info += f"\n{'=' * 60}\n"
+        
+        if not current['orders'] and not current['payments'] and (previous is None or not previous['orders']):
+            return info + "No orders or payments were recorded in that period."
+        
+        current['average'] = current['revenue'] / current['orders'] if current['orders'] else 0
+        if previous is not None:
+            previous['average'] = previous['revenue'] / previous['orders'] if previous['orders'] else 0
+        
+        info += line("Total Orders", 'orders')
+        info += line("Paid Orders", 'paid')
+        info += line("Refunded Orders", 'refunded')
+        info += line("Order Revenue", 'revenue', money=True)
+        info += line("Average Order", 'average', money=True)
+        info += line("Payments", 'payments')
+        info += line("Payments Collected", 'payment_amount', money=True)
+        
+        if current['payment_methods']:
+            info += "\nPAYMENTS BY METHOD:\n"
+            for method, (count, amount) in current['payment_methods'].items():
+                info += f"{method}: {count:,} (CAD ${amount:,.2f})\n"
+        
+        info += "=" * 60
         return info
     
     def get_monthly_sales_report(self, month):
-        orders = self.data_loader.get_orders_by_month(month)
+        orders = self.fetch_data(('month', month), self.data_loader.get_orders_by_month, month)
         
         if orders is None or len(orders) == 0:
             month_names = ['', 'January', 'February', 'March', 'April', 'May', 'June',
@@ -374,8 +643,7 @@ RECENT ORDERS:
         status_col = next((c for c in orders.columns if 'status' in c.lower() and 'payment' in c.lower()), None)
         
         if amount_col:
-            orders[amount_col] = pd.to_numeric(orders[amount_col], errors='coerce')
-            total_revenue = orders[amount_col].sum()
+            total_revenue = pd.to_numeric(orders[amount_col], errors='coerce').sum()
             avg_order = total_revenue / len(orders) if len(orders) > 0 else 0
         else:
             total_revenue = 0
@@ -402,16 +670,22 @@ Average Order: CAD ${avg_order:.2f}
         return info
     
     def get_top_members(self, limit=10):
-        top_members = self.data_loader.get_top_members_by_spending(limit)
+        try:
+            top_members = self.data_loader.get_top_members_by_spending(limit)
+        except AnalyticsTimeout as e:
+            return str(e)
         
         if top_members is None:
             return "I couldn't retrieve the top customers data right now."
         
         info = f"TOP {limit} CUSTOMERS BY SPENDING:\n{'=' * 60}\n\n"
         
-        for idx, row in top_members.iterrows():
-            info += f"{idx + 1}. {row['email']}\n"
-            info += f"   Orders: {int(row['order_count'])} | Total: CAD ${row['total_spent']:,.2f}\n\n"
+        info += self.renderer.render(
+            top_members,
+            "{rank}. {email}\n   Orders: {orders:.0f} | Total: CAD ${total:,.2f}\n\n",
+            {'email': 'email'},
+            amounts={'orders': 'order_count', 'total': 'total_spent'}
+        )
         
         return info
     
@@ -430,8 +704,7 @@ Average Order: CAD ${avg_order:.2f}
         refunded = len(orders_df[orders_df[status_col] == 'Refunded']) if status_col else 0
         
         if amount_col:
-            orders_df[amount_col] = pd.to_numeric(orders_df[amount_col], errors='coerce')
-            total_revenue = orders_df[amount_col].sum()
+            total_revenue = pd.to_numeric(orders_df[amount_col], errors='coerce').sum()
             avg_order = total_revenue / total_orders if total_orders > 0 else 0
         else:
             total_revenue = 0
@@ -465,8 +738,7 @@ Total Revenue: CAD ${stats.get('total_revenue', 0):,.2f}
         if orders_df is not None:
             amount_col = next((c for c in orders_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
             if amount_col:
-                orders_df[amount_col] = pd.to_numeric(orders_df[amount_col], errors='coerce')
-                avg_order = orders_df[amount_col].mean()
+                avg_order = pd.to_numeric(orders_df[amount_col], errors='coerce').mean()
                 info += f"Average Order Value: CAD ${avg_order:.2f}\n"
         
         info += f"""
@@ -488,8 +760,7 @@ Paid Orders: {stats.get('paid_orders', 0):,}
         if amount_col is None:
             return "I can't find the amount column in the database."
         
-        orders_df[amount_col] = pd.to_numeric(orders_df[amount_col], errors='coerce')
-        avg_order = orders_df[amount_col].mean()
+        avg_order = pd.to_numeric(orders_df[amount_col], errors='coerce').mean()
         
         return f"The average order value is CAD ${avg_order:.2f}"
     
@@ -528,66 +799,101 @@ Paid Orders: {stats.get('paid_orders', 0):,}
         
         return f"You have {unpaid:,} unpaid orders out of {total:,} total orders ({percentage:.1f}%)"
     
-    def get_top_items(self, limit=10):
-        items_df = self.data_loader.get_dataframe('items_purchased')
-        
-        if items_df is None:
+    def get_top_items(self, limit=10, by='count', time_period=None):
+        if self.data_loader.get_dataframe('items_purchased') is None:
             return "I don't have access to items data right now."
         
-        item_col = next((c for c in items_df.columns if 'item' in c.lower() and 'order' not in c.lower()), None)
-        amount_col = next((c for c in items_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
+        days = time_period['value'] if time_period and time_period['type'] == 'days' else None
+        month = time_period['value'] if time_period and time_period['type'] == 'month' else None
         
-        if item_col is None:
+        top_items = self.data_loader.get_item_leaderboard(limit, by=by, days=days, month=month)
+        if top_items is None:
             return "I can't find the item column in the database."
         
-        top_items = items_df[item_col].value_counts().head(limit)
+        if len(top_items) == 0:
+            return "No items were sold in that period."
         
-        info = f"TOP {limit} SELLING ITEMS:\n{'=' * 60}\n\n"
+        title = f"TOP {limit} SELLING ITEMS"
+        if by == 'revenue':
+            title += " BY REVENUE"
+        if days is not None:
+            title += f" (LAST {days} DAYS)"
+        elif month is not None:
+            title += f" ({calendar.month_name[month].upper()})"
         
-        for idx, (item, count) in enumerate(top_items.items(), 1):
-            if amount_col:
-                items_df[amount_col] = pd.to_numeric(items_df[amount_col], errors='coerce')
-                item_sales = items_df[items_df[item_col] == item]
-                total_sales = item_sales[amount_col].sum()
-                info += f"{idx}. {item}\n"
-                info += f"   Sales: {count} | Revenue: CAD ${total_sales:,.2f}\n\n"
-            else:
-                info += f"{idx}. {item}\n"
-                info += f"   Sales: {count}\n\n"
+        info = f"{title}:\n{'=' * 60}\n\n"
+        
+        info += self.renderer.render(
+            top_items.rename_axis('item').reset_index(),
+            "{rank}. {item}\n   Sales: {sales:.0f} | Units: {units:,.0f} | Revenue: CAD ${revenue:,.2f}\n\n",
+            {'item': 'item'},
+            amounts={'sales': 'count', 'units': 'quantity', 'revenue': 'revenue'}
+        )
         
         return info
     
-    def get_payment_methods(self):
-        payments_df = self.data_loader.get_dataframe('payments')
-        
-        if payments_df is None:
+    def get_payment_methods(self, time_period=None):
+        if self.data_loader.get_dataframe('payments') is None:
             return "I don't have access to payment data right now."
         
-        method_col = next((c for c in payments_df.columns if 'method' in c.lower()), None)
-        amount_col = next((c for c in payments_df.columns if 'amount' in c.lower() and 'processing' not in c.lower()), None)
+        days = time_period['value'] if time_period and time_period['type'] == 'days' else None
+        month = time_period['value'] if time_period and time_period['type'] == 'month' else None
         
-        if method_col is None:
+        methods = self.data_loader.get_payment_mix(days=days, month=month)
+        if methods is None:
             return "I can't find the payment method column."
         
-        methods = payments_df[method_col].value_counts()
+        if len(methods) == 0:
+            return "No payments were recorded in that period."
         
         info = "PAYMENT METHOD BREAKDOWN:\n" + "=" * 60 + "\n\n"
         
-        for method, count in methods.items():
-            percentage = (count / len(payments_df)) * 100
-            if amount_col:
-                payments_df[amount_col] = pd.to_numeric(payments_df[amount_col], errors='coerce')
-                method_payments = payments_df[payments_df[method_col] == method]
-                total_amount = method_payments[amount_col].sum()
-                info += f"{method}\n"
-                info += f"Transactions: {count} ({percentage:.1f}%)\n"
-                info += f"Total: CAD ${total_amount:,.2f}\n\n"
-            else:
-                info += f"{method}: {count} transactions ({percentage:.1f}%)\n\n"
+        info += self.renderer.render(
+            methods.rename_axis('method').reset_index(),
+            "{method}\nTransactions: {transactions:.0f} ({share:.1f}%)\nTotal: CAD ${total:,.2f}\n\n",
+            {'method': 'method'},
+            amounts={'transactions': 'transactions', 'share': 'share', 'total': 'gross'}
+        )
         
         return info
     
     def intelligent_response(self, query):
+        return run_sync(self.intelligent_response_async(query))
+    
+    async def intelligent_response_async(self, query):
+        if self.gemini.is_offline():
+            return await asyncio.to_thread(self.offline_response, query)
+        
+        context = await asyncio.to_thread(self.build_response_context, query)
+        return await self.gemini.get_response(
+            query, context,
+            data_version=self.data_loader.data_version,
+            history=self.conversation_history.context(),
+            fallback=lambda: self.degraded_response(query)
+        )
+    
+    def degraded_response(self, query):
+        """Local answer used when the LLM is unreachable"""
+        return "The AI assistant is temporarily unavailable, so here is the latest data summary instead:\n" + self.offline_response(query)
+    
+    def offline_response(self, query):
+        """Templated answer for questions no local handler covers"""
+        return self.get_sales_summary()
+    
+    def build_response_context(self, query):
+        context_data = self.build_context_data()
+        
+        context = f"""You are a helpful sales and orders assistant for a gym. Answer the user's question based on the data provided.
+
+{context_data}
+
+User question: "{query}"
+
+Provide a clear, conversational answer. If you need more specific information to answer better, ask the user politely."""
+        
+        return context
+    
+    def build_context_data(self):
         stats = self.data_loader.get_summary_stats()
         orders_df = self.data_loader.get_dataframe('orders')
         
@@ -600,16 +906,7 @@ Paid Orders: {stats.get('paid_orders', 0):,}
         if orders_df is not None:
             amount_col = next((c for c in orders_df.columns if 'amount' in c.lower() and 'paid' in c.lower()), None)
             if amount_col:
-                orders_df[amount_col] = pd.to_numeric(orders_df[amount_col], errors='coerce')
-                avg_order = orders_df[amount_col].mean()
+                avg_order = pd.to_numeric(orders_df[amount_col], errors='coerce').mean()
                 context_data += f"- Average Order Value: CAD ${avg_order:.2f}\n"
         
-        context = f"""You are a helpful sales and orders assistant for a gym. Answer the user's question based on the data provided.
-
-{context_data}
-
-User question: "{query}"
-
-Provide a clear, conversational answer. If you need more specific information to answer better, ask the user politely."""
-        
-        return self.gemini.get_response(query, context)
\ No newline at end of file
+        return context_data
\ No newline at end of file
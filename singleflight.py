@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+class Flight:
+    """One in-flight upstream call and everyone waiting on it"""
+    
+    def __init__(self):
+        self.future = Future()
+        self.waiters = 0
+        self.task = None
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key (the leader) does the work; callers that arrive
+    while it is running wait on the same concurrent Future and get its result or
+    its exception. Threads block on the Future, coroutines await it, so sync and
+    async callers can share a flight. An async flight is cancelled only when
+    every waiter has gone away.
+    """
+    
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.stats = {'leaders': 0, 'shared': 0, 'abandoned': 0}
+    
+    def join(self, key):
+        """Return (flight, is_leader); the leader must resolve or reject the flight"""
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self.flights[key] = flight
+                self.stats['leaders'] += 1
+            else:
+                self.stats['shared'] += 1
+            flight.waiters += 1
+        return flight, leader
+    
+    def _land(self, key, flight):
+        # Later callers start a fresh flight instead of reusing a finished one
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+    
+    def resolve(self, key, flight, result):
+        self._land(key, flight)
+        if not flight.future.done():
+            flight.future.set_result(result)
+    
+    def reject(self, key, flight, error):
+        self._land(key, flight)
+        if not flight.future.done():
+            flight.future.set_exception(error)
+    
+    def leave(self, key, flight):
+        """An async waiter was cancelled; cancel the work once nobody is left"""
+        with self.lock:
+            flight.waiters -= 1
+            abandon = flight.waiters <= 0 and flight.task is not None and not flight.future.done()
+            if abandon:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+                self.stats['abandoned'] += 1
+        
+        if abandon:
+            flight.task.get_loop().call_soon_threadsafe(flight.task.cancel)
+    
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers with this key (blocking)"""
+        flight, leader = self.join(key)
+        if leader:
+            try:
+                result = fn()
+            except BaseException as e:
+                self.reject(key, flight, e)
+                raise
+            self.resolve(key, flight, result)
+            return result
+        
+        return flight.future.result()
+    
+    async def do_async(self, key, coro_fn):
+        """Await coro_fn() once for all concurrent callers with this key"""
+        flight, leader = self.join(key)
+        if leader:
+            flight.task = asyncio.ensure_future(self._lead(key, flight, coro_fn()))
+        
+        try:
+            # shield: one waiter being cancelled must not cancel the shared Future
+            return await asyncio.shield(asyncio.wrap_future(flight.future))
+        except asyncio.CancelledError:
+            self.leave(key, flight)
+            raise
+    
+    async def _lead(self, key, flight, coro):
+        try:
+            result = await coro
+        except asyncio.CancelledError:
+            self._land(key, flight)
+            flight.future.cancel()
+            raise
+        except BaseException as e:
+            self.reject(key, flight, e)
+            return
+        self.resolve(key, flight, result)
+    
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self.flights)
+        
+        calls = stats['leaders'] + stats['shared']
+        stats['share_rate'] = stats['shared'] / calls if calls else 0.0
+        return stats
+
+_shared_flights = None
+_shared_lock = threading.Lock()
+
+def get_singleflight():
+    """Return the process-wide registry so every session coalesces with every other"""
+    global _shared_flights
+    with _shared_lock:
+        if _shared_flights is None:
+            _shared_flights = SingleFlight()
+        return _shared_flights
\ No newline at end of file
@@ -3,6 +3,7 @@ import sys
 import os
 from pathlib import Path
 import shutil
+from collections import deque
 
 # Add current directory to path for imports
 current_dir = Path(__file__).parent
@@ -14,6 +15,8 @@ try:
     from member_bot import MemberBot
     from sales_bot import SalesBot
     from insights_bot import InsightsBot
+    from row_renderer import RowRenderer
+    from llm_metrics import get_llm_metrics
     from logger import logger
 except ModuleNotFoundError as e:
     st.error(f"Import Error: {e}")
@@ -110,6 +113,12 @@ def initialize_session_state():
         st.session_state.data_folder_path = Config.DATA_FOLDER
     if 'user_input_key' not in st.session_state:
         st.session_state.user_input_key = 0
+    if 'offline_mode' not in st.session_state:
+        st.session_state.offline_mode = False
+
+def new_chat_history():
+    """Message list for one bot that drops its oldest messages past the render budget"""
+    return deque(maxlen=Config.CHAT_HISTORY_MESSAGES)
 
 def get_data_files():
     """Get list of data files in data folder"""
@@ -173,12 +182,16 @@ def initialize_system():
         st.session_state.sales_bot = SalesBot(st.session_state.data_loader)
         st.session_state.insights_bot = InsightsBot(st.session_state.data_loader)
         
+        # Result rows render as markdown tables in the chat window
+        for bot in (st.session_state.member_bot, st.session_state.sales_bot, st.session_state.insights_bot):
+            bot.renderer = RowRenderer('markdown')
+        
         st.session_state.initialized = True
         
         st.session_state.chat_history = {
-            'member': [],
-            'sales': [],
-            'insights': []
+            'member': new_chat_history(),
+            'sales': new_chat_history(),
+            'insights': new_chat_history()
         }
         
         logger.info("System initialized successfully")
@@ -222,18 +235,59 @@ def display_stats():
         st.markdown(f"## CAD ${stats.get('total_revenue', 0):,.2f}")
         st.markdown('</div>', unsafe_allow_html=True)
 
+def display_llm_metrics():
+    """Display rolling LLM latency, token and outcome stats"""
+    metrics = get_llm_metrics()
+    rows = metrics.get_summary()
+    
+    st.markdown("### LLM Performance")
+    
+    if not rows[0]['calls']:
+        st.info("No LLM calls recorded yet.")
+        return
+    
+    overall = rows[0]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Calls", f"{overall['calls']:,}")
+    col2.metric("p50 Latency", f"{overall['wall_p50'] or 0:.2f}s")
+    col3.metric("p95 Latency", f"{overall['wall_p95'] or 0:.2f}s")
+    col4.metric("Cache Hits", f"{overall['cache_hits']:,}")
+    
+    st.dataframe(rows, use_container_width=True)
+    
+    st.download_button(
+        "Export LLM Metrics (JSONL)",
+        data=metrics.export_text(),
+        file_name="llm_metrics.jsonl",
+        mime="application/json"
+    )
+
+def render_stream(chunks):
+    """Render streamed reply chunks into a placeholder as they arrive"""
+    placeholder = st.empty()
+    response = ""
+    
+    for chunk in chunks:
+        response += chunk
+        placeholder.markdown(response.replace('\n', '  \n') + "▌")
+    
+    placeholder.markdown(response.replace('\n', '  \n'))
+    return response
+
 def display_chat_interface(bot_name, bot_instance, bot_key):
     """Display chat interface for selected bot"""
     st.markdown(f'<div class="sub-header">{bot_name}</div>', unsafe_allow_html=True)
     
     if bot_key not in st.session_state.chat_history:
-        st.session_state.chat_history[bot_key] = []
+        st.session_state.chat_history[bot_key] = new_chat_history()
     
     chat_history = st.session_state.chat_history[bot_key]
     
     chat_container = st.container()
     
     with chat_container:
+        if len(chat_history) == chat_history.maxlen:
+            st.caption(f"Showing the last {chat_history.maxlen} messages. The assistant keeps a summary of earlier ones.")
         for message in chat_history:
             if message['role'] == 'user':
                 with st.chat_message("user"):
@@ -256,6 +310,12 @@ def display_chat_interface(bot_name, bot_instance, bot_key):
     with col2:
         send_button = st.button("Send", key=f"send_{bot_key}", use_container_width=True)
     
+    # Pages through the last listed results without re-running the query
+    cursor = getattr(bot_instance, 'cursor', None)
+    if cursor is not None and cursor.remaining:
+        if st.button(f"Show more ({cursor.remaining:,} left)", key=f"more_{bot_key}", use_container_width=True):
+            user_input, send_button = "show more", True
+    
     if send_button and user_input:
         st.session_state.chat_history[bot_key].append({
             'role': 'user',
@@ -263,7 +323,11 @@ def display_chat_interface(bot_name, bot_instance, bot_key):
         })
         
         try:
-            response = bot_instance.process_query(user_input)
+            with chat_container:
+                with st.chat_message("user"):
+                    st.write(user_input)
+                with st.chat_message("assistant"):
+                    response = render_stream(bot_instance.process_query_stream(user_input))
             
             st.session_state.chat_history[bot_key].append({
                 'role': 'bot',
@@ -279,8 +343,11 @@ def display_chat_interface(bot_name, bot_instance, bot_key):
         st.rerun()
     
     if st.button("Clear Chat", key=f"clear_{bot_key}", use_container_width=True):
-        st.session_state.chat_history[bot_key] = []
+        st.session_state.chat_history[bot_key] = new_chat_history()
         st.session_state.user_input_key += 1
+        bot_instance.conversation_history.clear()
+        if hasattr(bot_instance, 'cursor'):
+            bot_instance.cursor = None
         st.rerun()
 
 def data_management_page():
@@ -399,6 +466,24 @@ def main():
         else:
             st.warning("System Not Initialized")
         
+        # Offline mode answers from local data only, with no AI calls. The toggle
+        # applies to this browser session's bots; a server that is offline for
+        # everyone (no API key, or GYM_BOT_OFFLINE) cannot be switched online here
+        offline = st.checkbox(
+            "Offline mode",
+            value=Config.OFFLINE_MODE or st.session_state.offline_mode,
+            disabled=Config.OFFLINE_MODE,
+            help="Answer from local data only, without AI calls"
+        )
+        if not Config.OFFLINE_MODE and offline != st.session_state.offline_mode:
+            st.session_state.offline_mode = offline
+            logger.info(f"Offline mode {'enabled' if offline else 'disabled'} from sidebar")
+        for bot in (st.session_state.member_bot, st.session_state.sales_bot, st.session_state.insights_bot):
+            if bot is not None:
+                bot.gemini.offline = st.session_state.offline_mode
+        if Config.OFFLINE_MODE:
+            st.caption(f"Offline: {Config.OFFLINE_REASON}")
+        
         # Dataset info
         if st.session_state.data_loader and st.session_state.initialized:
             dataset_info = st.session_state.data_loader.get_dataset_info()
@@ -492,6 +577,8 @@ def main():
                 st.text(f"Total Revenue: CAD ${stats.get('total_revenue', 0):,.2f}")
             else:
                 st.text("System not initialized")
+        
+        display_llm_metrics()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,107 @@
+import json
+import re
+
+ROUTE_SCHEMA = """{
+  "intent": "<one intent name from the list>",
+  "entities": {
+    "member_identifier": "<member name, email or ID mentioned, else null>",
+    "order_number": <order number as an integer, else null>,
+    "time_window": {"type": "days" or "month", "value": <integer>} or null,
+    "limit": <how many results they asked for, else null>
+  },
+  "answer": "<your full answer if no listed intent fits and the data below answers it, else null>"
+}"""
+
+def build_routing_prompt(role, intent_list, query, context="", state=""):
+    """One prompt that asks for intent, entities and (when needed) the answer as JSON"""
+    state_text = f"\n{state}\n" if state else ""
+    context_text = f"\nData available for answering:\n{context}\n" if context else ""
+    
+    return f"""You are the request router for a {role}. Classify the user query, extract its entities, and answer it directly only when none of the specific intents apply.
+{state_text}
+Available intents:
+{intent_list}
+{context_text}
+User query: "{query}"
+
+Respond with ONLY a JSON object in exactly this shape, with no code fences or extra text:
+{ROUTE_SCHEMA}"""
+
+def empty_route(intent='general_question'):
+    return {
+        'intent': intent,
+        'entities': {'member_identifier': None, 'order_number': None, 'time_window': None, 'limit': None},
+        'answer': None,
+    }
+
+# "top 5", "5 best sellers", "10 items": a bare number may be a window or an order number instead
+LIMIT_PATTERN = re.compile(
+    r'\btop\s+(\d+)\b|\b(\d+)\s+(?:top|best|most|biggest|highest|popular|items?|products?|customers?|members?|spenders?|sellers?)\b',
+    re.IGNORECASE
+)
+
+def extract_limit(query):
+    """N from a "top N" or "N items" phrase, else None"""
+    match = LIMIT_PATTERN.search(query or '')
+    return int(match.group(1) or match.group(2)) if match else None
+
+def _as_int(value):
+    try:
+        return int(str(value).strip().lstrip('#'))
+    except (TypeError, ValueError):
+        return None
+
+def parse_route(text, intents, default_intent='general_question'):
+    """Parse the router's JSON reply; returns None when it is not usable"""
+    if not text:
+        return None
+    
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        return None
+    
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    
+    if not isinstance(data, dict):
+        return None
+    
+    route = empty_route(default_intent)
+    
+    intent = str(data.get('intent') or '').strip().lower()
+    route['intent'] = intent if intent in intents else default_intent
+    
+    entities = data.get('entities') or {}
+    if isinstance(entities, dict):
+        identifier = entities.get('member_identifier')
+        if identifier and str(identifier).strip().lower() not in ('null', 'none', ''):
+            route['entities']['member_identifier'] = str(identifier).strip()
+        
+        route['entities']['order_number'] = _as_int(entities.get('order_number'))
+        
+        limit = _as_int(entities.get('limit'))
+        route['entities']['limit'] = limit if limit and limit > 0 else None
+        
+        window = entities.get('time_window')
+        if isinstance(window, dict) and window.get('type') in ('days', 'month'):
+            value = _as_int(window.get('value'))
+            if value and (window['type'] == 'days' or 1 <= value <= 12):
+                route['entities']['time_window'] = {'type': window['type'], 'value': value}
+    
+    answer = data.get('answer')
+    if isinstance(answer, str) and answer.strip() and answer.strip().lower() != 'null':
+        route['answer'] = answer.strip()
+    
+    return route
+
+def merge_route(route, local_route):
+    """The LLM's route with any entity it left null taken from the locally extracted one"""
+    if route is None:
+        return local_route
+    
+    for name, value in local_route['entities'].items():
+        if route['entities'].get(name) is None:
+            route['entities'][name] = value
+    return route
\ No newline at end of file